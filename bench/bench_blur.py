@@ -0,0 +1,62 @@
+"""
+Time to blur a thumbnail at full size, at quarter size, and from the cache.
+
+The fast path decodes and blurs the JPEG at 1/4 size; both are then fitted to
+the 1440x900 output. Each thumbnail is distinct, and is blurred again right
+after its fast blur to time a cache hit.
+
+    python bench/bench_blur.py --thumbnails 20
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from visual import blur_image  # noqa: E402
+
+
+def thumbnails(count, width=1280, height=720):
+    """JPEG bytes of distinct thumbnails with smooth colours."""
+    rng = np.random.default_rng(1)
+    return [
+        cv2.imencode(
+            ".jpg",
+            cv2.resize(
+                rng.integers(0, 256, (45, 80, 3), np.uint8),
+                (width, height),
+                interpolation=cv2.INTER_CUBIC,
+            ),
+        )[1].tobytes()
+        for _ in range(count)
+    ]
+
+
+def timed(thumb, fast):
+    start = time.perf_counter()
+    blur_image(thumb, fast=fast)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--thumbnails", type=int, default=20)
+    args = parser.parse_args()
+
+    results = {"full": [], "fast": [], "cached": []}
+    for thumb in thumbnails(args.thumbnails):
+        results["full"].append(timed(thumb, fast=False))
+        results["fast"].append(timed(thumb, fast=True))
+        results["cached"].append(timed(thumb, fast=True))
+    for name, times in results.items():
+        print(f"{name:>7}: {statistics.median(times) * 1e3:8.3f} ms median")
+
+
+if __name__ == "__main__":
+    main()
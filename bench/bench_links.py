@@ -0,0 +1,120 @@
+"""
+Per-tick latency of collecting watch links in headless Chrome.
+
+Serves a static recommendation-grid fixture from a local HTTP server and
+compares reading each anchor's href with its own WebDriver call against the
+single `execute_script` round-trip of `find_video_links`. Needs Chrome and a
+matching chromedriver.
+
+    python bench/bench_links.py --videos 300 --ticks 20
+"""
+
+import argparse
+import functools
+import http.server
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+from selenium import webdriver
+from selenium.common.exceptions import StaleElementReferenceException
+from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.common.by import By
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from browser import clean_url, find_video_links  # noqa: E402
+
+SELECTOR = "a[href^='/watch?v=']"
+
+
+def fixture_page(videos, seed=0):
+    """A grid of videos linked by thumbnail and title, with other links mixed in."""
+    rng = random.Random(seed)
+    alphabet = "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789-_"
+    cells = []
+    for _ in range(videos):
+        video_id = "".join(rng.choice(alphabet) for _ in range(11))
+        href = f"/watch?v={video_id}&list=RD{video_id}&index={rng.randint(1, 20)}"
+        cells.append(
+            f'<div class="cell"><a href="{href}"><img alt="thumb"></a>'
+            f'<a href="{href}">Video {video_id}</a>'
+            f'<a href="/@channel{rng.randint(0, 99)}">Channel</a></div>'
+        )
+    return f"<!doctype html><html><body>{''.join(cells)}</body></html>"
+
+
+def find_video_links_per_element(driver, selector):
+    """Former approach: one WebDriver round-trip per anchor."""
+    hrefs = set()
+    for element in driver.find_elements(By.CSS_SELECTOR, selector):
+        try:
+            href = element.get_attribute("href")
+        except StaleElementReferenceException:
+            continue
+        if href and (url := clean_url(href)):
+            hrefs.add(url)
+    return hrefs
+
+
+class QuietHandler(http.server.SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(directory):
+    handler = functools.partial(QuietHandler, directory=directory)
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def bench(driver, collect, ticks):
+    latencies = []
+    for _ in range(ticks):
+        start = time.perf_counter()
+        hrefs = collect(driver, SELECTOR)
+        latencies.append(time.perf_counter() - start)
+    return latencies, hrefs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--videos", type=int, default=300)
+    parser.add_argument("--ticks", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        with open(os.path.join(directory, "index.html"), "w") as f:
+            f.write(fixture_page(args.videos))
+        server = serve(directory)
+
+        options = Options()
+        options.add_argument("--headless=new")
+        options.add_argument("--no-sandbox")
+        driver = webdriver.Chrome(options=options)
+        try:
+            driver.get(f"http://127.0.0.1:{server.server_address[1]}/index.html")
+            results = {
+                "per element": bench(driver, find_video_links_per_element, args.ticks),
+                "execute_script": bench(driver, find_video_links, args.ticks),
+            }
+        finally:
+            driver.quit()
+            server.shutdown()
+
+    per_element, script = results["per element"][1], results["execute_script"][1]
+    assert per_element == script, "the two approaches found different links"
+    for name, (latencies, hrefs) in results.items():
+        print(
+            f"{name:>14}: median {statistics.median(latencies) * 1e3:8.1f} ms, "
+            f"max {max(latencies) * 1e3:8.1f} ms per tick, {len(hrefs)} videos"
+        )
+
+
+if __name__ == "__main__":
+    main()
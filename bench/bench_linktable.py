@@ -0,0 +1,98 @@
+"""
+Load time and peak RSS of a links collection, as a JSON dict and as a LinkTable.
+
+Writes a collection of `--links` fake links, converts it to a table, then loads
+each form in a fresh interpreter so their peak RSS can be told apart. The peak
+RSS is read from /proc, so this runs on Linux only.
+
+    python bench/bench_linktable.py --links 100000 1000000
+"""
+
+import argparse
+import os
+import random
+import string
+import subprocess
+import sys
+import tempfile
+import time
+
+import orjson
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from linktable import WATCH_PREFIX, convert_links, load_link_table  # noqa: E402
+from links import read_links  # noqa: E402
+
+ID_CHARS = string.ascii_letters + string.digits + "-_"
+NAME = "links"
+
+
+def write_collection(directory, count, seed=0):
+    rng = random.Random(seed)
+    links = {}
+    while len(links) < count:
+        url = WATCH_PREFIX + "".join(rng.choices(ID_CHARS, k=11))
+        visited = rng.randrange(5) if rng.random() < 0.1 else 0
+        links[url] = [rng.randrange(1, 50), visited]
+    with open(os.path.join(directory, f"{NAME}.json"), "wb") as f:
+        f.write(orjson.dumps(links))
+
+
+def peak_rss_mb():
+    # VmHWM starts over on exec, unlike ru_maxrss which the child inherits
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+
+
+def load(kind, directory):
+    """Load one form and print its load time and the growth of the peak RSS."""
+    before = peak_rss_mb()
+    start = time.perf_counter()
+    if kind == "json":
+        links = read_links(NAME, directory)
+        # The player also scanned the dict for the largest counts
+        max(seen for seen, _ in links.values())
+        max(visited for _, visited in links.values())
+    else:
+        links = load_link_table(NAME, directory)
+    elapsed = time.perf_counter() - start
+    print(orjson.dumps([elapsed, peak_rss_mb() - before]).decode())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--links", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument("--load", choices=["json", "table"], help=argparse.SUPPRESS)
+    parser.add_argument("--directory", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.load:
+        load(args.load, args.directory)
+        return
+
+    print(f"{'links':>9} {'form':>6} {'disk MB':>8} {'load s':>8} {'RSS MB':>8}")
+    for count in args.links:
+        with tempfile.TemporaryDirectory() as directory:
+            write_collection(directory, count)
+            convert_links(NAME, directory)
+            for kind, extension in (("json", "json"), ("table", "npz")):
+                size = os.path.getsize(os.path.join(directory, f"{NAME}.{extension}"))
+                command = [sys.executable, __file__, "--load", kind]
+                output = subprocess.run(
+                    command + ["--directory", directory],
+                    capture_output=True,
+                    check=True,
+                ).stdout
+                elapsed, rss = orjson.loads(output)
+                print(
+                    f"{count:>9} {kind:>6} {size / (1 << 20):>8.1f} "
+                    f"{elapsed:>8.3f} {rss:>8.1f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Latency of a log call on the calling thread, writing to a slow sink.
+
+Compares writing in place ("sync") with handing records to the background
+writer ("queue"). The sink sleeps on every write like a slow terminal or pipe.
+
+    python bench/bench_logging.py --messages 200 --sink-delay 0.002
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import runtime_logger  # noqa: E402
+from runtime_logger import get_listener, setup_logger, stop_listener  # noqa: E402
+
+
+class SlowSink:
+    def __init__(self, delay):
+        self.delay = delay
+        self.lines = 0
+
+    def write(self, text):
+        time.sleep(self.delay)
+        self.lines += text.count("\n")
+
+    def flush(self):
+        pass
+
+
+def bench(mode, messages, delay):
+    sink = SlowSink(delay)
+    logger = setup_logger(f"bench_{mode}", mode=mode)
+    if mode == "queue":
+        get_listener()
+        runtime_logger._listener.handlers[0].setStream(sink)
+    else:
+        logger.handlers[0].setStream(sink)
+
+    latencies = []
+    for i in range(messages):
+        start = time.perf_counter()
+        logger.info(f"Fetched clip {i}")
+        latencies.append(time.perf_counter() - start)
+
+    drain_start = time.perf_counter()
+    stop_listener()
+    drain = time.perf_counter() - drain_start
+    assert sink.lines == messages, "records were lost"
+    return latencies, drain
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--sink-delay", type=float, default=0.002)
+    args = parser.parse_args()
+
+    for mode in ("sync", "queue"):
+        latencies, drain = bench(mode, args.messages, args.sink_delay)
+        latencies_us = sorted(latency * 1e6 for latency in latencies)
+        p99 = latencies_us[int(len(latencies_us) * 0.99) - 1]
+        print(
+            f"{mode:>5}: median {statistics.median(latencies_us):8.1f} us, "
+            f"p99 {p99:8.1f} us, max {latencies_us[-1]:8.1f} us, "
+            f"drained in {drain * 1e3:.0f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Bytes transferred and wall time per clip, ranged fetch against whole-file reads.
+
+Serves a random file standing in for a 10 minute audio stream from a local
+HTTP server with Range support, throttled to a fixed bandwidth per
+connection, and fetches clips at random offsets both ways.
+
+    python bench/bench_rangefetch.py --size 10 --bandwidth 20 --clips 10
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+
+from aiohttp import web
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rangefetch import RangeFetcher  # noqa: E402
+
+DURATION = 600
+CLIP_DURATION = 20
+CHUNK = 64 << 10
+
+
+def range_app(data, bandwidth):
+    """Serve `data` at /audio, honouring single Range requests, `bandwidth` B/s."""
+
+    async def handle(request):
+        first, last, status = 0, len(data) - 1, 200
+        header = request.headers.get("Range", "")
+        if match := re.fullmatch(r"bytes=(\d+)-(\d*)", header):
+            first = int(match[1])
+            last = min(last, int(match[2])) if match[2] else last
+            status = 206
+
+        response = web.StreamResponse(status=status)
+        response.content_length = last - first + 1
+        if status == 206:
+            response.headers["Content-Range"] = f"bytes {first}-{last}/{len(data)}"
+        await response.prepare(request)
+        for offset in range(first, last + 1, CHUNK):
+            await response.write(data[offset : min(offset + CHUNK, last + 1)])
+            await asyncio.sleep(CHUNK / bandwidth)
+        return response
+
+    app = web.Application()
+    app.router.add_get("/audio", handle)
+    return app
+
+
+async def whole_file(session, url, path):
+    async with session.get(url) as response:
+        data = await response.read()
+    with open(path, "wb") as f:
+        f.write(data)
+    return len(data)
+
+
+async def run(args):
+    data = os.urandom(int(args.size * (1 << 20)))
+    runner = web.AppRunner(range_app(data, args.bandwidth * (1 << 20)))
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", 0).start()
+    url = f"http://127.0.0.1:{runner.addresses[0][1]}/audio"
+
+    summary = {"duration": DURATION, "stream": {"url": url, "filesize": len(data)}}
+    rng = random.Random(0)
+    starts = [rng.uniform(0, DURATION - CLIP_DURATION) for _ in range(args.clips)]
+    fetcher = RangeFetcher()
+
+    results = {"whole file": [], "ranged": []}
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "clip.part")
+        try:
+            for start in starts:
+                began = time.perf_counter()
+                size = await whole_file(fetcher.get_session(), url, path)
+                results["whole file"].append((size, time.perf_counter() - began))
+
+                began = time.perf_counter()
+                _, _, size = await fetcher.fetch(summary, start, CLIP_DURATION, path)
+                results["ranged"].append((size, time.perf_counter() - began))
+        finally:
+            await fetcher.close()
+            await runner.cleanup()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--size", type=float, default=10, help="Stream size in MB")
+    parser.add_argument("--bandwidth", type=float, default=20, help="MB/s")
+    parser.add_argument("--clips", type=int, default=10)
+    args = parser.parse_args()
+
+    for name, clips in asyncio.run(run(args)).items():
+        size = sum(size for size, _ in clips) / len(clips)
+        wall = sum(wall for _, wall in clips) / len(clips)
+        print(f"{name:>10}: {size / (1 << 20):6.2f} MB, {wall * 1e3:7.1f} ms per clip")
+
+
+if __name__ == "__main__":
+    main()
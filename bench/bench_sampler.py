@@ -0,0 +1,81 @@
+"""
+Time per draw of LinkSampler, uniform and weighted, against the old random.choice.
+
+The old draw built a list of all remaining links on every call and deleted the
+chosen one from the dict, so it is only timed for a few draws.
+
+    python bench/bench_sampler.py --links 10000 100000 1000000
+"""
+
+import argparse
+import os
+import random
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from linktable import WATCH_PREFIX, LinkTable  # noqa: E402
+from sampler import LinkSampler  # noqa: E402
+
+ID_CHARS = string.ascii_letters + string.digits + "-_"
+
+
+def fake_links(count, seed=0):
+    rng = random.Random(seed)
+    links = {}
+    while len(links) < count:
+        url = WATCH_PREFIX + "".join(rng.choices(ID_CHARS, k=11))
+        visited = rng.randrange(5) if rng.random() < 0.1 else 0
+        links[url] = (rng.randrange(1, 50), visited)
+    return links
+
+
+def old_draws(links, draws, rng):
+    links = dict(links)
+    start = time.perf_counter()
+    for _ in range(draws):
+        link, (seen, visited) = rng.choice(list(links.items()))
+        del links[link]
+    return time.perf_counter() - start
+
+
+def sampler_draws(table, draws, weighted, rng):
+    start = time.perf_counter()
+    sampler = LinkSampler(table, weighted=weighted, rng=rng)
+    setup = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(draws):
+        sampler.draw()
+    return setup, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--links", type=int, nargs="+", default=[10_000, 100_000, 1_000_000]
+    )
+    parser.add_argument("--draws", type=int, default=10_000)
+    parser.add_argument("--old-draws", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'links':>9} {'draw':>9} {'setup ms':>9} {'us/draw':>9}")
+    for count in args.links:
+        links = fake_links(count)
+        table = LinkTable.from_dict(links)
+        rng = random.Random(0)
+        draws = min(args.draws, count)
+
+        elapsed = old_draws(links, min(args.old_draws, count), rng)
+        per_draw = elapsed / min(args.old_draws, count) * 1e6
+        print(f"{count:>9} {'old':>9} {'-':>9} {per_draw:>9.1f}")
+        for weighted in (False, True):
+            setup, elapsed = sampler_draws(table, draws, weighted, rng)
+            name = "weighted" if weighted else "uniform"
+            per_draw = elapsed / draws * 1e6
+            print(f"{count:>9} {name:>9} {setup * 1e3:>9.1f} {per_draw:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
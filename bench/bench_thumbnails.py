@@ -0,0 +1,106 @@
+"""
+Connections opened and wall time for thumbnail downloads, shared session or not.
+
+A local aiohttp server stands in for the thumbnail host. It counts the client
+connections it sees and delays the first response on each one by `--handshake`
+ms, the cost of the TCP and TLS handshakes a real host would charge. The old
+download opened a new ClientSession, so a new connection, for every thumbnail.
+
+    python bench/bench_thumbnails.py --thumbnails 100 --concurrency 4
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+import aiohttp
+from aiohttp import web
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import visual  # noqa: E402
+from cache import ThumbnailCache  # noqa: E402
+
+
+class NoCache:
+    def get(self, url):
+        return None
+
+    def put(self, url, data):
+        pass
+
+
+def thumbnail_app(data, handshake, connections):
+    async def handle(request):
+        if request.transport not in connections:
+            connections.add(request.transport)
+            await asyncio.sleep(handshake)
+        return web.Response(body=data, content_type="image/jpeg")
+
+    app = web.Application()
+    app.router.add_get("/vi/{video_id}/hqdefault.jpg", handle)
+    return app
+
+
+async def new_session_download(url):
+    async with aiohttp.ClientSession() as session:
+        async with session.get(url) as response:
+            return await response.read()
+
+
+async def run_mode(mode, urls, concurrency, cache):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def download(url):
+        async with semaphore:
+            if mode == "new session":
+                return await new_session_download(url)
+            return await visual.download_thumbnail(url, cache=cache)
+
+    start = time.perf_counter()
+    await asyncio.gather(*map(download, urls))
+    return time.perf_counter() - start
+
+
+async def run(args):
+    connections = set()
+    app = thumbnail_app(os.urandom(30 << 10), args.handshake / 1e3, connections)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", 0).start()
+    base = f"http://127.0.0.1:{runner.addresses[0][1]}"
+    urls = [f"{base}/vi/{i:011d}/hqdefault.jpg" for i in range(args.thumbnails)]
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        cache = ThumbnailCache(directory=directory)
+        modes = [("new session", NoCache()), ("shared", cache), ("cached", cache)]
+        try:
+            for mode, mode_cache in modes:
+                connections.clear()
+                wall = await run_mode(mode, urls, args.concurrency, mode_cache)
+                results.append((mode, len(connections), wall))
+        finally:
+            await visual.close_session()
+            await runner.cleanup()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--thumbnails", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--handshake", type=float, default=50, help="ms")
+    args = parser.parse_args()
+
+    print(f"{'mode':>12} {'connections':>12} {'wall ms':>9} {'ms/thumb':>9}")
+    for mode, connections, wall in asyncio.run(run(args)):
+        per_thumb = wall / args.thumbnails * 1e3
+        print(f"{mode:>12} {connections:>12} {wall * 1e3:>9.1f} {per_thumb:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
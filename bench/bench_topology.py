@@ -0,0 +1,89 @@
+"""
+CPU time of the mix per voice, for the per-voice and the bus topology.
+
+Renders with the offline server from generated tone clips, starting a sound
+every 50 ms so that every voice is busy.
+
+    python bench/bench_topology.py --voices 16 64 256 --length 10
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+import wave
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from play import AudioPlayer  # noqa: E402
+from speakers import SpeakerLayout  # noqa: E402
+
+SOUNDS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "sounds")
+
+
+def write_clips(directory, count=8, seconds=8, sr=44100):
+    paths = []
+    t = np.arange(seconds * sr) / sr
+    for i in range(count):
+        pcm = 0.3 * np.sin(2 * np.pi * (220 + 55 * i) * t)
+        path = os.path.join(directory, f"tone{i}.wav")
+        with wave.open(path, "wb") as f:
+            f.setnchannels(2)
+            f.setsampwidth(2)
+            f.setframerate(sr)
+            stereo = np.repeat((pcm * 32767).astype("<i2")[:, None], 2, axis=1)
+            f.writeframes(stereo.tobytes())
+        paths.append(path)
+    return paths
+
+
+def bench(voices, topology, clips, length, speakers, out_path):
+    player = AudioPlayer(
+        player_count=voices,
+        min_duration=1,
+        max_duration=8,
+        source_dir=SOUNDS_DIR + os.sep,
+        switch_policy=lambda player, now: now + 0.05,
+        audio="offline",
+        seed=0,
+        topology=topology,
+        speakers=SpeakerLayout.parse(speakers),
+    )
+    start = time.process_time()
+    player.render(clips, out_path, length)
+    return time.process_time() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--voices", type=int, nargs="+", default=[16, 64, 256])
+    parser.add_argument("--topologies", nargs="+", default=["voice", "bus"])
+    parser.add_argument("--length", type=float, default=10)
+    parser.add_argument("--speakers", default="stereo")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        clips = write_clips(directory)
+        out_path = os.path.join(directory, "out.wav")
+        results = []
+        for voices in args.voices:
+            for topology in args.topologies:
+                cpu = bench(
+                    voices, topology, clips, args.length, args.speakers, out_path
+                )
+                results.append((voices, topology, cpu))
+
+    for voices, topology, cpu in results:
+        per_voice = cpu / args.length / voices * 100
+        print(
+            f"{voices:4d} voices, {topology:>5}: {cpu:7.2f} s CPU for "
+            f"{args.length:g} s, {per_voice:.3f}% of a core per voice, "
+            f"{args.length / cpu:6.1f}x realtime"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Clips per second trimmed by each transcode backend, copying and re-encoding.
+
+Cuts clips at random offsets from a generated Opus file, `--workers` at a time
+like the fetch stage. The av backend also returns each clip's PCM, as it does
+for the sample pool. The ffmpeg backend is skipped when there is no ffmpeg on
+the PATH.
+
+    python bench/bench_transcode.py --clips 40 --workers 4
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+import av
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from transcode import AVBackend, FFmpegBackend  # noqa: E402
+
+SR = 48000
+FRAME = 960
+
+
+def write_source(path, seconds):
+    """Encode `seconds` of stereo noise-modulated tones to Opus."""
+    rng = np.random.default_rng(0)
+    with av.open(path, "w") as out:
+        stream = out.add_stream("libopus", rate=SR, layout="stereo")
+        for second in range(seconds):
+            t = (second * SR + np.arange(SR)) / SR
+            mono = 0.3 * np.sin(2 * np.pi * (220 + second % 50 * 10) * t)
+            pcm = np.stack([mono, mono]) + 0.05 * rng.standard_normal((2, SR))
+            frame = av.AudioFrame.from_ndarray(
+                pcm.astype(np.float32), format="fltp", layout="stereo"
+            )
+            frame.sample_rate = SR
+            for packet in stream.encode(frame):
+                out.mux(packet)
+        for packet in stream.encode(None):
+            out.mux(packet)
+
+
+async def trim_clips(backend, source, clips, workers, directory, copy, pcm):
+    semaphore = asyncio.Semaphore(workers)
+
+    async def trim(index, start, duration):
+        output = os.path.join(directory, f"{backend.name}-{index}.opus")
+        async with semaphore:
+            await backend.trim(source, start, duration, output, copy=copy, pcm=pcm)
+        os.remove(output)
+
+    began = time.perf_counter()
+    await asyncio.gather(*(trim(i, *clip) for i, clip in enumerate(clips)))
+    return time.perf_counter() - began
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--clips", type=int, default=40)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--source-seconds", type=int, default=600)
+    parser.add_argument("--min-dur", type=int, default=10)
+    parser.add_argument("--max-dur", type=int, default=30)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    clips = []
+    for _ in range(args.clips):
+        duration = rng.randint(args.min_dur, args.max_dur)
+        clips.append((rng.randint(0, args.source_seconds - duration), duration))
+
+    backends = [(AVBackend(workers=args.workers), (44100, 2))]
+    if shutil.which("ffmpeg"):
+        backends.insert(0, (FFmpegBackend(), None))
+    else:
+        print("ffmpeg not found on the PATH, skipping the ffmpeg backend")
+
+    with tempfile.TemporaryDirectory() as directory:
+        source = os.path.join(directory, "source.opus")
+        write_source(source, args.source_seconds)
+
+        print(f"{'backend':>8} {'mode':>8} {'clips/s':>9} {'ms/clip':>9}")
+        for backend, pcm in backends:
+            for copy in (True, False):
+                trims = trim_clips(
+                    backend, source, clips, args.workers, directory, copy, pcm
+                )
+                wall = asyncio.run(trims)
+                mode = "copy" if copy else "encode"
+                rate = len(clips) / wall
+                print(f"{backend.name:>8} {mode:>8} {rate:>9.1f} {1e3 / rate:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Time per transition frame at 1920x1080, against the 30 FPS frame budget.
+
+"baseline" is the former per-frame path: a new addWeighted image and putText of
+the caption on every frame. The others go through `Transition`.
+
+    python bench/bench_transition.py --frames 151
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from visual import FRAME_RATE, TRANSITION_DURATION, Transition  # noqa: E402
+
+WIDTH, HEIGHT = 1920, 1080
+CAPTION = "youtube.com/watch?v=dQw4w9WgXcQ"
+
+
+def baseline_frame(prev_image, image, alpha):
+    frame = cv2.addWeighted(prev_image, 1.0 - alpha, image, alpha, 0)
+    cv2.putText(
+        frame,
+        CAPTION,
+        (10, HEIGHT - 10),
+        cv2.FONT_HERSHEY_SIMPLEX,
+        1,
+        (255, 255, 255),
+        1,
+        cv2.LINE_AA,
+    )
+    return frame
+
+
+def bench(render, frames):
+    """Seconds per frame of the whole fade, and of its setup."""
+    setup_start = time.perf_counter()
+    frame_at = render()
+    setup = time.perf_counter() - setup_start
+
+    start = time.perf_counter()
+    for i in range(frames):
+        frame_at(i / (frames - 1))
+    return (time.perf_counter() - start) / frames, setup
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--frames", type=int, default=int(TRANSITION_DURATION * FRAME_RATE) + 1
+    )
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    prev_image = cv2.GaussianBlur(
+        rng.integers(0, 256, (HEIGHT, WIDTH, 3), np.uint8), (0, 0), 8
+    )
+    image = cv2.GaussianBlur(
+        rng.integers(0, 256, (HEIGHT, WIDTH, 3), np.uint8), (0, 0), 8
+    )
+
+    def transition(scale=1.0, precompute=False):
+        def render():
+            fade = Transition(prev_image, image, CAPTION, scale=scale)
+            if precompute:
+                fade.precompute(args.frames)
+                return fade.precomputed_frame
+            return fade.frame
+
+        return render
+
+    cases = {
+        "baseline": lambda: lambda alpha: baseline_frame(prev_image, image, alpha),
+        "transition": transition(),
+        "transition scale 0.5": transition(0.5),
+        "precomputed": transition(precompute=True),
+        "precomputed scale 0.5": transition(0.5, precompute=True),
+    }
+    budget = 1.0 / FRAME_RATE
+    for name, render in cases.items():
+        per_frame, setup = bench(render, args.frames)
+        print(
+            f"{name:>22}: {per_frame * 1e3:6.2f} ms/frame, "
+            f"{per_frame / budget:5.1%} of the {FRAME_RATE} FPS budget, "
+            f"setup {setup * 1e3:6.1f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Time to pick and start a voice, with the allocator and with a linear scan.
+
+The linear scan is the dict of end times the player used before, reclaiming
+ended voices and looking for a free one on every switch.
+
+    python bench/bench_voices.py --voices 16 64 256
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from voices import VoiceAllocator  # noqa: E402
+
+
+class LinearVoices:
+    def __init__(self, count, rng):
+        self.count = count
+        self.rng = rng
+        self.currently_playing = {}
+
+    def allocate(self, now):
+        for voice, end in list(self.currently_playing.items()):
+            if end <= now:
+                del self.currently_playing[voice]
+        available = [v for v in range(self.count) if v not in self.currently_playing]
+        if available:
+            return self.rng.choice(available)
+        return min(self.currently_playing, key=self.currently_playing.get)
+
+    def start(self, voice, end, amp=1.0):
+        self.currently_playing[voice] = end
+
+
+def bench(voices, count, switches, seed=0):
+    rng = random.Random(seed)
+    # Sounds last about `count` gaps, so the voices are busy most of the time
+    gaps = [rng.expovariate(1.0) for _ in range(switches)]
+    lengths = [rng.uniform(0.5, 1.5) * count for _ in range(switches)]
+
+    now = 0.0
+    start = time.perf_counter()
+    for gap, length in zip(gaps, lengths):
+        now += gap
+        voice = voices.allocate(now)
+        voices.start(voice, now + length)
+    return (time.perf_counter() - start) / switches
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--voices", type=int, nargs="+", default=[16, 64, 256])
+    parser.add_argument("--switches", type=int, default=20000)
+    args = parser.parse_args()
+
+    for count in args.voices:
+        heap = bench(VoiceAllocator(count, rng=random.Random(0)), count, args.switches)
+        linear = bench(LinearVoices(count, random.Random(0)), count, args.switches)
+        print(
+            f"{count:4d} voices: allocator {heap * 1e6:6.2f} us, "
+            f"linear scan {linear * 1e6:6.2f} us per switch"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -13,18 +13,17 @@ from datetime import datetime
 from urllib.parse import parse_qs, quote_plus, urlparse
 from urllib.request import urlretrieve
 
-import orjson
 import requests
 from selenium import webdriver
 from selenium.common.exceptions import (
     NoSuchElementException,
     NoSuchWindowException,
-    StaleElementReferenceException,
     WebDriverException,
 )
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.common.by import By
+
+from links import LinkStore
 
 
 def short_now():
@@ -35,21 +34,15 @@ def short_now():
 
 def load_links(links_fn):
     if links_fn is None:
-        links_fn = f"{short_now}-links"
-        return {}
+        links_fn = f"{short_now()}-links"
 
-    try:
-        with open(f"resources/{links_fn}.json", "rb") as f:
-            return orjson.loads(f.read())
-    except FileNotFoundError:
-        logging.info(f"No {links_fn}.json found, creating anew!")
-        return {}
+    store = LinkStore(links_fn)
+    store.load()
+    return store
 
 
-def save_links(links, links_fn):
-    os.makedirs("resources", exist_ok=True)
-    with open(f"resources/{links_fn}.json", "wb") as f:
-        f.write(orjson.dumps(links))
+def save_links(links):
+    links.flush()
 
 
 def ask_user_permission(prompt):
@@ -181,6 +174,43 @@ def valid_youtube_watch_link_regex(url):
     return bool(re.match(r"^(https?:\/\/)?(www\.)?youtu(be\.com|\.be)\/.+"), url)
 
 
+# Collect the video ids of all matching anchors in a single WebDriver round-trip,
+# deduplicated unless arguments[1] is false
+VIDEO_IDS_SCRIPT = """
+const ids = [];
+for (const a of document.querySelectorAll(arguments[0])) {
+    try {
+        const id = new URL(a.href).searchParams.get("v");
+        if (id) ids.push(id);
+    } catch (e) {}
+}
+return arguments[1] ? Array.from(new Set(ids)) : ids;
+"""
+
+
+def watch_url(video_id):
+    return f"https://www.youtube.com/watch?v={video_id}"
+
+
+def find_video_links(driver, selector, unique=True):
+    """
+    Find the cleaned watch URLs of all anchors matching a CSS selector.
+
+    Args:
+        driver: Selenium WebDriver instance.
+        selector: CSS selector of the anchors to collect.
+        unique: Deduplicate the URLs. Otherwise a video linked by several anchors,
+            such as its thumbnail and title, is listed once per anchor.
+
+    Returns:
+        A set of deduplicated watch URLs, or a list with one URL per anchor.
+    """
+    video_ids = driver.execute_script(VIDEO_IDS_SCRIPT, selector, unique) or []
+    if unique:
+        return {watch_url(video_id) for video_id in video_ids}
+    return [watch_url(video_id) for video_id in video_ids]
+
+
 def clean_url(url):
     """
     Clean the URL to remove any additional parameters and return only the video ID.
@@ -194,22 +224,19 @@ def clean_url(url):
     parsed_url = urlparse(url)
     video_id = parse_qs(parsed_url.query).get("v", [None])[0]
     if video_id:
-        return f"https://www.youtube.com/watch?v={video_id}"
+        return watch_url(video_id)
     return None
 
 
 def increment_link(links, url, current=False):
     cleaned_url = clean_url(url)
     if cleaned_url:
-        if cleaned_url in links:
-            if current:
-                # Increment visits only
-                links[cleaned_url] = (links[cleaned_url][0] + 1, links[cleaned_url][1])
-            else:
-                # Increment seen count only
-                links[cleaned_url] = (links[cleaned_url][0], links[cleaned_url][1] + 1)
+        if current:
+            # Increment visits only
+            links.increment(cleaned_url, 1, 0)
         else:
-            links[cleaned_url] = (1, 0) if current else (0, 1)
+            # Increment seen count only
+            links.increment(cleaned_url, 0, 1)
     return links
 
 
@@ -223,13 +250,13 @@ def is_browser_open(driver):
         return False
 
 
-def drive_mode(driver, links, links_fn, check_interval=2):
+def drive_mode(driver, links, check_interval=2):
     """
     Scrape links with a periodic check within the current page, adding unseen links to the links dictionary.
 
     Args:
         driver: Selenium WebDriver instance.
-        links: Dictionary of links to be updated.
+        links: LinkStore of links to be updated.
         check_interval: Interval (in seconds) to wait between checks for new links.
     """
     session_active = True
@@ -252,23 +279,14 @@ def drive_mode(driver, links, links_fn, check_interval=2):
                 previous_hrefs.clear()  # Clear previously seen hrefs on navigating to a new page
 
             # Find all watch?v= links on the current page, considering their length
-            hrefs = set()
-            for elem in driver.find_elements(
-                By.XPATH, "//a[starts-with(@href, '/watch?v=')]"
-            ):
-                try:
-                    href = elem.get_attribute("href")
-                    if href:
-                        hrefs.add(href.split("&")[0])
-                except StaleElementReferenceException:
-                    continue
+            hrefs = find_video_links(driver, "a[href^='/watch?v=']")
 
             # Identify new links as those not seen in the previous iteration
             new_hrefs = hrefs - previous_hrefs
             for href in new_hrefs:
                 links = increment_link(links, href, current=False)
 
-            save_links(links, links_fn)
+            save_links(links)
 
             previous_hrefs = hrefs
             time.sleep(check_interval)  # Wait before checking the page again
@@ -286,13 +304,13 @@ def drive_mode(driver, links, links_fn, check_interval=2):
     return session_active
 
 
-def random_mode(driver, links, links_fn, max_duration=14400):
+def random_mode(driver, links, max_duration=14400):
     """
     Randomly navigate through YouTube links and related videos.
 
     Args:
         driver: Selenium WebDriver instance.
-        links: Dictionary to store the collected links.
+        links: LinkStore to store the collected links.
         max_duration: Maximum duration in seconds to run the random mode (default: 14400).
     """
     session_active = True  # Initialize the session_active flag
@@ -314,21 +332,20 @@ def random_mode(driver, links, links_fn, max_duration=14400):
                 time.sleep(random.uniform(0.5, 1.5))
 
             # Find and click on a random related video link
-            related_links = driver.find_elements(
-                By.XPATH, "//a[contains(@href, '/watch?v=')]"
+            related_links = find_video_links(
+                driver, "a[href*='/watch?v=']", unique=False
             )
 
             if related_links:
-                # Increment seen count for all collected links
-                for link in related_links:
-                    link_href = link.get_attribute("href")
+                # Increment seen count once per anchor, as a video can be linked twice
+                for link_href in related_links:
                     increment_link(links, link_href)
 
-                # Save the updated links dictionary
-                save_links(links, links_fn)
+                # Save the updated links
+                save_links(links)
 
                 # Select a totally random link and navigate to it
-                current_url = random.choice(list(links))
+                current_url = random.choice(list(links.links))
                 logging.info(f"Navigating: {current_url}")
                 driver.get(current_url)
                 increment_link(links, current_url, current=True)
@@ -367,34 +384,36 @@ def main():
 
     args = parser.parse_args()
 
+    if args.search is not None:
+        args.mode = "search"
+        # Set file name to save as search term or links json
+        args.links_fn = args.links_fn or args.search
+
     # Load previous links to contiue
     links = load_links(args.links_fn)
 
     chromedriver_path = setup_chrome_driver()
     driver = setup_browser(chromedriver_path)
 
-    if args.search is not None:
-        args.mode = "search"
-        # Set file name to save as search term or links json
-        args.links_fn = args.links_fn or args.search
-
     if args.mode == "drive":
         # Scrape links while driving
         driver.get("https://www.youtube.com")
-        drive_mode(driver, links, args.links_fn)
+        drive_mode(driver, links)
 
     elif args.mode == "search":
         logging.info(f"Searching for {args.search}...")
         search_term = quote_plus(args.search)
         driver.get(f"https://www.youtube.com/results?search_query={search_term}")
-        random_mode(driver, links, args.links_fn)
+        random_mode(driver, links)
 
     elif args.mode == "trending":
         # Random mode
         logging.info("Looking at trending videos...")
         driver.get("https://www.youtube.com/trending")
-        random_mode(driver, links, args.links_fn)
+        random_mode(driver, links)
 
+    # Fold the journal into the snapshot before leaving
+    links.close()
     logging.info("Driver exiting...")
     driver.quit()
 
@@ -0,0 +1,266 @@
+import hashlib
+import logging
+import os
+import random
+from collections import Counter, OrderedDict
+
+import orjson
+
+CACHE_DIR = "cache"
+
+
+class DiskLRU:
+    """
+    Directory of files with a total size cap and least-recently-used eviction.
+
+    File modification times record recency, so the LRU order survives restarts.
+    Pinned files are never evicted, so the total can run over the cap while they
+    are in use.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # File name -> size, least recently used first
+        self.size = 0
+        self.pins = Counter()  # File name -> number of pins
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(directory, exist_ok=True)
+        self._scan()
+
+    def _scan(self):
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and not entry.name.endswith(".tmp"):
+                stat = entry.stat()
+                files.append((stat.st_mtime, entry.name, stat.st_size))
+
+        for _, name, size in sorted(files):
+            self._add(name, size)
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _add(self, name, size):
+        if name in self.entries:
+            self.size -= self.entries.pop(name)
+        self.entries[name] = size
+        self.size += size
+
+    def _discard(self, name):
+        self.size -= self.entries.pop(name)
+        try:
+            os.remove(self.path(name))
+        except FileNotFoundError:
+            pass
+
+    def _touch(self, name):
+        self.entries.move_to_end(name)
+        try:
+            os.utime(self.path(name))
+        except FileNotFoundError:
+            self._discard(name)
+            return False
+        return True
+
+    def _evict(self, keep=None):
+        for name in list(self.entries):
+            if self.size <= self.max_bytes:
+                break
+            # Discarding a file can take others with it
+            if name == keep or self._pinned(name) or name not in self.entries:
+                continue
+            logging.debug(f"Evicting cached file {name}")
+            self._discard(name)
+
+    def _pinned(self, name):
+        return name in self.pins
+
+    def pin(self, path):
+        """Keep a cached file from eviction until it is unpinned as often."""
+        self.pins[os.path.basename(path)] += 1
+
+    def unpin(self, path):
+        name = os.path.basename(path)
+        if self.pins[name] > 1:
+            self.pins[name] -= 1
+            return
+        self.pins.pop(name, None)
+        self._evict()
+
+    def read(self, name):
+        if name not in self.entries or not self._touch(name):
+            return None
+        with open(self.path(name), "rb") as f:
+            return f.read()
+
+    def write(self, name, data):
+        tmp_path = self.path(f"{name}.tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, self.path(name))
+        self._add(name, len(data))
+        self._evict(keep=name)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "bytes": self.size,
+            "entries": len(self.entries),
+        }
+
+
+class ClipCache(DiskLRU):
+    """
+    On-disk cache of trimmed clips with a size cap and LRU eviction.
+
+    Clips are keyed by (video id, start, duration, format) and stored as
+    `<video_id>_<start>_<duration>.<format>`, next to a `<video_id>.jpg` thumbnail
+    and a `<clip>.json` loudness analysis that is evicted along with its clip.
+    """
+
+    def __init__(self, directory=os.path.join(CACHE_DIR, "clips"), max_bytes=2 << 30):
+        self.clips = {}  # Video id -> set of clip file names
+        super().__init__(directory, max_bytes)
+
+    @staticmethod
+    def clip_name(video_id, start, duration, fmt):
+        return f"{video_id}_{start}_{duration}.{fmt}"
+
+    @staticmethod
+    def parse_name(name):
+        """Return (video_id, start, duration, format) of a clip file name, or None."""
+        stem, _, fmt = name.rpartition(".")
+        parts = stem.rsplit("_", 2)
+        if len(parts) != 3 or not parts[1].isdigit() or not parts[2].isdigit():
+            return None
+        return parts[0], int(parts[1]), int(parts[2]), fmt
+
+    def _add(self, name, size):
+        super()._add(name, size)
+        if key := self.parse_name(name):
+            self.clips.setdefault(key[0], set()).add(name)
+
+    def _discard(self, name):
+        super()._discard(name)
+        if key := self.parse_name(name):
+            names = self.clips.get(key[0], set())
+            names.discard(name)
+            if not names:
+                self.clips.pop(key[0], None)
+            if (analysis := self.analysis_name(name)) in self.entries:
+                self._discard(analysis)
+
+    def _pinned(self, name):
+        # A pinned clip keeps its analysis, which the normalize stage reads
+        clip_name, _, ext = name.rpartition(".")
+        return super()._pinned(name) or (ext == "json" and clip_name in self.pins)
+
+    def get(self, video_id, start, duration, fmt):
+        name = self.clip_name(video_id, start, duration, fmt)
+        if name in self.entries and self._touch(name):
+            self.hits += 1
+            return self.path(name)
+        self.misses += 1
+        return None
+
+    def find(self, video_id, min_dur, max_dur, fmt):
+        """
+        Return a random cached clip of a video whose duration lies within bounds.
+
+        Returns:
+            A (path, duration) tuple, or (None, None) on a miss.
+        """
+        candidates = []
+        for name in self.clips.get(video_id, ()):
+            _, _, duration, clip_fmt = self.parse_name(name)
+            if clip_fmt == fmt and min_dur <= duration <= max_dur:
+                candidates.append((name, duration))
+
+        random.shuffle(candidates)
+        for name, duration in candidates:
+            if self._touch(name):
+                self.hits += 1
+                return self.path(name), duration
+
+        self.misses += 1
+        return None, None
+
+    def put(self, video_id, start, duration, fmt, source):
+        """Move a finished clip into the cache and return its cached path."""
+        name = self.clip_name(video_id, start, duration, fmt)
+        os.replace(source, self.path(name))
+        self._add(name, os.path.getsize(self.path(name)))
+        self._evict(keep=name)
+        return self.path(name)
+
+    @staticmethod
+    def analysis_name(clip_name):
+        return f"{clip_name}.json"
+
+    def get_loudness(self, path):
+        """Return the cached loudness analysis of a cached clip, or None."""
+        data = self.read(self.analysis_name(os.path.basename(path)))
+        return orjson.loads(data) if data is not None else None
+
+    def put_loudness(self, path, stats):
+        self.write(self.analysis_name(os.path.basename(path)), orjson.dumps(stats))
+
+    def get_thumbnail(self, video_id):
+        return self.read(f"{video_id}.jpg")
+
+    def put_thumbnail(self, video_id, thumb_data):
+        self.write(f"{video_id}.jpg", thumb_data)
+
+
+class ThumbnailCache(DiskLRU):
+    """
+    Thumbnails keyed by URL, in a byte-capped memory LRU in front of a disk LRU.
+    """
+
+    def __init__(
+        self,
+        directory=os.path.join(CACHE_DIR, "thumbnails"),
+        max_bytes=256 << 20,
+        max_memory_bytes=32 << 20,
+    ):
+        self.memory = OrderedDict()  # URL -> image bytes
+        self.memory_size = 0
+        self.max_memory_bytes = max_memory_bytes
+        super().__init__(directory, max_bytes)
+
+    @staticmethod
+    def name_of(url):
+        return hashlib.sha1(url.encode()).hexdigest() + ".img"
+
+    def _remember(self, url, data):
+        if url in self.memory:
+            self.memory_size -= len(self.memory.pop(url))
+        self.memory[url] = data
+        self.memory_size += len(data)
+        while self.memory_size > self.max_memory_bytes and len(self.memory) > 1:
+            _, evicted = self.memory.popitem(last=False)
+            self.memory_size -= len(evicted)
+
+    def get(self, url):
+        if (data := self.memory.get(url)) is not None:
+            self.memory.move_to_end(url)
+            self.hits += 1
+            return data
+
+        data = self.read(self.name_of(url))
+        if data is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._remember(url, data)
+        return data
+
+    def put(self, url, data):
+        self._remember(url, data)
+        self.write(self.name_of(url), data)
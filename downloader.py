@@ -1,160 +1,400 @@
 import asyncio
+import multiprocessing
 import os
 import random
-import subprocess
 import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from time import monotonic
+from urllib.parse import parse_qs, urlparse
 
-import yt_dlp
-from yt_dlp.utils import DownloadError
-
-from runtime_logger import LogColors, setup_logger
+from linktable import as_table
+from loudness import analyze_path
+from metadata import is_playable, resolve_link
+from pipeline import Pipeline, Stage
+from prefetch import PrefetchController
+from rangefetch import RangeFetcher, can_copy
+from runtime_logger import LogColors, init_worker, setup_logger
+from sampler import LinkSampler
+from transcode import FFmpegBackend, TrimError
 from visual import download_thumbnail
 
 logger_dl = setup_logger("file2_logger", color_code=LogColors.DIM)
 
 DOWNLOAD_DELAY = 5
-MAX_CONCURRENCY = 5
+AUDIO_FORMAT = "opus"
 
+# Default worker pool size of each pipeline stage
+STAGE_SIZES = {"resolve": 2, "fetch": 4, "normalize": 1}
 
-async def choose_media(link_dict, player_num, min_dur, max_dur, q_dl, q_pyo):
-    temp_dir = tempfile.TemporaryDirectory()
 
-    async def preload_media_async(link, seen, visited, player):
-        try:
-            await asyncio.sleep(random.random() * DOWNLOAD_DELAY)
-            logger_dl.info(f"↓ Downloading: {link}")
-            output, cur_dur, thumb_data = await download_media(
-                link, min_dur, max_dur, temp_dir
+def video_id_of(link):
+    return parse_qs(urlparse(link).query).get("v", [None])[0]
+
+
+class Clip:
+    """A link on its way through the download pipeline."""
+
+    def __init__(self, link, seen, visited, player):
+        self.link = link
+        self.video_id = video_id_of(link)
+        self.seen = seen
+        self.visited = visited
+        self.player = player
+
+        self.summary = None
+        self.start = None
+        self.duration = None
+        self.path = None
+        self.thumb_data = None
+        self.pcm = None
+        self.info_dict = {"link": link}
+        self.started_at = None
+        self.failure = None  # Reason the clip was dropped, for the failure index
+
+    def queue_item(self):
+        return (
+            self.path,
+            self.seen,
+            self.visited,
+            self.player,
+            self.thumb_data,
+            self.info_dict,
+        )
+
+
+class Downloader:
+    """
+    Download stages of the pipeline: resolve → fetch/trim → normalize → enqueue.
+
+    The normalize stage measures each clip's loudness (see loudness.py) and
+    passes it to the player in the clip's info dict.
+
+    Resolution runs `resolver` in a process pool so yt-dlp's extraction does not
+    compete for the GIL with the audio and visual threads. A coroutine function can
+    be passed as `resolver` instead, and is then awaited directly.
+
+    Clips are cut by `backend` (see transcode.py). When a `sample_pool` is given,
+    backends that decode in-process hand it each clip's PCM along with the file.
+
+    Cached clips are pinned in `clip_cache` from the moment they are found or
+    stored, and unpinned by the player once it has taken them off the queue.
+    """
+
+    def __init__(
+        self,
+        min_dur,
+        max_dur,
+        q_dl,
+        clip_cache=None,
+        metadata_cache=None,
+        resolver=resolve_link,
+        stage_sizes=None,
+        prefetch=None,
+        backend=None,
+        sample_pool=None,
+        failures=None,
+    ):
+        self.min_dur = min_dur
+        self.max_dur = max_dur
+        self.q_dl = q_dl
+        self.clip_cache = clip_cache
+        self.metadata_cache = metadata_cache
+        self.resolver = resolver
+        self.prefetch = prefetch or PrefetchController(q_dl.qsize)
+        self.stage_sizes = {**STAGE_SIZES, **(stage_sizes or {})}
+        self.backend = backend or FFmpegBackend()
+        self.sample_pool = sample_pool
+        self.failures = failures
+
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.range_fetcher = RangeFetcher()
+        # Workers start from a clean server process, since forking this one
+        # after its threads have started can copy a lock held by one of them
+        mp_context = multiprocessing.get_context("forkserver")
+        self.executor = None
+        if not asyncio.iscoroutinefunction(resolver):
+            self.executor = ProcessPoolExecutor(
+                self.stage_sizes["resolve"],
+                mp_context=mp_context,
+                initializer=init_worker,
             )
+        # Loudness analysis also runs out of process, clear of the audio thread
+        self.analysis_executor = ProcessPoolExecutor(
+            self.stage_sizes["normalize"],
+            mp_context=mp_context,
+            initializer=init_worker,
+        )
 
-            if output is not None:
-                info_dict = {"link": link}
-                await q_dl.put(
-                    (output.name, seen, visited, player, thumb_data, info_dict)
-                )
-                logger_dl.info(f"✓ Completed: {link}")
-        except Exception as e:
-            logger_dl.error(f"✗ Error preloading media: {e}")
-
-    tasks = []
-    while len(link_dict) > 0:
-        if len(tasks) < MAX_CONCURRENCY and q_dl.qsize() < 5:
-            rnd_link = random.choice(list(link_dict.items()))
-            link, (seen, visited) = rnd_link
-            del link_dict[link]
-            player = random.randint(0, player_num - 1)
-            task = asyncio.create_task(preload_media_async(link, seen, visited, player))
-            tasks.append(task)
-        else:
-            done, pending = await asyncio.wait(
-                tasks, return_when=asyncio.FIRST_COMPLETED
+    def pipeline(self):
+        sizes = self.stage_sizes
+        return Pipeline(
+            [
+                Stage("resolve", self.resolve, sizes["resolve"]),
+                Stage("fetch", self.fetch, sizes["fetch"]),
+                Stage("normalize", self.normalize, sizes["normalize"]),
+            ],
+            sink=self.enqueue,
+            on_drop=self.dropped,
+        )
+
+    async def _resolve_summary(self, link):
+        if self.executor is None:
+            return await self.resolver(link)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self.resolver, link)
+
+    async def resolve(self, clip):
+        clip.started_at = monotonic()
+        if "youtube.com/watch?v=" not in clip.link:
+            logger_dl.error("✗ Invalid YouTube video link.")
+            clip.failure = "invalid_url"
+            return None
+
+        if self.clip_cache is not None:
+            clip.path, clip.duration = self.clip_cache.find(
+                clip.video_id, self.min_dur, self.max_dur, AUDIO_FORMAT
             )
-            tasks = list(pending)
-            await asyncio.sleep(0.1)
+            if clip.path is not None:
+                self.clip_cache.pin(clip.path)
+                clip.thumb_data = self.clip_cache.get_thumbnail(clip.video_id)
+                logger_dl.info(f"✓ Cached: {clip.link}")
+                return clip
 
-    await asyncio.gather(*tasks)
-    temp_dir.cleanup()
+        # Known videos are judged from cached metadata before touching the network
+        summary = None
+        if self.metadata_cache is not None:
+            summary = self.metadata_cache.get(clip.video_id)
+        if summary is None or (
+            summary["stream"] is None and is_playable(summary, self.min_dur)
+        ):
+            await asyncio.sleep(random.random() * DOWNLOAD_DELAY)
+            logger_dl.info(f"↓ Resolving: {clip.link}")
+            summary = await self._resolve_summary(clip.link)
+            if summary is None:
+                clip.failure = "resolve"
+                return None
 
+            if self.metadata_cache is not None:
+                self.metadata_cache.put(clip.video_id, summary)
 
-async def download_media(link, min_dur, max_dur, temp_dir):
-    if "youtube.com/watch?v=" not in link:
-        logger_dl.error("✗ Invalid YouTube video link.")
-        return None, None, None
+        if summary["is_playlist"]:  # Verify it's not a playlist
+            logger_dl.error("Playlists are not supported.")
+            clip.failure = "playlist"
+            return None
 
-    cur_dur = random.randint(min_dur, max_dur)
+        if summary["is_live"]:
+            logger_dl.error("Live streams cannot be processed.")
+            clip.failure = "live"
+            return None
 
-    # Use yt-dlp to fetch video info only, no immediate download
-    audio_format = "opus"
-    ydl_opts = {
-        "format": "bestaudio",
-        "extractaudio": True,
-        "noplaylist": True,
-        "quiet": True,
-        "audioformat": audio_format,
-    }
+        duration = summary["duration"]
+        if not duration or duration < self.min_dur:
+            logger_dl.warning("The video is too short or is a live stream; skipping.")
+            clip.failure = "too_short"
+            return None
 
-    def extract_info_sync(ydl_opts, link):
-        try:
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                return ydl.extract_info(link, download=False)
-        except DownloadError as e:
-            logger_dl.error(f"✗ DownloadError in extracting info: {e}")
+        if not summary["stream"]:
+            logger_dl.error("No suitable audio URL found.")
+            clip.failure = "no_audio"
             return None
-        except Exception as e:
-            logger_dl.error(f"✗ Unexpected error in extracting info: {e}")
+
+        clip.summary = summary
+        clip.duration = random.randint(self.min_dur, self.max_dur)
+        clip.start = random.randint(0, max(0, int(duration) - clip.duration))
+        return clip
+
+    async def fetch(self, clip):
+        if clip.path is not None:  # Served from the clip cache
+            return clip
+
+        logger_dl.info(f"↓ Downloading: {clip.link}")
+        output = tempfile.NamedTemporaryFile(
+            suffix=f".{AUDIO_FORMAT}", dir=self.temp_dir.name, delete=False
+        )
+        output.close()
+
+        # Download the thumbnail while the audio is fetched
+        thumbnail_url = clip.summary["thumbnail"]
+        thumb_task = None
+        if thumbnail_url:
+            thumb_task = asyncio.create_task(download_thumbnail(thumbnail_url))
+
+        stream = clip.summary["stream"]
+        copy = can_copy(stream, AUDIO_FORMAT)
+        pcm = None
+        if self.sample_pool is not None:
+            pcm = (self.sample_pool.sr, self.sample_pool.channels)
+        try:
+            # Fetch just the clip's part of the stream when its metadata allows,
+            # otherwise let the backend read the stream URL directly
+            partial = await self.range_fetcher.fetch_or_none(
+                clip.summary, clip.start, clip.duration, output.name + ".part"
+            )
+            if partial is not None:
+                source, start, fetched = partial
+                try:
+                    clip.pcm = await self.backend.trim(
+                        source,
+                        start,
+                        clip.duration,
+                        output.name,
+                        copy=copy,
+                        strict=True,
+                        pcm=pcm,
+                    )
+                    logger_dl.info(f"Fetched {round(fetched / (1024 * 1024), 2)}mb")
+                except TrimError as e:
+                    logger_dl.warning(f"Ranged trim failed, reading the stream: {e}")
+                    partial = None
+                finally:
+                    os.remove(source)
+            if partial is None:
+                clip.pcm = await self.backend.trim(
+                    stream["url"],
+                    clip.start,
+                    clip.duration,
+                    output.name,
+                    copy=copy,
+                    pcm=pcm,
+                )
+        except TrimError as e:
+            logger_dl.error(f"Error processing audio: {e}")
+            os.remove(output.name)
+            clip.failure = "trim"
             return None
+        finally:
+            if thumb_task is not None:
+                clip.thumb_data = await thumb_task
 
-    info_dict = await asyncio.to_thread(extract_info_sync, ydl_opts, link)
-    if info_dict is None:
-        return None, None, None
-
-    if "entries" in info_dict:  # Verify it's not a playlist
-        logger_dl.error("Playlists are not supported.")
-        return None, None, None
-
-    if info_dict.get("is_live"):
-        logger_dl.error("Live streams cannot be processed.")
-        return None, None, None
-
-    duration = info_dict.get("duration")
-    if not duration or duration < min_dur:
-        logger_dl.warning("The video is too short or is a live stream; skipping.")
-        return None, None, None
-
-    cur_start = random.randint(0, max(0, duration - cur_dur))
-
-    download_url = info_dict.get("url")
-    if not download_url:
-        logger_dl.warning("No direct download URL found, attempting DASH audio stream.")
-        for format_info in info_dict.get("formats", []):
-            if (
-                format_info.get("acodec") != "none"
-                and format_info.get("vcodec") == "none"
-            ):
-                download_url = format_info.get("url")
-                break
-
-    if not download_url:
-        logger_dl.error("No suitable audio URL found.")
-        return None, None, None
-
-    # Download the thumbnail
-    thumb_data = None
-    thumbnail_url = info_dict.get("thumbnail", None)
-    if thumbnail_url:
-        # thumbnail_url = "/".join(thumbnail_url.rsplit("/", 1)[:-1]) + "/hqdefault.jpg"
-        thumb_data = await download_thumbnail(thumbnail_url)
-
-    output = tempfile.NamedTemporaryFile(
-        suffix=f".{audio_format}", dir=temp_dir.name, delete=False
-    )
+        file_size = round(os.path.getsize(output.name) / (1024 * 1024), 2)
+        logger_dl.info(f"=> {file_size}mb")
 
-    # Directly download and trim the audio with FFmpeg
-    command = [
-        "ffmpeg",
-        "-hide_banner",
-        "-loglevel",
-        "quiet",
-        "-y",
-        "-ss",
-        str(cur_start),
-        "-t",
-        str(cur_dur),
-        "-i",
-        download_url,
-        "-map",
-        "0:a",
-        output.name,
-    ]
+        clip.path = output.name
+        if self.clip_cache is not None:
+            if clip.thumb_data is not None:
+                self.clip_cache.put_thumbnail(clip.video_id, clip.thumb_data)
+            clip.path = self.clip_cache.put(
+                clip.video_id, clip.start, clip.duration, AUDIO_FORMAT, output.name
+            )
+            self.clip_cache.pin(clip.path)
+        return clip
+
+    async def normalize(self, clip):
+        """Measure the clip's loudness, so the player can even out levels."""
+        stats = None
+        if self.clip_cache is not None:
+            stats = self.clip_cache.get_loudness(clip.path)
+        if stats is None:
+            loop = asyncio.get_running_loop()
+            stats = await loop.run_in_executor(
+                self.analysis_executor, analyze_path, clip.path, self.backend.name
+            )
+            if stats is not None and self.clip_cache is not None:
+                self.clip_cache.put_loudness(clip.path, stats)
+
+        if stats is not None:
+            clip.info_dict["loudness"] = stats
+            logger_dl.info(f"Loudness: {stats['integrated']} LUFS, peak {stats['peak']}")
+        return clip
+
+    async def enqueue(self, clip):
+        latency = monotonic() - clip.started_at
+        await self.prefetch.wait_for_ready_slot()
+        if clip.pcm is not None and self.sample_pool is not None:
+            self.sample_pool.add(clip.path, clip.pcm)
+        await self.q_dl.put(clip.queue_item())
+        await self.prefetch.record_finished(latency)
+        if self.failures is not None:
+            self.failures.clear(clip.video_id)
+        logger_dl.info(f"✓ Completed: {clip.link}")
+
+    async def dropped(self, clip):
+        if self.clip_cache is not None and clip.path is not None:
+            self.clip_cache.unpin(clip.path)
+        await self.prefetch.record_dropped()
+        if self.failures is not None and clip.video_id is not None:
+            cost = monotonic() - clip.started_at if clip.started_at else 0.0
+            self.failures.record(clip.video_id, clip.failure or "error", cost)
+
+    async def close(self):
+        await self.range_fetcher.close()
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+        self.analysis_executor.shutdown(cancel_futures=True)
+        self.temp_dir.cleanup()
+
+
+async def choose_media(
+    links,
+    player_num,
+    min_dur,
+    max_dur,
+    q_dl,
+    q_pyo,
+    weighted=False,
+    clip_cache=None,
+    metadata_cache=None,
+    stage_sizes=None,
+    resolver=resolve_link,
+    prefetch=None,
+    backend=None,
+    sample_pool=None,
+    failures=None,
+    metrics=None,
+):
+    prefetch = prefetch or PrefetchController(q_dl.qsize)
+    downloader = Downloader(
+        min_dur,
+        max_dur,
+        q_dl,
+        clip_cache=clip_cache,
+        metadata_cache=metadata_cache,
+        resolver=resolver,
+        stage_sizes=stage_sizes,
+        prefetch=prefetch,
+        backend=backend,
+        sample_pool=sample_pool,
+        failures=failures,
+    )
+    pipeline = downloader.pipeline()
+    if metrics is not None:
+        pipeline.register_metrics(metrics)
+    pipeline.start()
+    watch_task = asyncio.create_task(prefetch.watch(q_pyo))
 
     try:
-        process = await asyncio.create_subprocess_exec(*command)
-        await process.wait()
-    except subprocess.CalledProcessError as e:
-        logger_dl.error(f"Error processing audio: {e}")
-        output.close()
-        return None, None, None
+        if failures is not None:
+            # Skip links that failed before, until their retry time
+            links = as_table(links).without(failures.skipped())
+            logger_dl.info(f"Skipping failed links: {failures.stats()}")
+        sampler = LinkSampler(links, weighted=weighted)
+        targets = None
+        while len(sampler) > 0:
+            await prefetch.wait_for_download_slot()
+            new_targets = (prefetch.target_in_flight(), prefetch.target_ready())
+            if new_targets != targets:
+                targets = new_targets
+                logger_dl.info(f"Prefetch: {prefetch.metrics()}")
+
+            link, (seen, visited) = sampler.draw()
+            player = random.randint(0, player_num - 1)
+            prefetch.record_started()
+            await pipeline.put(Clip(link, seen, visited, player))
+
+        await pipeline.join()
+    finally:
+        watch_task.cancel()
+        await pipeline.close()
+        await downloader.close()
 
-    file_size = round(os.path.getsize(output.name) / (1024 * 1024), 2)
-    logger_dl.info(f"=> {file_size}mb")
-    return output, cur_dur, thumb_data
+    logger_dl.info(f"Pipeline: {pipeline.stats()}")
+    if clip_cache is not None:
+        logger_dl.info(f"Clip cache: {clip_cache.stats()}")
+    if metadata_cache is not None:
+        logger_dl.info(
+            f"Metadata cache: {metadata_cache.hits} hits, {metadata_cache.misses} misses"
+        )
+    if failures is not None:
+        logger_dl.info(
+            f"Failures: {failures.recorded} recorded, {failures.cleared} recovered"
+        )
@@ -0,0 +1,93 @@
+import math
+import os
+import sqlite3
+import time
+
+from cache import CACHE_DIR
+
+# Failures that retrying cannot fix; anything else is retried after a backoff
+PERMANENT = {"invalid_url", "playlist", "too_short"}
+# Backoff of transient failures, doubling with every failed attempt
+BACKOFF_BASE = 60 * 60
+BACKOFF_MAX = 30 * 24 * 60 * 60
+
+
+def backoff(attempts):
+    return min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempts - 1))
+
+
+class FailureIndex:
+    """
+    SQLite index of links that failed to download, keyed by video id.
+
+    Each failure records its reason, when it happened, how many attempts failed
+    in a row and how long the last attempt took. Permanent failures are never
+    retried; transient ones only once their exponential backoff has passed.
+    """
+
+    def __init__(self, path=os.path.join(CACHE_DIR, "failures.sqlite")):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.recorded = 0
+        self.cleared = 0
+
+        self.db = sqlite3.connect(path)
+        self.db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS failures (
+                video_id TEXT PRIMARY KEY,
+                reason TEXT,
+                failed_at REAL,
+                attempts INTEGER,
+                retry_at REAL,
+                cost REAL
+            );
+            """
+        )
+
+    def record(self, video_id, reason, cost, now=None):
+        """Record a failed attempt at a video that took `cost` seconds."""
+        now = time.time() if now is None else now
+        row = self.db.execute(
+            "SELECT attempts FROM failures WHERE video_id = ?", (video_id,)
+        ).fetchone()
+        attempts = row[0] + 1 if row else 1
+        retry_at = math.inf if reason in PERMANENT else now + backoff(attempts)
+        with self.db:
+            self.db.execute(
+                "INSERT OR REPLACE INTO failures VALUES (?, ?, ?, ?, ?, ?)",
+                (video_id, reason, now, attempts, retry_at, cost),
+            )
+        self.recorded += 1
+
+    def clear(self, video_id):
+        """Forget the failures of a video that has now downloaded."""
+        with self.db:
+            cursor = self.db.execute(
+                "DELETE FROM failures WHERE video_id = ?", (video_id,)
+            )
+        self.cleared += cursor.rowcount
+
+    def skipped(self, now=None):
+        """Ids of the videos not to try before their retry time."""
+        now = time.time() if now is None else now
+        rows = self.db.execute(
+            "SELECT video_id FROM failures WHERE retry_at > ?", (now,)
+        )
+        return [video_id for (video_id,) in rows]
+
+    def stats(self, now=None):
+        """
+        Skipped videos per reason, with the time their last attempts took.
+
+        The latter estimates the time saved by not trying them again.
+        """
+        now = time.time() if now is None else now
+        rows = self.db.execute(
+            "SELECT reason, COUNT(*), SUM(cost) FROM failures WHERE retry_at > ?"
+            " GROUP BY reason",
+            (now,),
+        )
+        return {reason: {"skipped": count, "saved": cost} for reason, count, cost in rows}
+
+    def close(self):
+        self.db.close()
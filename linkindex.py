@@ -0,0 +1,101 @@
+import numpy as np
+
+from linktable import LinkTable, load_link_table
+
+
+class LinkIndex:
+    """
+    Several link collections merged into one LinkTable with per-link provenance.
+
+    Counts of links found in more than one collection are summed. Which
+    collections each link came from is kept as a bit matrix, one bit per
+    collection, so filtering by source is a vectorized mask like the count
+    thresholds of `query`.
+    """
+
+    def __init__(self, names, table, membership):
+        self.names = list(names)
+        self.table = table
+        self.membership = membership  # (links, ceil(collections / 8)) packed bits
+
+    def __len__(self):
+        return len(self.table)
+
+    @classmethod
+    def merge(cls, names, directory="resources"):
+        """Merge the collections `resources/<name>.json` of each name."""
+        names = list(dict.fromkeys(names))
+        tables = [load_link_table(name, directory) for name in names]
+        if not tables:
+            return cls(names, LinkTable.from_dict({}), np.zeros((0, 0), np.uint8))
+
+        keys, inverse = np.unique(
+            np.concatenate([table.keys for table in tables]), return_inverse=True
+        )
+        seen = np.concatenate([table.seen for table in tables])
+        visited = np.concatenate([table.visited for table in tables])
+        table = LinkTable(
+            keys,
+            np.bincount(inverse, weights=seen, minlength=len(keys)).astype(np.int32),
+            np.bincount(inverse, weights=visited, minlength=len(keys)).astype(np.int32),
+        )
+
+        # Keys are unique within a collection, so each row is set once per source
+        membership = np.zeros((len(keys), (len(names) + 7) // 8), dtype=np.uint8)
+        offset = 0
+        for source, source_table in enumerate(tables):
+            rows = inverse[offset : offset + len(source_table)]
+            membership[rows, source // 8] |= np.uint8(0x80 >> (source % 8))
+            offset += len(source_table)
+        return cls(names, table, membership)
+
+    def _source_mask(self, name):
+        if name not in self.names:
+            raise ValueError(f"{name} is not one of the merged collections")
+        source = self.names.index(name)
+        return (self.membership[:, source // 8] & (0x80 >> (source % 8))) != 0
+
+    def sources_of(self, url):
+        """Names of the collections a link was found in."""
+        index = self.table.index_of(url)
+        if index is None:
+            return []
+        bits = np.unpackbits(self.membership[index])[: len(self.names)]
+        return [name for name, bit in zip(self.names, bits) if bit]
+
+    def query(
+        self,
+        sources=None,
+        min_seen=0,
+        min_visited=0,
+        max_seen=None,
+        max_visited=None,
+        exclude=(),
+    ):
+        """
+        Select links into a new LinkTable, ready for `choose_media`.
+
+        Args:
+            sources: Collection names a link must come from (any of them).
+            min_seen, min_visited, max_seen, max_visited: Inclusive count bounds.
+            exclude: Video ids to leave out, e.g. videos known to fail.
+        """
+        table = self.table
+        mask = (table.seen >= min_seen) & (table.visited >= min_visited)
+        if max_seen is not None:
+            mask &= table.seen <= max_seen
+        if max_visited is not None:
+            mask &= table.visited <= max_visited
+
+        if sources:
+            from_sources = np.zeros(len(table), dtype=bool)
+            for name in sources:
+                from_sources |= self._source_mask(name)
+            mask &= from_sources
+
+        selected = LinkTable(table.keys[mask], table.seen[mask], table.visited[mask])
+        return selected.without(exclude)
+
+    def stats(self):
+        """Number of links each collection contributed to the index."""
+        return {name: int(self._source_mask(name).sum()) for name in self.names}
@@ -0,0 +1,205 @@
+import logging
+import os
+import threading
+
+import orjson
+
+# Journal size (in bytes) past which a background compaction is started
+COMPACT_THRESHOLD = 8 * 1024 * 1024
+
+
+def _paths(links_fn, directory="resources"):
+    base = os.path.join(directory, links_fn)
+    return {
+        "snapshot": f"{base}.json",
+        "pending": f"{base}.json.tmp",
+        "journal": f"{base}.journal",
+        "rotated": f"{base}.journal.1",
+    }
+
+
+def _replay_journal(links, journal_path):
+    """
+    Apply the increment records of a journal to a links dictionary.
+
+    Each line is a compact `[url, delta_0, delta_1]` record. A line that fails to
+    parse can only be the tail of a write interrupted by a crash, so it is skipped.
+    """
+    try:
+        with open(journal_path, "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        return links
+
+    for line in data.splitlines():
+        try:
+            url, d0, d1 = orjson.loads(line)
+        except (orjson.JSONDecodeError, ValueError, TypeError):
+            logging.warning(f"Skipping damaged record in {journal_path}")
+            continue
+        c0, c1 = links.get(url, (0, 0))
+        links[url] = (c0 + d0, c1 + d1)
+    return links
+
+
+def read_links(links_fn, directory="resources"):
+    """
+    Read a links collection without modifying it on disk.
+
+    Args:
+        links_fn: Base name of the collection (`resources/<links_fn>.json`).
+        directory: Directory holding the collection.
+
+    Returns:
+        The links dictionary, built from the snapshot plus any journaled increments.
+    """
+    paths = _paths(links_fn, directory)
+
+    # A pending snapshot is only committed once the rotated journal is gone
+    snapshot = paths["snapshot"]
+    if os.path.exists(paths["pending"]) and not os.path.exists(paths["rotated"]):
+        snapshot = paths["pending"]
+
+    try:
+        with open(snapshot, "rb") as f:
+            links = orjson.loads(f.read())
+    except FileNotFoundError:
+        links = {}
+
+    _replay_journal(links, paths["rotated"])
+    _replay_journal(links, paths["journal"])
+    return links
+
+
+class LinkStore:
+    """
+    Journaled store for a links collection.
+
+    Increments are appended to `resources/<name>.journal` instead of rewriting the
+    whole snapshot, and are folded into `resources/<name>.json` by compaction.
+
+    Compaction rotates the journal to `<name>.journal.1`, writes the new snapshot to
+    `<name>.json.tmp` and then deletes the rotated journal; that deletion is the
+    commit point, after which the pending snapshot replaces the old one. A crash at
+    any step leaves files that `read_links` resolves without losing or double
+    counting increments.
+    """
+
+    def __init__(self, links_fn, directory="resources"):
+        self.links_fn = links_fn
+        self.directory = directory
+        self.paths = _paths(links_fn, directory)
+        self.links = {}
+        self.pending = []
+
+        self.lock = threading.Lock()
+        self.compaction = None
+        self.journal = None
+
+    def load(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self._recover()
+        self.links = read_links(self.links_fn, self.directory)
+        if not self.links:
+            logging.info(f"No {self.links_fn}.json found, creating anew!")
+
+        self.journal = open(self.paths["journal"], "ab")
+
+        # Fold journals left over from a previous session into the snapshot
+        if os.path.exists(self.paths["rotated"]):
+            self.compact(background=False)
+        if self.journal.tell() > 0:
+            self.compact(background=False)
+        return self.links
+
+    def _recover(self):
+        """Finish or roll back a compaction interrupted by a crash."""
+        pending, rotated = self.paths["pending"], self.paths["rotated"]
+        if os.path.exists(pending):
+            if os.path.exists(rotated):
+                os.remove(pending)
+            else:
+                os.replace(pending, self.paths["snapshot"])
+
+        # Drop the torn tail of an interrupted append so new records start cleanly
+        journal = self.paths["journal"]
+        if os.path.exists(journal):
+            with open(journal, "rb+") as f:
+                data = f.read()
+                if data and not data.endswith(b"\n"):
+                    f.truncate(data.rfind(b"\n") + 1)
+
+    def increment(self, url, d0, d1):
+        with self.lock:
+            c0, c1 = self.links.get(url, (0, 0))
+            self.links[url] = (c0 + d0, c1 + d1)
+            self.pending.append(orjson.dumps([url, d0, d1]) + b"\n")
+
+    def flush(self):
+        """Append pending increments to the journal, compacting if it grew too large."""
+        with self.lock:
+            if self.pending:
+                self.journal.write(b"".join(self.pending))
+                self.journal.flush()
+                os.fsync(self.journal.fileno())
+                self.pending.clear()
+            journal_size = self.journal.tell()
+
+        if journal_size > COMPACT_THRESHOLD:
+            self.compact()
+
+    def compact(self, background=True):
+        if self.compaction is not None and self.compaction.is_alive():
+            if background:
+                return
+            self.compaction.join()
+
+        with self.lock:
+            if self.pending:
+                self.journal.write(b"".join(self.pending))
+                self.pending.clear()
+            self.journal.flush()
+
+            if os.path.exists(self.paths["rotated"]):
+                # Left by an interrupted compaction, rebuilt from disk below
+                snapshot = None
+            else:
+                self.journal.close()
+                os.replace(self.paths["journal"], self.paths["rotated"])
+                self.journal = open(self.paths["journal"], "ab")
+                # The copy matches the old snapshot plus every rotated increment
+                snapshot = dict(self.links)
+
+        if background:
+            self.compaction = threading.Thread(
+                target=self._write_snapshot, args=(snapshot,), daemon=True
+            )
+            self.compaction.start()
+        else:
+            self._write_snapshot(snapshot)
+
+    def _write_snapshot(self, snapshot):
+        if snapshot is None:
+            try:
+                with open(self.paths["snapshot"], "rb") as f:
+                    snapshot = orjson.loads(f.read())
+            except FileNotFoundError:
+                snapshot = {}
+            _replay_journal(snapshot, self.paths["rotated"])
+
+        pending = self.paths["pending"]
+        with open(pending, "wb") as f:
+            f.write(orjson.dumps(snapshot))
+            f.flush()
+            os.fsync(f.fileno())
+
+        os.remove(self.paths["rotated"])
+        os.replace(pending, self.paths["snapshot"])
+
+    def close(self):
+        if self.journal is None:
+            return
+        self.flush()
+        self.compact(background=False)
+        self.journal.close()
+        self.journal = None
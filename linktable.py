@@ -0,0 +1,163 @@
+import argparse
+import logging
+import os
+import re
+
+import numpy as np
+
+from links import _paths, read_links
+
+WATCH_PREFIX = "https://www.youtube.com/watch?v="
+VIDEO_ID = re.compile(rb"[A-Za-z0-9_-]{11}")
+
+
+def _key_of(url):
+    """Video id of a canonical watch URL, or the whole URL for anything else."""
+    key = url.encode()
+    if url.startswith(WATCH_PREFIX) and VIDEO_ID.fullmatch(key, len(WATCH_PREFIX)):
+        return key[len(WATCH_PREFIX) :]
+    return key
+
+
+def _url_of(key):
+    if VIDEO_ID.fullmatch(key):
+        return WATCH_PREFIX + key.decode()
+    return key.decode()
+
+
+def table_path(links_fn, directory="resources"):
+    return os.path.join(directory, f"{links_fn}.npz")
+
+
+class LinkTable:
+    """
+    Links collection in columns: sorted fixed-width keys and int32 counts.
+
+    Keys are the video ids of canonical watch URLs (the whole URL for any other
+    link), so a link costs about 19 bytes instead of a dict entry holding a URL
+    string and a tuple. Lookups bisect the sorted keys. Tables are read-only:
+    the browser counts links in the journaled LinkStore (see links.py) and a table
+    is rebuilt when those files change, so `max_seen` and `max_visit` are computed
+    once on load.
+    """
+
+    def __init__(self, keys, seen, visited):
+        self.keys = keys
+        self.seen = seen
+        self.visited = visited
+        self.max_seen = int(seen.max()) if len(seen) else 0
+        self.max_visit = int(visited.max()) if len(visited) else 0
+
+    def __len__(self):
+        return len(self.keys)
+
+    @classmethod
+    def from_dict(cls, links):
+        """Build a table from a `{url: (seen, visited)}` dictionary."""
+        keys = np.array([_key_of(url) for url in links], dtype=bytes)
+        counts = np.array(list(links.values()), dtype=np.int32).reshape(-1, 2)
+        order = np.argsort(keys, kind="stable")
+        return cls(keys[order], counts[order, 0].copy(), counts[order, 1].copy())
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data["keys"], data["seen"], data["visited"])
+
+    def save(self, path):
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(tmp_path, keys=self.keys, seen=self.seen, visited=self.visited)
+        os.replace(tmp_path, path)
+
+    def url(self, index):
+        return _url_of(self.keys[index])
+
+    def counts(self, index):
+        return int(self.seen[index]), int(self.visited[index])
+
+    def index_of(self, url):
+        """Row of a link, or None if it is not in the table."""
+        key = _key_of(url)
+        index = int(np.searchsorted(self.keys, key))
+        if index < len(self.keys) and self.keys[index] == key:
+            return index
+        return None
+
+    def get(self, url, default=None):
+        index = self.index_of(url)
+        return self.counts(index) if index is not None else default
+
+    def without(self, video_ids):
+        """A copy of the table leaving out the given video ids or URLs."""
+        # Longer keys cannot be in the table, and would be truncated to match
+        width = self.keys.itemsize
+        excluded = [key for key in map(_key_of, video_ids) if len(key) <= width]
+        if not excluded:
+            return self
+        keep = ~np.isin(self.keys, np.array(excluded, dtype=self.keys.dtype))
+        return LinkTable(self.keys[keep], self.seen[keep], self.visited[keep])
+
+    def amplitudes(self):
+        """`link_amplitude` of every link at once."""
+        visited = self.visited > 0
+        base = np.where(visited, self.visited, self.seen).astype(np.float64)
+        interact = np.where(visited, self.max_visit, self.max_seen)
+        interact = np.maximum(2, interact)  # A base of 1 would divide by zero
+        mul_range, mul_min = 0.5, 0.5
+        return np.log(base + 1) / np.log(interact) * mul_range + mul_min
+
+    def to_dict(self):
+        return {
+            self.url(i): (int(s), int(v))
+            for i, (s, v) in enumerate(zip(self.seen, self.visited))
+        }
+
+
+def as_table(links):
+    """Return links as a LinkTable, converting a `{url: (seen, visited)}` dict."""
+    return links if isinstance(links, LinkTable) else LinkTable.from_dict(links)
+
+
+def convert_links(links_fn, directory="resources"):
+    """Write the table of a JSON links collection next to it and return it."""
+    table = LinkTable.from_dict(read_links(links_fn, directory))
+    table.save(table_path(links_fn, directory))
+    return table
+
+
+def load_link_table(links_fn, directory="resources"):
+    """
+    Load a links collection as a LinkTable.
+
+    The `.npz` table is used while it is newer than the JSON snapshot and its
+    journals, and is rebuilt from them otherwise.
+    """
+    path = table_path(links_fn, directory)
+    sources = [p for p in _paths(links_fn, directory).values() if os.path.exists(p)]
+    try:
+        mtime = os.path.getmtime(path)
+        if all(os.path.getmtime(source) <= mtime for source in sources):
+            return LinkTable.load(path)
+    except (OSError, ValueError, KeyError):
+        pass
+
+    logging.info(f"Converting {links_fn}.json to a link table...")
+    try:
+        return convert_links(links_fn, directory)
+    except OSError as e:
+        logging.warning(f"Could not save the link table: {e}")
+        return LinkTable.from_dict(read_links(links_fn, directory))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Convert JSON links collections to compact link tables"
+    )
+    parser.add_argument("links", nargs="+", help="Base names of the collections")
+    parser.add_argument("-d", "--directory", default="resources")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    for links_fn in args.links:
+        table = convert_links(links_fn, args.directory)
+        logging.info(f"{links_fn}: {len(table)} links")
@@ -0,0 +1,123 @@
+import logging
+import math
+
+import numpy as np
+
+from transcode import TrimError, get_backend
+
+# Clips are analysed at a reduced rate; the K-weighting curve is well below Nyquist
+ANALYSIS_RATE = 24000
+# EBU R128 gating blocks are 400ms with 75% overlap, i.e. four 100ms steps
+STEP = 0.1
+STEPS_PER_BLOCK = 4
+ABSOLUTE_GATE = -70.0
+RELATIVE_GATE = -10.0
+
+# Close to the level YouTube normalizes to, so the mix keeps its old loudness
+TARGET_LOUDNESS = -16.0
+MAX_GAIN_DB = 12.0
+PEAK_CEILING = -1.0
+
+# ITU-R BS.1770 K-weighting, a high shelf then a high-pass, as 48 kHz biquads
+K_SHELF = (
+    (1.53512485958697, -2.69169618940638, 1.19839281085285),
+    (1.0, -1.69065929318241, 0.73248077421585),
+)
+K_HIGHPASS = ((1.0, -2.0, 1.0), (1.0, -1.99004745483398, 0.99007225036621))
+K_RATE = 48000
+
+
+def k_weighting(freqs):
+    """Power response of the K-weighting filter at `freqs` Hz."""
+    z_inv = np.exp(-2j * np.pi * np.asarray(freqs) / K_RATE)
+    response = np.ones_like(z_inv)
+    for b, a in (K_SHELF, K_HIGHPASS):
+        response *= np.polyval(b[::-1], z_inv) / np.polyval(a[::-1], z_inv)
+    return np.abs(response) ** 2
+
+
+def _db(power):
+    return 10 * np.log10(np.maximum(power, 1e-12))
+
+
+def analyze(pcm, sr):
+    """
+    Integrated loudness, sample peak and RMS envelope of a clip.
+
+    Loudness follows EBU R128: K-weighted mean square over 400ms blocks, gated at
+    -70 LUFS and then 10 LU below the ungated mean. The K-weighting is applied to
+    the power spectrum of each 100ms step rather than as a time-domain filter, so
+    the whole clip is measured with a handful of vectorized FFTs.
+
+    Args:
+        pcm: Float PCM of shape (channels, frames).
+
+    Returns:
+        A dict with `integrated` (LUFS, None if silent), `peak` (dBFS) and
+        `envelope` (unweighted RMS per 100ms, dBFS), or None if the clip is
+        shorter than one block.
+    """
+    channels = pcm.shape[0]
+    hop = int(sr * STEP)
+    steps = pcm.shape[1] // hop
+    if steps < STEPS_PER_BLOCK:
+        return None
+
+    frames = pcm[:, : steps * hop].reshape(channels, steps, hop)
+    spectrum = np.fft.rfft(frames, axis=-1)
+
+    # Parseval: one-sided bins count twice, except DC and Nyquist
+    bin_scale = np.full(spectrum.shape[-1], 2.0)
+    bin_scale[0] = 1.0
+    if hop % 2 == 0:
+        bin_scale[-1] = 1.0
+    weights = k_weighting(np.fft.rfftfreq(hop, 1 / sr)) * bin_scale
+
+    weighted = (np.abs(spectrum) ** 2 * weights).sum(axis=-1) / hop**2
+    step_power = weighted.sum(axis=0)  # Channels are summed, L/R weighted equally
+    blocks = np.convolve(
+        step_power, np.full(STEPS_PER_BLOCK, 1 / STEPS_PER_BLOCK), "valid"
+    )
+    block_loudness = -0.691 + _db(blocks)
+
+    integrated = None
+    gated = blocks[block_loudness > ABSOLUTE_GATE]
+    if gated.size:
+        relative = -0.691 + _db(gated.mean()) + RELATIVE_GATE
+        gated = blocks[(block_loudness > ABSOLUTE_GATE) & (block_loudness > relative)]
+        integrated = round(float(-0.691 + _db(gated.mean())), 2)
+
+    envelope = _db((frames**2).mean(axis=(0, 2)))
+    return {
+        "integrated": integrated,
+        "peak": round(float(_db(np.abs(pcm).max() ** 2)), 2),
+        "envelope": np.round(envelope, 1).tolist(),
+    }
+
+
+def analyze_path(path, backend_name="ffmpeg"):
+    """
+    Decode and analyze a clip file, or return None if it cannot be decoded.
+
+    Runs in the analysis process pool, away from the audio thread.
+    """
+    try:
+        pcm = get_backend(backend_name).decode(path, ANALYSIS_RATE, 2)
+    except TrimError as e:
+        logging.error(f"✗ Loudness analysis failed: {e}")
+        return None
+    return analyze(pcm, ANALYSIS_RATE)
+
+
+def normalization_gain(stats, target=TARGET_LOUDNESS):
+    """
+    Linear gain bringing a clip to `target` LUFS.
+
+    Boosts are capped at MAX_GAIN_DB and by the headroom below PEAK_CEILING, so
+    quiet clips with loud transients do not clip. Unanalysed and silent clips are
+    left as they are.
+    """
+    if not stats or stats["integrated"] is None:
+        return 1.0
+    gain_db = min(target - stats["integrated"], MAX_GAIN_DB, PEAK_CEILING - stats["peak"])
+    return math.pow(10, gain_db / 20)
@@ -0,0 +1,251 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+
+import orjson
+import yt_dlp
+from yt_dlp.utils import DownloadError
+
+from cache import CACHE_DIR
+
+# Fallback lifetime of a resolved stream URL, in seconds
+STREAM_TTL = 4 * 60 * 60
+# Stream URLs are dropped this long before the expiry they advertise
+EXPIRY_MARGIN = 10 * 60
+# Live results are resolved again after this long, as the stream may have become
+# a normal video since
+LIVE_TTL = 60 * 60
+
+# Use yt-dlp to fetch video info only, no immediate download
+YDL_OPTS = {
+    "format": "bestaudio",
+    "extractaudio": True,
+    "noplaylist": True,
+    "quiet": True,
+    "audioformat": "opus",
+}
+
+# Fragment fields kept for ranged fetches
+FRAGMENT_KEYS = ("url", "path", "duration")
+
+# One YoutubeDL per worker thread, reused across extractions
+_ydl_local = threading.local()
+
+
+def get_ydl():
+    """Return the long-lived YoutubeDL instance of the calling worker thread."""
+    ydl = getattr(_ydl_local, "ydl", None)
+    if ydl is None:
+        ydl = _ydl_local.ydl = yt_dlp.YoutubeDL(YDL_OPTS)
+    return ydl
+
+
+def extract_info_sync(link):
+    try:
+        return get_ydl().extract_info(link, download=False)
+    except DownloadError as e:
+        logging.error(f"✗ DownloadError in extracting info: {e}")
+        return None
+    except Exception as e:
+        logging.error(f"✗ Unexpected error in extracting info: {e}")
+        return None
+
+
+def resolve_link(link):
+    """
+    Resolve a link to its metadata summary, or None if extraction failed.
+
+    Runs in the resolver process pool, so it only returns picklable data.
+    """
+    info_dict = extract_info_sync(link)
+    return summarize_info(info_dict) if info_dict is not None else None
+
+
+def summarize_info(info_dict):
+    """
+    Reduce a yt-dlp info dict to the fields the downloader uses.
+
+    The audio stream is the selected format when it has a direct `url` or,
+    failing that, the first audio-only DASH format.
+    """
+    stream = None
+    if info_dict.get("url"):
+        stream = summarize_stream(info_dict)
+    else:
+        for format_info in info_dict.get("formats", []):
+            if (
+                format_info.get("acodec") != "none"
+                and format_info.get("vcodec") == "none"
+                and format_info.get("url")
+            ):
+                stream = summarize_stream(format_info)
+                break
+
+    return {
+        "duration": info_dict.get("duration"),
+        "is_live": bool(info_dict.get("is_live")),
+        "is_playlist": "entries" in info_dict,
+        "thumbnail": info_dict.get("thumbnail"),
+        "stream": stream,
+    }
+
+
+def summarize_stream(format_info):
+    """
+    Keep what the fetcher needs of a format: its URL, codec and size, and the
+    fragments of fragmented streams, for fetching only part of the stream.
+    """
+    stream = {
+        "url": format_info["url"],
+        "acodec": format_info.get("acodec"),
+        "ext": format_info.get("ext"),
+        "filesize": format_info.get("filesize"),
+        "http_headers": format_info.get("http_headers"),
+    }
+    # Some extractors generate fragments lazily; those are left to ffmpeg
+    fragments = format_info.get("fragments")
+    if isinstance(fragments, list) and fragments:
+        stream["fragment_base_url"] = format_info.get("fragment_base_url")
+        stream["fragments"] = [
+            {key: value for key, value in fragment.items() if key in FRAGMENT_KEYS}
+            for fragment in fragments
+        ]
+    return stream
+
+
+def is_playable(summary, min_dur):
+    duration = summary["duration"]
+    return (
+        not summary["is_playlist"]
+        and not summary["is_live"]
+        and bool(duration)
+        and duration >= min_dur
+    )
+
+
+def stream_expiry(url, now, ttl=STREAM_TTL):
+    """Expiry time of a stream URL, from its `expire` parameter when it has one."""
+    expires = now + ttl
+    try:
+        advertised = int(parse_qs(urlparse(url).query)["expire"][0])
+        expires = min(expires, advertised - EXPIRY_MARGIN)
+    except (KeyError, ValueError):
+        pass
+    return expires
+
+
+class MetadataCache:
+    """
+    SQLite cache of yt-dlp metadata, keyed by video id.
+
+    Stable fields such as the duration are kept permanently. Stream URLs expire,
+    so they live in their own table and are only returned until their expiry. A
+    video found live is only known as such for `live_ttl` seconds.
+    """
+
+    def __init__(
+        self,
+        path=os.path.join(CACHE_DIR, "metadata.sqlite"),
+        ttl=STREAM_TTL,
+        live_ttl=LIVE_TTL,
+    ):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.ttl = ttl
+        self.live_ttl = live_ttl
+        self.hits = 0
+        self.misses = 0
+
+        self.db = sqlite3.connect(path)
+        self.db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS videos (
+                video_id TEXT PRIMARY KEY,
+                duration REAL,
+                is_live INTEGER,
+                is_playlist INTEGER,
+                thumbnail TEXT,
+                updated REAL
+            );
+            CREATE TABLE IF NOT EXISTS streams (
+                video_id TEXT PRIMARY KEY,
+                stream BLOB,
+                expires REAL
+            );
+            """
+        )
+
+    def get(self, video_id, now=None):
+        """
+        Return the cached summary of a video, or None if it was never resolved or
+        was live when last resolved over `live_ttl` ago.
+
+        The `stream` field is None when the stream URL is missing or expired.
+        """
+        now = time.time() if now is None else now
+        row = self.db.execute(
+            "SELECT duration, is_live, is_playlist, thumbnail FROM videos"
+            " WHERE video_id = ? AND NOT (is_live AND updated <= ?)",
+            (video_id, now - self.live_ttl),
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+
+        stream_row = self.db.execute(
+            "SELECT stream FROM streams WHERE video_id = ? AND expires > ?",
+            (video_id, now),
+        ).fetchone()
+        if stream_row is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+
+        duration, is_live, is_playlist, thumbnail = row
+        return {
+            "duration": duration,
+            "is_live": bool(is_live),
+            "is_playlist": bool(is_playlist),
+            "thumbnail": thumbnail,
+            "stream": orjson.loads(stream_row[0]) if stream_row else None,
+        }
+
+    def put(self, video_id, summary, now=None):
+        now = time.time() if now is None else now
+        with self.db:
+            self.db.execute(
+                "INSERT OR REPLACE INTO videos VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    video_id,
+                    summary["duration"],
+                    summary["is_live"],
+                    summary["is_playlist"],
+                    summary["thumbnail"],
+                    now,
+                ),
+            )
+            if stream := summary["stream"]:
+                self.db.execute(
+                    "INSERT OR REPLACE INTO streams VALUES (?, ?, ?)",
+                    (
+                        video_id,
+                        orjson.dumps(stream),
+                        stream_expiry(stream["url"], now, self.ttl),
+                    ),
+                )
+
+    def unplayable_ids(self, min_dur, now=None):
+        """Ids of resolved videos that `is_playable` rejects, but recent live ones."""
+        now = time.time() if now is None else now
+        rows = self.db.execute(
+            "SELECT video_id FROM videos WHERE CASE WHEN is_live THEN updated > ?"
+            " ELSE is_playlist OR duration IS NULL OR duration = 0 OR duration < ?"
+            " END",
+            (now - self.live_ttl, min_dur),
+        )
+        return [video_id for (video_id,) in rows]
+
+    def close(self):
+        self.db.close()
@@ -0,0 +1,172 @@
+import asyncio
+import bisect
+import itertools
+import logging
+import time
+
+import orjson
+from aiohttp import web
+
+
+class LoopLagMonitor:
+    """
+    Measure event-loop lag as the overshoot of a periodic short sleep.
+
+    A loop that is free to run wakes up on time; anything blocking it shows up as
+    lag on the next wake-up.
+    """
+
+    def __init__(self, interval=0.1):
+        self.interval = interval
+        self.last = 0.0
+        self.max = 0.0
+        self.samples = 0
+        self.task = None
+
+    def start(self):
+        self.task = asyncio.create_task(self.run())
+        return self.task
+
+    def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            before = loop.time()
+            await asyncio.sleep(self.interval)
+            self.last = max(0.0, loop.time() - before - self.interval)
+            self.max = max(self.max, self.last)
+            self.samples += 1
+
+
+# Upper bounds of the latency histogram buckets, in seconds
+LATENCY_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+METRIC_PREFIX = "cacophony_"
+
+
+class Histogram:
+    """Counts of observed values per bucket, as in Prometheus histograms."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """`(upper bound, count of values up to it)` pairs, ending with +Inf."""
+        bounds = [*map(str, self.buckets), "+Inf"]
+        return list(zip(bounds, itertools.accumulate(self.counts)))
+
+
+class MetricsRegistry:
+    """
+    Metrics read on demand from the objects that already keep them.
+
+    Each metric is a callable, only called when the metrics are scraped or
+    snapshotted, so leaving metrics on costs nothing on the audio and download
+    paths. A callable returns a number (or a Histogram), or a dict of them keyed
+    by the value of the metric's `label`.
+    """
+
+    def __init__(self, prefix=METRIC_PREFIX):
+        self.prefix = prefix
+        self.metrics = []
+        self.port = None  # Port `serve` listens on, once started
+
+    def add(self, name, kind, help, collect, label=None):
+        self.metrics.append((self.prefix + name, kind, help, collect, label))
+
+    def gauge(self, name, help, collect, label=None):
+        self.add(name, "gauge", help, collect, label)
+
+    def counter(self, name, help, collect, label=None):
+        self.add(name, "counter", help, collect, label)
+
+    def histogram(self, name, help, collect, label=None):
+        self.add(name, "histogram", help, collect, label)
+
+    def _collect(self):
+        for name, kind, help, collect, label in self.metrics:
+            try:
+                value = collect()
+            except Exception as e:
+                logging.debug(f"Metric {name} failed: {e}")
+                continue
+            if value is None:
+                continue
+            values = value if label is not None else {None: value}
+            yield name, kind, help, label, values
+
+    def prometheus(self):
+        """Render all metrics in the Prometheus text exposition format."""
+        lines = []
+        for name, kind, help, label, values in self._collect():
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for label_value, value in values.items():
+                labels = [] if label is None else [f'{label}="{label_value}"']
+                if kind == "histogram":
+                    for bound, count in value.cumulative():
+                        bucket_labels = ",".join([*labels, f'le="{bound}"'])
+                        lines.append(f"{name}_bucket{{{bucket_labels}}} {count}")
+                    suffix = f"{{{','.join(labels)}}}" if labels else ""
+                    lines.append(f"{name}_sum{suffix} {value.sum}")
+                    lines.append(f"{name}_count{suffix} {value.count}")
+                else:
+                    suffix = f"{{{','.join(labels)}}}" if labels else ""
+                    lines.append(f"{name}{suffix} {float(value)}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        """All metrics as a JSON-friendly dict; histograms keep their count and sum."""
+        snapshot = {}
+        for name, kind, _, label, values in self._collect():
+            if kind == "histogram":
+                values = {
+                    key: {"count": value.count, "sum": value.sum}
+                    for key, value in values.items()
+                }
+            else:
+                values = {key: float(value) for key, value in values.items()}
+            snapshot[name] = values if label is not None else values[None]
+        return snapshot
+
+    async def serve(self, host="127.0.0.1", port=9108):
+        """
+        Serve the metrics on `http://host:port/metrics` until cancelled.
+
+        Port 0 picks a free port, which is then found in `port`.
+        """
+        async def handle(request):
+            return web.Response(
+                text=self.prometheus(), content_type="text/plain", charset="utf-8"
+            )
+
+        app = web.Application()
+        app.router.add_get("/metrics", handle)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        self.port = runner.addresses[0][1]
+        logging.info(f"Metrics on http://{host}:{self.port}/metrics")
+        try:
+            await asyncio.Event().wait()
+        finally:
+            self.port = None
+            await runner.cleanup()
+
+    async def write_snapshots(self, path, interval=10.0):
+        """Append a snapshot to the JSONL file at `path` every `interval` seconds."""
+        with open(path, "ab") as f:
+            while True:
+                await asyncio.sleep(interval)
+                f.write(orjson.dumps({"time": time.time(), **self.snapshot()}) + b"\n")
+                f.flush()
@@ -0,0 +1,143 @@
+import asyncio
+import logging
+from time import monotonic
+
+from metrics import Histogram
+
+
+class Stage:
+    """
+    A pool of workers applying one async step to the items of a bounded queue.
+
+    A step returns the item to hand to the next stage, or None to drop it.
+    """
+
+    def __init__(self, name, step, size=1, maxsize=0):
+        self.name = name
+        self.step = step
+        self.size = size
+        self.queue = asyncio.Queue(maxsize or size)
+        self.workers = []
+
+        self.busy = 0
+        self.processed = 0
+        self.dropped = 0
+        self.failed = 0
+        self.busy_time = 0.0
+        self.latency = Histogram()
+        self.started = monotonic()
+
+    def stats(self):
+        elapsed = max(monotonic() - self.started, 1e-9)
+        return {
+            "workers": self.size,
+            "depth": self.queue.qsize(),
+            "busy": self.busy,
+            "processed": self.processed,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "throughput": self.processed / elapsed,
+            "mean_latency": self.busy_time / self.processed if self.processed else 0.0,
+        }
+
+
+class Pipeline:
+    """
+    Chain of stages, each with its own worker pool, feeding a final sink.
+
+    Items move from stage to stage through bounded queues, so a slow stage holds
+    back the ones before it instead of piling up work.
+    """
+
+    def __init__(self, stages, sink, on_drop=None):
+        self.stages = stages
+        self.sink = sink
+        self.on_drop = on_drop
+
+    def start(self):
+        for index, stage in enumerate(self.stages):
+            stage.started = monotonic()
+            for _ in range(stage.size):
+                stage.workers.append(asyncio.create_task(self._work(index)))
+
+    async def put(self, item):
+        await self.stages[0].queue.put(item)
+
+    async def _work(self, index):
+        stage = self.stages[index]
+        forward = (
+            self.stages[index + 1].queue.put
+            if index + 1 < len(self.stages)
+            else self.sink
+        )
+
+        while True:
+            item = await stage.queue.get()
+            stage.busy += 1
+            started = monotonic()
+            result = None
+            try:
+                result = await stage.step(item)
+            except Exception as e:
+                logging.error(f"✗ Error in {stage.name} stage: {e}")
+                stage.failed += 1
+            finally:
+                stage.busy -= 1
+                elapsed = monotonic() - started
+                stage.busy_time += elapsed
+                stage.latency.observe(elapsed)
+
+            try:
+                if result is None:
+                    stage.dropped += 1
+                    if self.on_drop is not None:
+                        await self.on_drop(item)
+                else:
+                    stage.processed += 1
+                    await forward(result)
+            finally:
+                stage.queue.task_done()
+
+    async def join(self):
+        """Wait until every queued item has passed through all stages."""
+        for stage in self.stages:
+            await stage.queue.join()
+
+    async def close(self):
+        workers = [worker for stage in self.stages for worker in stage.workers]
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+    def stats(self):
+        return {stage.name: stage.stats() for stage in self.stages}
+
+    def register_metrics(self, registry):
+        def per_stage(read):
+            return lambda: {stage.name: read(stage) for stage in self.stages}
+
+        registry.gauge(
+            "stage_queue_depth",
+            "Items waiting for a stage",
+            per_stage(lambda stage: stage.queue.qsize()),
+            label="stage",
+        )
+        registry.gauge(
+            "stage_busy_workers",
+            "Workers of a stage processing an item",
+            per_stage(lambda stage: stage.busy),
+            label="stage",
+        )
+        for outcome in ("processed", "dropped", "failed"):
+            registry.counter(
+                f"stage_{outcome}_total",
+                f"Items a stage {outcome}",
+                per_stage(lambda stage, outcome=outcome: getattr(stage, outcome)),
+                label="stage",
+            )
+        registry.histogram(
+            "stage_latency_seconds",
+            "Time a stage spent on an item",
+            per_stage(lambda stage: stage.latency),
+            label="stage",
+        )
@@ -4,33 +4,111 @@ from __future__ import unicode_literals
 
 import argparse
 import asyncio
+import functools
 import io
 import logging
-import math
 import os
 import random
 import time
 
-import orjson
-from pyo import EQ, Adsr, Pan, Server, SfPlayer, STRev, sndinfo
-
-from downloader import choose_media
-from visual import display_thumbnail
-
-logging.basicConfig(level=logging.INFO, format="%(message)s")
+from pyo import (
+    EQ,
+    Adsr,
+    CallAfter,
+    DataTable,
+    Freeverb,
+    Mix,
+    Mixer,
+    Pan,
+    Server,
+    SfPlayer,
+    STRev,
+    TableRead,
+    sndinfo,
+)
+
+from cache import CACHE_DIR, ClipCache
+from downloader import STAGE_SIZES, choose_media
+from failures import FailureIndex
+from linkindex import LinkIndex
+from loudness import normalization_gain
+from metadata import MetadataCache
+from metrics import LoopLagMonitor, MetricsRegistry
+from prefetch import PrefetchController
+from runtime_logger import setup_root_logger
+from samples import SamplePool
+from sampler import link_amplitude
+from scheduler import FakeClock, Scheduler, SystemClock, voice_policy
+from speakers import SPEAKER_LAYOUTS, SpeakerLayout
+from transcode import BACKENDS, get_backend
+from voices import STEAL_POLICIES, VoiceAllocator, steal_oldest
+from visual import (
+    close_session,
+    display_thumbnail,
+    get_thumbnail_cache,
+    stop_renderer,
+)
+
+setup_root_logger()
+
+# Level of the shared reverb mixed back into the buses
+REVERB_SEND = 0.5
+
+# Clip types picked up from the source directory when rendering
+RENDER_EXTENSIONS = (".opus", ".ogg", ".wav", ".flac", ".aif", ".aiff")
+
+
+def sound_duration(path):
+    try:
+        file_info = sndinfo(path, raise_on_failure=True)
+        return file_info[1]
+    except Exception as e:
+        logging.error(f"Error getting sound info: {e}")
+        return None
 
 
 class AudioPlayer:
-    def __init__(self, player_count, min_duration, max_duration, source_dir):
+    def __init__(
+        self,
+        player_count,
+        min_duration,
+        max_duration,
+        source_dir,
+        switch_policy=voice_policy,
+        clock=None,
+        preload_bytes=0,
+        audio="portaudio",
+        seed=None,
+        backend=None,
+        steal_policy=steal_oldest,
+        topology="voice",
+        buses=4,
+        speakers=None,
+        clip_cache=None,
+    ):
         # Input parameters
         self.player_count = player_count
         self.min_duration = min_duration
         self.max_duration = max_duration
         self.source_dir = source_dir
 
-        # Queues
+        # Scheduling
+        self.switch_policy = switch_policy
+        self.clock = clock or SystemClock()
+        self.rng = random.Random(seed)
+
+        # Queues, clips are played from q_ready (q_dl itself unless preloading)
         self.q_dl = asyncio.Queue()
         self.q_pyo = asyncio.Queue()
+        self.q_ready = asyncio.Queue(maxsize=4) if preload_bytes else self.q_dl
+
+        # Decoded sample pool, used instead of streaming from disk when preloading
+        self.preload_bytes = preload_bytes
+        self.backend = backend
+        self.sample_pool = None
+
+        # Cache the queued clips are pinned in, until they are taken off the queue
+        self.clip_cache = clip_cache
 
         # Sound queue and related properties
         self.sound_queue = []
@@ -40,76 +118,213 @@ class AudioPlayer:
         # Audio properties
         self.adsrs = []
         self.players = []
-        self.panners = []
+        self.voice_outs = []
         self.pan_vals = []
         self.verbs = None
         self.eq = None
-        self.currently_playing = {}
+
+        # "voice" pans and reverbs every voice, "bus" sums voices into pan zones
+        self.topology = topology
+        self.buses = buses
+        self.bus_objects = []
+
+        # Speakers, more than two are panned to through a single Mixer
+        self.speakers = speakers or SpeakerLayout.parse("stereo")
+        self.mixer = None
+        self.voices = VoiceAllocator(player_count, policy=steal_policy, rng=self.rng)
 
         # Server properties
-        self.server = Server(nchnls=2, buffersize=1024, duplex=0)
+        self.server = Server(
+            nchnls=self.speakers.channels, buffersize=1024, duplex=0, audio=audio
+        )
+        if preload_bytes:
+            # Created before boot so downloads can hand decoded clips over early
+            self.sample_pool = SamplePool(
+                self.server.getSamplingRate(),
+                max_bytes=preload_bytes,
+                backend=backend,
+            )
 
         # Tracking properties
         self.max_seen = 0
         self.max_visit = 0
 
-    def load_links(self, filename):
-        with open(filename, "rb") as f:
-            link_dict = orjson.loads(f.read())
-        value_list = list(link_dict.values())
-        self.max_seen = max(i for i, _ in value_list)
-        self.max_visit = max(i for _, i in value_list)
-        return link_dict
+    def ready_count(self):
+        """Number of downloaded clips waiting to be played."""
+        ready = self.q_dl.qsize()
+        if self.q_ready is not self.q_dl:
+            ready += self.q_ready.qsize()
+        return ready
+
+    def active_voices(self):
+        return self.voices.busy(self.clock.time())
+
+    def register_metrics(self, registry):
+        registry.gauge(
+            "queue_depth",
+            "Items waiting in the player's queues",
+            lambda: {
+                "download": self.q_dl.qsize(),
+                "ready": self.q_ready.qsize() if self.q_ready is not self.q_dl else 0,
+                "playback": self.q_pyo.qsize(),
+            },
+            label="queue",
+        )
+        registry.gauge("active_voices", "Voices playing a sound", self.active_voices)
+        registry.gauge("voices", "Voices of the player", lambda: self.player_count)
+        # The pyo server runs in this process, so its audio thread counts here
+        registry.counter(
+            "process_cpu_seconds_total",
+            "CPU time of the process, including the pyo audio thread",
+            time.process_time,
+        )
+        if self.sample_pool is not None:
+            registry.gauge(
+                "sample_pool_bytes",
+                "Decoded audio held in the sample pool",
+                lambda: self.sample_pool.size,
+            )
+
+    def load_links(self, links_fns, **query):
+        """
+        Merge one or more link collections and select links from them.
+
+        Keyword arguments are passed to `LinkIndex.query`.
+        """
+        index = LinkIndex.merge(links_fns)
+        logging.info(f"Links per collection: {index.stats()}")
+        links = index.query(**query)
+        self.max_seen = links.max_seen
+        self.max_visit = links.max_visit
+        return links
 
     def setup_audio_environment(self):
         self.server.deactivateMidi()
         self.server.boot()
         logging.info("Player on!")
 
-        # Create players, panners, and set up effects
-        for i in range(self.player_count):
-            pan_val = i / self.player_count + (1 / (2 * self.player_count))
-            pan_val = pan_val * 0.8
+        if self.sample_pool is not None:
+            silence = DataTable(size=1, chnls=2)
 
-            self.pan_vals.append(pan_val)
+        multichannel = self.speakers.channels > 2
+        self.pan_vals = self.speakers.voice_positions(self.player_count).tolist()
 
+        # Create players, panners, and set up effects
+        for i in range(self.player_count):
             # Fade in/out
             adsr = Adsr(attack=0.75, decay=0, sustain=1, release=3)
             self.adsrs.append(adsr)
 
             # Player
-            player = SfPlayer(self.source_dir + "empty.wav", speed=1, mul=self.adsrs[i])
+            if self.sample_pool is not None:
+                player = TableRead(silence, freq=silence.getRate(), mul=self.adsrs[i])
+            else:
+                player = SfPlayer(
+                    self.source_dir + "empty.wav", speed=1, mul=self.adsrs[i]
+                )
             self.players.append(player)
 
-            # Panner
-            panner = Pan(self.players[i], outs=2, pan=self.pan_vals[i], spread=0.15)
-            self.panners.append(panner)
+            if self.topology == "voice" and not multichannel:
+                # Panner
+                voice_out = Pan(
+                    self.players[i], outs=2, pan=self.pan_vals[i], spread=0.15
+                )
+            else:
+                # Only the voice's gain, panning happens on its bus or the mixer
+                voice_out = Mix(self.players[i], voices=1)
+            self.voice_outs.append(voice_out)
+        self.voices.set_pans(self.pan_vals)
+
+        if multichannel:
+            self.setup_speakers()
+        elif self.topology == "voice":
+            self.verbs = STRev(
+                self.voice_outs,
+                inpos=self.pan_vals,
+                revtime=2.1,
+                cutoff=6000,
+                bal=0.5,
+                roomSize=3,
+                firstRefGain=-18,
+            )
+            self.setup_eq(self.verbs)
+        else:
+            self.setup_buses()
+
+    def setup_eq(self, source):
+        """
+        Cut common mid-range and lowend.
+
+        Both stages go out, the mid cut summed with its low-cut copy, so every
+        topology sounds as the per-voice one always has.
+        """
+        self.eq = EQ(source, freq=1000, boost=-4.0, type=0).out()
+        self.eq = EQ(self.eq, freq=120, boost=-12.0, type=1).out()
+
+    def setup_buses(self):
+        """
+        Sum voices into pan-zone buses sharing one reverb send and one EQ.
+
+        Voices are grouped by pan position into `buses` zones. Each zone is panned
+        once, the zones are summed to a stereo master and a single stereo reverb
+        is mixed back in, so the effects cost the same whatever the voice count.
+        """
+        zone_mixes, zone_positions = self.zone_mixes()
+        zone_pans = Pan(zone_mixes, outs=2, pan=zone_positions, spread=0.15)
+        master = Mix(zone_pans, voices=2)
 
+        # One reverb per output channel instead of one per voice
         self.verbs = STRev(
-            self.panners,
-            inpos=self.pan_vals,
+            master,
+            inpos=[0.0, 1.0],
             revtime=2.1,
             cutoff=6000,
-            bal=0.5,
+            bal=1.0,
             roomSize=3,
             firstRefGain=-18,
+            mul=REVERB_SEND,
         )
-
-        # Cut common mid-range and lowend
-        self.eq = EQ(self.verbs, freq=1000, boost=-4.0, type=0).out()
-        self.eq = EQ(self.eq, freq=120, boost=-12.0, type=1).out()
-
-    def get_available_player(self):
-        available_players = [
-            p for p in range(self.player_count) if p not in self.currently_playing
-        ]
-
-        if available_players:
-            return random.choice(available_players)
-
-        # If no available players, get the player with the oldest end time
-        oldest_player = min(self.currently_playing, key=self.currently_playing.get)
-        return oldest_player
+        mix = Mix([master, Mix(self.verbs, voices=2)], voices=2)
+        self.setup_eq(mix)
+        self.bus_objects = [zone_mixes, zone_pans, master, mix]
+
+    def zone_mixes(self):
+        """Mono mixes of the voices of each pan zone, and the zones' positions."""
+        zones = max(1, min(self.buses, self.player_count))
+        zone_voices = [[] for _ in range(zones)]
+        for i, voice_out in enumerate(self.voice_outs):
+            zone_voices[i * zones // self.player_count].append(voice_out)
+
+        zone_mixes = [Mix(voice_outs, voices=1) for voice_outs in zone_voices]
+        return zone_mixes, self.speakers.voice_positions(zones).tolist()
+
+    def setup_speakers(self):
+        """
+        Pan voices, or the pan-zone buses, to every speaker through one Mixer.
+
+        The gains of all sources are computed at once as a matrix by the speaker
+        layout and set on the mixer, which sums its inputs into one stream per
+        speaker. Reverb and EQ then run once per speaker.
+        """
+        if self.topology == "bus":
+            sources, positions = self.zone_mixes()
+            self.bus_objects = [sources]
+        else:
+            sources, positions = self.voice_outs, self.pan_vals
+        gains = self.speakers.pan_gains(positions)
+
+        channels = self.speakers.channels
+        self.mixer = Mixer(outs=channels, chnls=1)
+        for source, source_gains in enumerate(gains):
+            self.mixer.addInput(source, sources[source])
+            for channel, gain in enumerate(source_gains):
+                self.mixer.setAmp(source, channel, float(gain))
+
+        # A Mixer is not a PyoObject, its outputs are passed on as streams. Freeverb
+        # is mono in, mono out, so every speaker keeps its own reverb
+        speaker_outs = [self.mixer[channel][0] for channel in range(channels)]
+        self.verbs = Freeverb(speaker_outs, size=0.8, damp=0.5, bal=0.5)
+        self.setup_eq(self.verbs)
 
     def play_audio(self):
         self.server.start()
@@ -119,83 +334,139 @@ class AudioPlayer:
         logging.info("Shutting down...")
         self.server.stop()
         self.server.shutdown()
+        stop_renderer()
 
-    async def pyo_look(self):
-        def handle_sound_info(output):
-            try:
-                file_info = sndinfo(output, raise_on_failure=True)
-                return file_info[1]
-            except Exception as e:
-                logging.error(f"Error getting sound info: {e}")
-                return None
+    def start_voice(self, player, sound_path, dur, speed, amp, sample=None):
+        """Start a sound on a voice and return its duration at the given speed."""
+        self.voice_outs[player].set("mul", 0, 0.5)  # Fading old sound
 
-        def calculate_amplitude(seen, visited):
-            # Ensuring base for logarithm is always greater than 1
-            base, interact = (
-                (seen, self.max_seen) if visited == 0 else (visited, self.max_visit)
-            )
-            interact = max(1, interact)  # Catch in case
-            mul_range, mul_min = 0.5, 0.5
+        if sample is not None:
+            self.players[player].setTable(sample.table)
+            self.players[player].setFreq(sample.table.getRate() * speed)
+        else:
+            self.players[player].setPath(sound_path)
+            self.players[player].setSpeed(speed)
+        new_dur = dur / abs(speed)
 
-            return (math.log(base + 1, interact) * mul_range) + mul_min
+        self.adsrs[player].setDur(new_dur)
+        # Release dependent on duration
+        self.adsrs[player].setRelease(new_dur * 0.25)
 
-        if self.q_dl.empty():
-            print(".", end="", flush=True)
-            return
+        self.voice_outs[player].set(attr="mul", value=amp, port=0.5)
 
-        self.sound_queue.append(await self.q_dl.get())
-        sound_path, seen, visited, _, thumb_data, info_dict = self.sound_queue.pop()
-        player = self.get_available_player()
+        self.players[player].play()
+        self.adsrs[player].play()
+        return new_dur
 
-        if not os.path.exists(sound_path):
-            logging.warning(f"File does not exist: {sound_path}")
-            return
+    def release_clip(self, sound_path):
+        """Let the clip cache evict a clip once it is no longer queued."""
+        if self.clip_cache is not None:
+            self.clip_cache.unpin(sound_path)
 
-        self.panners[player].set("mul", 0, 0.5)  # Fading old sound
+    async def pyo_look(self, item):
+        def calculate_amplitude(seen, visited):
+            amp = link_amplitude(seen, visited, self.max_seen, self.max_visit)
+            # Even out the levels of clips before weighting them by their links
+            return amp * normalization_gain(info_dict.get("loudness"))
 
-        if (dur := handle_sound_info(sound_path)) is None:
+        self.sound_queue.append(item)
+        sound_path, seen, visited, _, thumb_data, info_dict = self.sound_queue.pop()
+        player = self.voices.allocate(self.clock.time())
+
+        sample = None
+        if self.sample_pool is not None:
+            if (sample := self.sample_pool.get(sound_path)) is None:
+                logging.warning(f"Sample was evicted: {sound_path}")
+                self.release_clip(sound_path)
+                return
+            self.sample_pool.assign(player, sound_path)
+            dur = sample.duration
+        elif not os.path.exists(sound_path):
+            logging.warning(f"File does not exist: {sound_path}")
+            self.release_clip(sound_path)
+            return
+        elif (dur := sound_duration(sound_path)) is None:
+            self.release_clip(sound_path)
             return False
-        self.last_duration = dur
 
-        stop_event = asyncio.Event()
+        self.last_duration = dur
 
         async def switch_sound():
-            self.players[player].setPath(sound_path)
-            rand_speed = random.uniform(0.75, 1.25)
-            self.players[player].setSpeed(rand_speed)
-            logging.info(f"Playback: {rand_speed}")
-            new_dur = dur / abs(rand_speed)
-
-            self.adsrs[player].setDur(new_dur)
-            # Release dependent on duration
-            self.adsrs[player].setRelease(new_dur * 0.25)
-
+            rand_speed = self.rng.uniform(0.75, 1.25)
             amp = calculate_amplitude(seen, visited)
-            self.panners[player].set(attr="mul", value=amp, port=0.5)
+            try:
+                new_dur = self.start_voice(
+                    player, sound_path, dur, rand_speed, amp, sample
+                )
+            finally:
+                # The player has the file open, or its samples in memory
+                self.release_clip(sound_path)
+            logging.info(f"Playback: {rand_speed}")
             logging.info(f"Amp: {amp}")
-            logging.info(f"Pan: {self.panners[player]._pan}")
-
-            self.players[player].play()
-            self.adsrs[player].play()
+            logging.info(f"Pan: {self.pan_vals[player]}")
 
             # Play audio file
             await self.q_pyo.put((sound_path, player))
 
-            # Add player and duration when starting sound
-            end_time = time.time() + new_dur
-            self.currently_playing[player] = end_time
+            # The voice is reclaimed once its sound has ended
+            self.voices.start(player, self.clock.time() + new_dur, amp)
 
             # Show thumbnail
-            asyncio.create_task(display_thumbnail(thumb_data, info_dict, stop_event))
+            display_thumbnail(thumb_data, info_dict)
 
         if self.switch and not self.switch.done():
-            stop_event.set()
             await self.switch
 
         self.switch = asyncio.create_task(switch_sound())
         logging.info(f"\n⏵ Now playing on player {player} ({dur}s)")
         return True
 
+    def render(self, sound_paths, out_path, length):
+        """
+        Render `length` seconds of cacophony to a file, faster than realtime.
+
+        Switches are planned up front on a fake clock with the player's seeded RNG
+        and fired from the audio thread, so the same seed renders the same mix.
+
+        Returns:
+            The realtime factor of the render.
+        """
+        durations = {path: sound_duration(path) for path in sound_paths}
+        sound_paths = [path for path in sound_paths if durations[path]]
+        if not sound_paths:
+            raise ValueError("No readable clips to render")
+
+        self.clock = FakeClock()
+        self.setup_audio_environment()
+        self.server.recordOptions(dur=length, filename=out_path, fileformat=0)
+
+        events = []
+        while (now := self.clock.time()) < length:
+            sound_path = self.rng.choice(sound_paths)
+            player = self.voices.allocate(now)
+            speed = self.rng.uniform(0.75, 1.25)
+            amp = self.rng.uniform(0.5, 1.0)
+            dur = durations[sound_path]
+
+            start = functools.partial(
+                self.start_voice, player, sound_path, dur, speed, amp
+            )
+            events.append(CallAfter(start, time=max(now, 0.001)))
+
+            self.voices.start(player, now + dur / speed, amp)
+            self.last_duration = dur
+            self.clock.now = self.switch_policy(self, now)
+
+        logging.info(f"Rendering {len(events)} sounds to {out_path}...")
+        start_time = time.perf_counter()
+        self.server.start()  # Blocks until the offline render is done
+        elapsed = time.perf_counter() - start_time
+        self.server.shutdown()
+
+        realtime_factor = length / elapsed
+        logging.info(f"Rendered {length}s in {elapsed:.2f}s ({realtime_factor:.1f}x)")
+        return realtime_factor
+
     async def run(self):
         try:
             self.setup_audio_environment()
@@ -203,18 +474,13 @@ class AudioPlayer:
         except Exception as e:
             raise Exception("Pyo server couldn't start") from e
 
+        if self.sample_pool is not None:
+            preload_task = asyncio.create_task(
+                self.sample_pool.run(self.q_dl, self.q_ready)
+            )
+
         try:
-            while True:
-                sound_played = await self.pyo_look()
-                if sound_played:
-                    switch_dur = (
-                        (self.last_duration - self.min_duration) / self.max_duration * 4
-                    ) + 2
-                    logging.info(f"Switch duration: {switch_dur}")
-                else:
-                    switch_dur = 0.5
-
-                await asyncio.sleep(switch_dur)  # Wait for the computed interval
+            await Scheduler(self, policy=self.switch_policy).run()
         except KeyboardInterrupt:
             logging.info("Keyboard interrupt received, shutting down...")
             self.shutdown()
@@ -222,10 +488,44 @@ class AudioPlayer:
             logging.error(f"An error occurred: {e}")
             self.shutdown()
         finally:
+            if self.sample_pool is not None:
+                preload_task.cancel()
             if hasattr(self, "process"):
                 self.process.join()
 
 
+def register_metrics(
+    registry, audio_player, prefetch, loop_lag, clip_cache, metadata_cache, failures
+):
+    audio_player.register_metrics(registry)
+    registry.gauge("loop_lag_seconds", "Latest event loop lag", lambda: loop_lag.last)
+    registry.gauge(
+        "loop_lag_max_seconds", "Largest event loop lag", lambda: loop_lag.max
+    )
+    registry.gauge(
+        "prefetch", "Prefetch measurements and targets", prefetch.metrics, label="value"
+    )
+
+    caches = {"metadata": metadata_cache, "thumbnails": get_thumbnail_cache()}
+    if clip_cache is not None:
+        caches["clips"] = clip_cache
+    registry.counter(
+        "cache_hits_total",
+        "Cache lookups served from the cache",
+        lambda: {name: cache.hits for name, cache in caches.items()},
+        label="cache",
+    )
+    registry.counter(
+        "cache_misses_total",
+        "Cache lookups that missed",
+        lambda: {name: cache.misses for name, cache in caches.items()},
+        label="cache",
+    )
+    registry.counter(
+        "failures_recorded_total", "Failed downloads", lambda: failures.recorded
+    )
+
+
 async def main():
     parser = argparse.ArgumentParser()
     parser.add_argument(
@@ -235,28 +535,221 @@ async def main():
         "-l",
         "--links",
         type=str,
-        help="Filename of links to load (base of .json)",
+        nargs="+",
+        help="Filenames of links to load and blend (base of .json)",
+    )
+    parser.add_argument(
+        "--from",
+        dest="sources",
+        type=str,
+        nargs="+",
+        help="Only play links found in these of the loaded collections",
+    )
+    parser.add_argument(
+        "--min-seen", type=int, default=0, help="Only play links seen this often"
+    )
+    parser.add_argument(
+        "--min-visited", type=int, default=0, help="Only play links visited this often"
+    )
+    parser.add_argument(
+        "--skip-failed",
+        action="store_true",
+        help="Leave out videos already known to be unplayable",
+    )
+    parser.add_argument(
+        "-w",
+        "--weighted",
+        action="store_true",
+        help="Favour frequently seen and visited links when choosing media",
+    )
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=2048,
+        help="Size cap of the clip cache in megabytes (0 disables it)",
+    )
+    parser.add_argument(
+        "--preload",
+        type=int,
+        default=0,
+        help="Decode clips into a memory pool of this many megabytes (0 streams)",
+    )
+    parser.add_argument(
+        "--buffer",
+        type=float,
+        default=30,
+        help="Seconds of playback to keep downloaded ahead of the player",
+    )
+    for stage, size in STAGE_SIZES.items():
+        parser.add_argument(
+            f"--{stage}-workers",
+            type=int,
+            default=size,
+            help=f"Number of workers in the {stage} stage of the download pipeline",
+        )
+    parser.add_argument(
+        "--render",
+        type=str,
+        help="Render offline to this file instead of playing in realtime",
+    )
+    parser.add_argument(
+        "--length", type=float, default=600, help="Length of the render in seconds"
+    )
+    parser.add_argument(
+        "--source",
+        type=str,
+        default=os.path.join(CACHE_DIR, "clips"),
+        help="Directory of clips to render from",
+    )
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        default=0,
+        help="Serve Prometheus metrics on this local port (0 disables it)",
+    )
+    parser.add_argument(
+        "--metrics-log",
+        type=str,
+        help="Append periodic JSONL snapshots of the metrics to this file",
     )
+    parser.add_argument(
+        "--metrics-interval",
+        type=float,
+        default=10,
+        help="Seconds between metrics snapshots",
+    )
+    parser.add_argument(
+        "--topology",
+        choices=["voice", "bus"],
+        default="voice",
+        help="Reverb every voice, or sum voices into pan-zone buses sharing effects",
+    )
+    parser.add_argument(
+        "--buses",
+        type=int,
+        default=4,
+        help="Number of pan-zone buses of the bus topology",
+    )
+    parser.add_argument(
+        "--speakers",
+        default="stereo",
+        help=f"Speaker layout, one of {', '.join(SPEAKER_LAYOUTS)} or comma-separated "
+        "azimuths in degrees clockwise from the front, in channel order",
+    )
+    parser.add_argument(
+        "--steal",
+        choices=sorted(STEAL_POLICIES),
+        default="oldest",
+        help="Voice to cut off when all are busy: ending first, quietest or the one "
+        "panned farthest from the last sound",
+    )
+    parser.add_argument(
+        "--decoder",
+        choices=sorted(BACKENDS),
+        default="ffmpeg",
+        help="Trim and decode clips with an ffmpeg process each or in-process (av)",
+    )
+    parser.add_argument("--seed", type=int, help="Seed for speeds and player choice")
     args = parser.parse_args()
+    try:
+        speakers = SpeakerLayout.parse(args.speakers)
+    except ValueError as e:
+        parser.error(str(e))
+    unknown = sorted(set(args.sources or ()) - set(args.links or ()))
+    if unknown:
+        unknown = ", ".join(unknown)
+        parser.error(f"--from names collections not loaded with -l: {unknown}")
+
+    if args.render:
+        audio_player = AudioPlayer(
+            player_count=args.players,
+            min_duration=12,
+            max_duration=36,
+            source_dir="./sounds/",
+            audio="offline",
+            seed=args.seed,
+            steal_policy=STEAL_POLICIES[args.steal],
+            topology=args.topology,
+            buses=args.buses,
+            speakers=speakers,
+        )
+        sound_paths = sorted(
+            os.path.join(args.source, name)
+            for name in os.listdir(args.source)
+            if name.endswith(RENDER_EXTENSIONS)
+        )
+        audio_player.render(sound_paths, args.render, args.length)
+        return
 
+    backend = get_backend(args.decoder)
+    clip_cache = ClipCache(max_bytes=args.cache_size << 20) if args.cache_size else None
     audio_player = AudioPlayer(
         player_count=args.players,
         min_duration=12,
         max_duration=36,
         source_dir="./sounds/",
+        preload_bytes=args.preload << 20,
+        backend=backend,
+        steal_policy=STEAL_POLICIES[args.steal],
+        topology=args.topology,
+        buses=args.buses,
+        speakers=speakers,
+        clip_cache=clip_cache,
+    )
+
+    metadata_cache = MetadataCache()
+    failures = FailureIndex()
+    links = audio_player.load_links(
+        args.links,
+        sources=args.sources,
+        min_seen=args.min_seen,
+        min_visited=args.min_visited,
+        exclude=(
+            metadata_cache.unplayable_ids(audio_player.min_duration)
+            if args.skip_failed
+            else ()
+        ),
     )
+    logging.info(f"Playing from {len(links)} links")
+    prefetch = PrefetchController(audio_player.ready_count, buffer_seconds=args.buffer)
+
+    loop_lag = LoopLagMonitor()
+    loop_lag.start()
 
-    link_dict = audio_player.load_links(f"resources/{args.links}.json")
+    metrics = MetricsRegistry()
+    register_metrics(
+        metrics, audio_player, prefetch, loop_lag, clip_cache, metadata_cache, failures
+    )
+    metrics_tasks = []
+    if args.metrics_port:
+        metrics_tasks.append(asyncio.create_task(metrics.serve(port=args.metrics_port)))
+    if args.metrics_log:
+        metrics_tasks.append(
+            asyncio.create_task(
+                metrics.write_snapshots(args.metrics_log, args.metrics_interval)
+            )
+        )
 
     audio_player_task = asyncio.create_task(audio_player.run())
     download_task = asyncio.create_task(
         choose_media(
-            link_dict,
+            links,
             args.players,
             audio_player.min_duration,
             audio_player.max_duration,
             audio_player.q_dl,
             audio_player.q_pyo,
+            weighted=args.weighted,
+            clip_cache=clip_cache,
+            metadata_cache=metadata_cache,
+            stage_sizes={
+                stage: getattr(args, f"{stage}_workers") for stage in STAGE_SIZES
+            },
+            prefetch=prefetch,
+            backend=backend,
+            sample_pool=audio_player.sample_pool,
+            failures=failures,
+            metrics=metrics,
         )
     )
 
@@ -269,7 +762,15 @@ async def main():
     finally:
         # Wait for the tasks to be cancelled, ignoring any CancelledError exceptions
         await asyncio.gather(audio_player_task, download_task, return_exceptions=True)
+        for task in metrics_tasks:
+            task.cancel()
+        await asyncio.gather(*metrics_tasks, return_exceptions=True)
         audio_player.shutdown()
+        metadata_cache.close()
+        failures.close()
+        await close_session()
+        loop_lag.stop()
+        logging.info(f"Max event loop lag: {loop_lag.max * 1000:.1f}ms")
         logging.info("Shutdown completed.")
 
 
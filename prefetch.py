@@ -0,0 +1,129 @@
+import asyncio
+import math
+from time import monotonic
+
+# Margin over the supply rate measured after the buffer ran dry, to probe demand
+STARVED_GROWTH = 1.25
+
+
+class PrefetchController:
+    """
+    Size download prefetching from how fast the player consumes clips.
+
+    Consumption is measured from the `(sound_path, player)` events the player puts
+    on `q_pyo`, and download latency and success ratio from the pipeline. The
+    controller keeps `buffer_seconds` of playback ready and, by Little's law, enough
+    downloads in flight to refill it as it drains. `ready` returns the number of
+    downloaded clips waiting to be played.
+    """
+
+    def __init__(
+        self,
+        ready,
+        buffer_seconds=30.0,
+        min_in_flight=1,
+        max_in_flight=32,
+        max_ready=64,
+        smoothing=0.2,
+        clock=monotonic,
+    ):
+        self.buffer_seconds = buffer_seconds
+        self.min_in_flight = min_in_flight
+        self.max_in_flight = max_in_flight
+        self.max_ready = max_ready
+        self.smoothing = smoothing
+        self.clock = clock
+        self.ready = ready
+
+        # Priors until measurements come in: a switch every 4s, 10s per download
+        self.clip_rate = 0.25
+        self.latency = 10.0
+        self.success_ratio = 1.0
+
+        self.in_flight = 0
+        self.consumed = 0
+        self.last_consumed = None
+        self.backlogged = False
+        self.changed = asyncio.Condition()
+
+    def _smooth(self, current, sample):
+        return current + self.smoothing * (sample - current)
+
+    def target_ready(self):
+        """Clips to keep downloaded so that `buffer_seconds` of switches are covered."""
+        return max(1, min(self.max_ready, math.ceil(self.buffer_seconds * self.clip_rate)))
+
+    def target_in_flight(self):
+        """Downloads to keep running so the ready buffer refills as fast as it drains."""
+        needed = self.clip_rate * self.latency / max(self.success_ratio, 0.05)
+        return max(self.min_in_flight, min(self.max_in_flight, math.ceil(needed)))
+
+    async def _notify(self):
+        async with self.changed:
+            self.changed.notify_all()
+
+    async def record_consumed(self):
+        now = self.clock()
+        if self.last_consumed is not None:
+            rate = 1.0 / max(now - self.last_consumed, 1e-3)
+            if self.backlogged:
+                self.clip_rate = self._smooth(self.clip_rate, rate)
+            else:
+                # After an empty buffer the interval measures supply, which demand
+                # at least matches, so probe upwards until clips back up again.
+                # Probing goes a step above the measured supply rather than above
+                # the last estimate, so it cannot compound while supply is the limit
+                smoothed = self._smooth(self.clip_rate, rate)
+                self.clip_rate = max(smoothed, rate * STARVED_GROWTH)
+        self.last_consumed = now
+        self.backlogged = self.ready() > 0
+        self.consumed += 1
+        await self._notify()
+
+    def record_started(self):
+        self.in_flight += 1
+
+    async def record_finished(self, latency):
+        """A download reached the ready queue after `latency` seconds."""
+        self.in_flight -= 1
+        self.latency = self._smooth(self.latency, latency)
+        self.success_ratio = self._smooth(self.success_ratio, 1.0)
+        await self._notify()
+
+    async def record_dropped(self):
+        self.in_flight -= 1
+        self.success_ratio = self._smooth(self.success_ratio, 0.0)
+        await self._notify()
+
+    async def wait_for_download_slot(self):
+        async with self.changed:
+            await self.changed.wait_for(
+                lambda: self.in_flight < self.target_in_flight()
+            )
+
+    async def wait_for_ready_slot(self):
+        # Clips dropped by the player send no event, so re-check periodically too
+        while self.ready() >= self.target_ready():
+            try:
+                async with self.changed:
+                    await asyncio.wait_for(self.changed.wait(), 1.0)
+            except asyncio.TimeoutError:
+                pass
+
+    async def watch(self, q_pyo):
+        """Consume the player's playback events to measure consumption."""
+        while True:
+            await q_pyo.get()
+            await self.record_consumed()
+
+    def metrics(self):
+        return {
+            "clip_rate": self.clip_rate,
+            "latency": self.latency,
+            "success_ratio": self.success_ratio,
+            "in_flight": self.in_flight,
+            "ready": self.ready(),
+            "consumed": self.consumed,
+            "target_in_flight": self.target_in_flight(),
+            "target_ready": self.target_ready(),
+        }
@@ -0,0 +1,183 @@
+import asyncio
+import logging
+import os
+from urllib.parse import urljoin
+
+import aiohttp
+
+# Bytes read from the start of a single-file stream for its header and seek index,
+# plus a per-second allowance since the index grows with the duration
+HEAD_BYTES = 256 << 10
+INDEX_BYTES_PER_SECOND = 200
+# Slack around the estimated byte window, for variable bitrates
+RANGE_MARGIN_SECONDS = 10
+RANGE_MARGIN_FRACTION = 0.02
+# Above this fraction of the file a ranged fetch saves too little to be worth it
+MAX_RANGE_FRACTION = 0.5
+CHUNK_SIZE = 64 << 10
+
+MEDIA_TIMEOUT = aiohttp.ClientTimeout(total=120, sock_connect=10, sock_read=30)
+
+# Codec names yt-dlp reports for the streams each output format can hold as is
+FORMAT_CODECS = {"opus": "opus", "ogg": "vorbis", "m4a": "mp4a", "mp3": "mp3"}
+
+
+class RangeError(Exception):
+    """The server did not serve a requested range."""
+
+
+def can_copy(stream, audio_format):
+    """Whether the stream's codec fits the output format without re-encoding."""
+    codec = (stream.get("acodec") or "").split(".")[0]
+    return bool(codec) and codec == FORMAT_CODECS.get(audio_format)
+
+
+def fragment_window(fragments, start, duration):
+    """
+    Pick the fragments covering `duration` seconds from `start`.
+
+    Leading fragments without a duration are initialization segments and always
+    kept. Returns the selected indices and the offset of `start` into the first
+    media fragment, or None if the fragment durations are unknown.
+    """
+    selected = []
+    position = 0.0
+    offset = None
+    end = start + duration
+
+    for index, fragment in enumerate(fragments):
+        fragment_duration = fragment.get("duration")
+        if fragment_duration is None:
+            if offset is not None or position > 0:
+                return None
+            selected.append(index)
+            continue
+
+        if position < end and position + fragment_duration > start:
+            if offset is None:
+                offset = max(0.0, start - position)
+            selected.append(index)
+        position += fragment_duration
+        if position >= end:
+            break
+
+    if offset is None or position < end:
+        return None
+    return selected, offset
+
+
+def byte_window(filesize, total_duration, start, duration):
+    """
+    Estimate the byte ranges holding the clip in a single-file stream.
+
+    The clip's range is interpolated from the average bitrate with some margin,
+    and the head of the file is fetched too for the container's header and seek
+    index. Returns a list of `(first, last)` ranges, inclusive like HTTP ranges,
+    or None if they would cover most of the file anyway.
+    """
+    if not filesize or not total_duration:
+        return None
+
+    rate = filesize / total_duration
+    margin = RANGE_MARGIN_SECONDS * rate + RANGE_MARGIN_FRACTION * filesize
+    low = max(0, int(start * rate - margin))
+    high = min(filesize, int((start + duration) * rate + margin))
+    head = min(filesize, HEAD_BYTES + int(total_duration * INDEX_BYTES_PER_SECOND))
+
+    if low <= head:
+        ranges = [(0, high - 1)]
+    else:
+        ranges = [(0, head - 1), (low, high - 1)]
+
+    if sum(last - first + 1 for first, last in ranges) > MAX_RANGE_FRACTION * filesize:
+        return None
+    return ranges
+
+
+def fragment_url(stream, fragment):
+    if url := fragment.get("url"):
+        return url
+    return urljoin(stream.get("fragment_base_url"), fragment["path"])
+
+
+class RangeFetcher:
+    """
+    Fetch only the part of an audio stream a clip needs, into a local file.
+
+    Fragmented streams (DASH/HLS) are fetched fragment by fragment. Single files
+    with a known size are fetched with HTTP Range requests into a sparse file of
+    the same size, so the container's own index still points at the right bytes.
+    `fetch` returns the local path, the offset of the clip within it and the bytes
+    it fetched, or None when the stream carries too little metadata for either, in
+    which case the caller falls back to letting ffmpeg read the stream URL.
+    `bytes_fetched` totals the bytes of every fetch.
+    """
+
+    def __init__(self):
+        self.session = None
+        self.bytes_fetched = 0
+
+    def get_session(self):
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(timeout=MEDIA_TIMEOUT)
+        return self.session
+
+    async def _get(self, url, headers, first=None, last=None):
+        if first is not None:
+            headers = {**headers, "Range": f"bytes={first}-{last}"}
+        async with self.get_session().get(url, headers=headers) as response:
+            response.raise_for_status()
+            if first is not None and response.status != 206:
+                raise RangeError(f"{response.status} for a range request")
+            chunks = []
+            async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                chunks.append(chunk)
+        data = b"".join(chunks)
+        self.bytes_fetched += len(data)
+        return data
+
+    async def fetch(self, summary, start, duration, path):
+        stream = summary["stream"]
+        headers = stream.get("http_headers") or {}
+
+        if fragments := stream.get("fragments"):
+            window = fragment_window(fragments, start, duration)
+            if window is None:
+                return None
+            indices, offset = window
+            urls = [fragment_url(stream, fragments[index]) for index in indices]
+            parts = await asyncio.gather(*(self._get(url, headers) for url in urls))
+            with open(path, "wb") as file:
+                for part in parts:
+                    file.write(part)
+            return path, offset, sum(map(len, parts))
+
+        filesize = stream.get("filesize")
+        ranges = byte_window(filesize, summary["duration"], start, duration)
+        if ranges is None:
+            return None
+
+        parts = await asyncio.gather(
+            *(self._get(stream["url"], headers, first, last) for first, last in ranges)
+        )
+        with open(path, "wb") as file:
+            file.truncate(filesize)
+            for (first, _), part in zip(ranges, parts):
+                file.seek(first)
+                file.write(part)
+        return path, start, sum(map(len, parts))
+
+    async def fetch_or_none(self, summary, start, duration, path):
+        """`fetch`, logging and returning None on network errors."""
+        try:
+            return await self.fetch(summary, start, duration, path)
+        except (aiohttp.ClientError, asyncio.TimeoutError, RangeError) as e:
+            logging.warning(f"Ranged fetch failed, reading the whole stream: {e}")
+            if os.path.exists(path):
+                os.remove(path)
+            return None
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
@@ -1,4 +1,23 @@
+import atexit
 import logging
+import logging.handlers
+import os
+import queue
+import re
+import time
+
+import orjson
+
+# "queue" hands records to a background writer thread, "sync" writes in place
+LOG_MODE = os.environ.get("CACOPHONY_LOG", "queue")
+# "text" or "json", one object per line
+LOG_FORMAT = os.environ.get("CACOPHONY_LOG_FORMAT", "text")
+# Messages per second allowed for each kind of message (0 disables the limit)
+LOG_RATE = float(os.environ.get("CACOPHONY_LOG_RATE", 0))
+LOG_BURST = 20
+
+_queue = None
+_listener = None
 
 
 class LogColors:
@@ -7,7 +26,142 @@ class LogColors:
     RESET = "\033[0m"
 
 
-def setup_logger(name, level=logging.INFO, color_code=LogColors.RESET):
+class JsonFormatter(logging.Formatter):
+    """Format records as JSON lines with time, level, logger and message."""
+
+    def format(self, record):
+        entry = {
+            "time": record.created,
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return orjson.dumps(entry).decode()
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Token bucket per kind of message, where numbers do not tell messages apart.
+
+    Allows `rate` messages per second of each kind after a burst of `burst`. The
+    next message let through reports how many similar ones were dropped.
+    """
+
+    _numbers = re.compile(r"\d+(\.\d+)?")
+
+    def __init__(self, rate, burst=LOG_BURST):
+        super().__init__()
+        self.rate = rate
+        self.burst = burst
+        self.buckets = {}  # Kind -> [tokens, last update, suppressed]
+
+    def filter(self, record):
+        kind = (record.name, record.levelno, self._numbers.sub("#", str(record.msg)))
+        now = time.monotonic()
+        bucket = self.buckets.get(kind)
+        if bucket is None:
+            bucket = self.buckets[kind] = [self.burst, now, 0]
+
+        tokens, last, suppressed = bucket
+        tokens = min(self.burst, tokens + (now - last) * self.rate)
+        if tokens < 1:
+            bucket[:] = [tokens, now, suppressed + 1]
+            return False
+
+        bucket[:] = [tokens - 1, now, 0]
+        if suppressed:
+            record.msg = f"{record.getMessage()} ({suppressed} similar suppressed)"
+            record.args = None
+        return True
+
+
+def get_listener():
+    """Start the shared background writer on first use and return its queue."""
+    global _queue, _listener
+    if _listener is None:
+        _queue = queue.SimpleQueue()
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        _listener = logging.handlers.QueueListener(_queue, handler)
+        _listener.start()
+        atexit.register(stop_listener)
+    return _queue
+
+
+def stop_listener():
+    """Write out queued records and stop the background writer."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def init_worker():
+    """
+    Process pool initializer writing the worker's logs in place.
+
+    A forked worker inherits the parent's QueueHandlers but not the listener
+    thread draining their queue, so its records would silently go nowhere. A
+    worker started from the fork server imports the loggers afresh and starts
+    its own listener, which is not worth a thread either.
+    """
+    global _queue
+    stop_listener()
+    _queue = None
+    loggers = [logging.getLogger(), *logging.Logger.manager.loggerDict.values()]
+    for logger in loggers:
+        if not isinstance(logger, logging.Logger):
+            continue  # Placeholders of loggers not created yet
+        for handler in list(logger.handlers):
+            if isinstance(handler, logging.handlers.QueueHandler):
+                stream_handler = logging.StreamHandler()
+                stream_handler.setFormatter(handler.formatter)
+                for log_filter in handler.filters:
+                    stream_handler.addFilter(log_filter)
+                logger.removeHandler(handler)
+                logger.addHandler(stream_handler)
+
+
+def make_handler(formatter, mode=None, rate=None):
+    """
+    Handler writing to stderr, from a background thread in "queue" mode.
+
+    Records are formatted on the calling thread, so only the write itself, which
+    can block on a slow terminal, is moved off it.
+    """
+    mode = mode or LOG_MODE
+    rate = LOG_RATE if rate is None else rate
+    if mode == "queue":
+        handler = logging.handlers.QueueHandler(get_listener())
+    else:
+        handler = logging.StreamHandler()
+    handler.setFormatter(formatter)
+    if rate:
+        handler.addFilter(RateLimitFilter(rate))
+    return handler
+
+
+def make_formatter(fmt, json_format=None):
+    json_format = LOG_FORMAT == "json" if json_format is None else json_format
+    return JsonFormatter() if json_format else logging.Formatter(fmt)
+
+
+def setup_logger(
+    name,
+    level=logging.INFO,
+    color_code=LogColors.RESET,
+    mode=None,
+    json_format=None,
+    rate=None,
+):
+    """
+    Set up a colored logger that does not propagate to the root logger.
+
+    `mode`, `json_format` and `rate` default to the CACOPHONY_LOG,
+    CACOPHONY_LOG_FORMAT and CACOPHONY_LOG_RATE environment variables.
+    """
     # Create a new logger
     logger = logging.getLogger(name)
     logger.setLevel(level)
@@ -16,13 +170,19 @@ def setup_logger(name, level=logging.INFO, color_code=LogColors.RESET):
     logger.handlers.clear()
 
     # Set up a new handler with the specified formatter
-    formatter = logging.Formatter(f"{color_code}%(message)s{LogColors.RESET}")
-    stream_handler = logging.StreamHandler()
-    stream_handler.setFormatter(formatter)
-
-    logger.addHandler(stream_handler)
+    formatter = make_formatter(f"{color_code}%(message)s{LogColors.RESET}", json_format)
+    logger.addHandler(make_handler(formatter, mode, rate))
 
     # Prevent the logger from propagating messages to the root logger
     logger.propagate = False
 
     return logger
+
+
+def setup_root_logger(level=logging.INFO, mode=None, json_format=None, rate=None):
+    """Like `logging.basicConfig`, with the handler of `setup_logger`."""
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.handlers.clear()
+    root.addHandler(make_handler(make_formatter("%(message)s", json_format), mode, rate))
+    return root
@@ -0,0 +1,99 @@
+import math
+import random
+
+import numpy as np
+
+from linktable import as_table
+
+# Resolution of the integer weights used by the Fenwick tree
+WEIGHT_SCALE = 1024
+
+
+def link_amplitude(seen, visited, max_seen, max_visit):
+    """
+    Map the (seen, visited) counts of a link to an amplitude between 0.5 and 1.
+
+    Visited links are scaled against the most visited link, links that were only
+    seen against the most seen one.
+    """
+    base, interact = (seen, max_seen) if visited == 0 else (visited, max_visit)
+    interact = max(2, interact)  # A base of 1 would divide by zero
+    mul_range, mul_min = 0.5, 0.5
+
+    return (math.log(base + 1, interact) * mul_range) + mul_min
+
+
+class LinkSampler:
+    """
+    Draw links at random without replacement.
+
+    Uniform draws swap-remove over an array of row numbers in O(1). Weighted draws
+    favour links with a higher `link_amplitude` and use a Fenwick tree over integer
+    weights, so each draw and removal is O(log n). Links are read from a LinkTable,
+    a plain `{url: (seen, visited)}` dict is converted to one first.
+    """
+
+    def __init__(self, links, weighted=False, rng=random):
+        links = as_table(links)
+        self.table = links
+        self.weighted = weighted
+        self.rng = rng
+        self.remaining = len(links)
+
+        if weighted:
+            self._build_tree()
+        else:
+            self.rows = np.arange(len(links))
+
+    def __len__(self):
+        return self.remaining
+
+    def _build_tree(self):
+        scaled = (self.table.amplitudes() * WEIGHT_SCALE).astype(np.int64)
+        self.weights = np.maximum(1, scaled)
+
+        # tree[i] covers (i - lowbit(i), i], i.e. a difference of prefix sums
+        size = len(self.weights)
+        prefix = np.concatenate(([0], np.cumsum(self.weights)))
+        index = np.arange(1, size + 1)
+        self.tree = np.zeros(size + 1, dtype=np.int64)
+        self.tree[1:] = prefix[index] - prefix[index - (index & -index)]
+        self.total = int(prefix[-1])
+        self.top_bit = 1 << (size.bit_length() - 1) if size else 0
+
+    def _find(self, target):
+        """Row of the first link whose cumulative weight exceeds the target."""
+        pos, step = 0, self.top_bit
+        tree = self.tree
+        while step:
+            nxt = pos + step
+            if nxt < len(tree) and tree[nxt] <= target:
+                pos = nxt
+                target -= int(tree[nxt])
+            step >>= 1
+        return pos
+
+    def _remove(self, row):
+        weight = int(self.weights[row])
+        self.weights[row] = 0
+        self.total -= weight
+        i = row + 1
+        while i < len(self.tree):
+            self.tree[i] -= weight
+            i += i & -i
+
+    def draw(self):
+        """Return a `(link, (seen, visited))` pair and remove it from the sampler."""
+        if self.remaining == 0:
+            raise IndexError("draw from an empty sampler")
+
+        if self.weighted:
+            row = self._find(self.rng.randrange(self.total))
+            self._remove(row)
+        else:
+            index = self.rng.randrange(self.remaining)
+            rows = self.rows
+            row = int(rows[index])
+            rows[index] = rows[self.remaining - 1]
+        self.remaining -= 1
+        return self.table.url(row), self.table.counts(row)
@@ -0,0 +1,117 @@
+import asyncio
+import logging
+from collections import OrderedDict
+
+import numpy as np
+from pyo import DataTable
+
+from transcode import FFmpegBackend, TrimError
+
+
+class Sample:
+    def __init__(self, table, frames, sr):
+        self.table = table
+        self.frames = frames
+        self.duration = frames / sr
+        self.nbytes = frames * len(table) * 4
+        self.refs = 1
+
+
+class SamplePool:
+    """
+    Decoded clips held in pyo DataTables, within a memory budget.
+
+    Clips are decoded to float32 PCM in a worker thread before they are played, so
+    switching a voice never opens or decodes a file on the audio path. Samples are
+    referenced while queued or loaded on a voice; the least recently used
+    unreferenced samples are evicted once the pool exceeds `max_bytes`.
+
+    Clips are decoded with `backend`, unless the downloader already handed their
+    PCM over with `add`. Handed-over PCM counts against `max_bytes` too, and is
+    dropped oldest first after the unreferenced samples, leaving those clips to be
+    decoded from their file.
+    """
+
+    def __init__(self, sr, channels=2, max_bytes=512 << 20, backend=None):
+        self.sr = sr
+        self.channels = channels
+        self.max_bytes = max_bytes
+        self.backend = backend or FFmpegBackend()
+        self.decoded = OrderedDict()  # Path -> PCM handed over before queueing
+        self.samples = OrderedDict()  # Path -> Sample
+        self.assigned = {}  # Voice -> path
+        self.size = 0
+
+    async def prepare(self, path):
+        """Decode a clip into the pool, returning its Sample or None on failure."""
+        pcm = self._take_decoded(path)
+        if (sample := self.samples.get(path)) is not None:
+            sample.refs += 1
+            self.samples.move_to_end(path)
+            return sample
+
+        if pcm is None:
+            try:
+                pcm = await asyncio.to_thread(
+                    self.backend.decode, path, self.sr, self.channels
+                )
+            except TrimError as e:
+                logging.error(e)
+                return None
+
+        table = DataTable(size=pcm.shape[1], chnls=self.channels)
+        for chnl in range(self.channels):
+            np.asarray(table.getBuffer(chnl))[:] = pcm[chnl]
+
+        sample = Sample(table, pcm.shape[1], self.sr)
+        self.samples[path] = sample
+        self.size += sample.nbytes
+        self._evict()
+        return sample
+
+    def add(self, path, pcm):
+        """Hand over the decoded PCM of a clip that is about to be queued."""
+        if pcm.shape[1] > 0:
+            self._take_decoded(path)
+            self.decoded[path] = pcm
+            self.size += pcm.nbytes
+            self._evict()
+
+    def _take_decoded(self, path):
+        pcm = self.decoded.pop(path, None)
+        if pcm is not None:
+            self.size -= pcm.nbytes
+        return pcm
+
+    def get(self, path):
+        return self.samples.get(path)
+
+    def assign(self, voice, path):
+        """Hand a queued sample to a voice, releasing the one it played before."""
+        if (previous := self.assigned.get(voice)) is not None:
+            self.release(previous)
+        self.assigned[voice] = path
+        self.samples.move_to_end(path)
+
+    def release(self, path):
+        if (sample := self.samples.get(path)) is not None:
+            sample.refs -= 1
+            self._evict()
+
+    def _evict(self):
+        for path in list(self.samples):
+            if self.size <= self.max_bytes:
+                break
+            sample = self.samples[path]
+            if sample.refs <= 0:
+                del self.samples[path]
+                self.size -= sample.nbytes
+        while self.decoded and self.size > self.max_bytes:
+            self._take_decoded(next(iter(self.decoded)))
+
+    async def run(self, q_in, q_out):
+        """Decode downloaded clips from `q_in` and forward them to `q_out`."""
+        while True:
+            item = await q_in.get()
+            if await self.prepare(item[0]) is not None:
+                await q_out.put(item)
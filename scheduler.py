@@ -0,0 +1,81 @@
+import asyncio
+import logging
+import time
+
+# How long to wait for a download before printing an idle heartbeat
+IDLE_INTERVAL = 1.0
+
+
+class SystemClock:
+    def time(self):
+        return time.monotonic()
+
+    async def sleep(self, delay):
+        await asyncio.sleep(delay)
+
+
+class FakeClock:
+    """Clock that jumps straight to each deadline, for deterministic runs."""
+
+    def __init__(self, start=0.0):
+        self.now = start
+
+    def time(self):
+        return self.now
+
+    async def sleep(self, delay):
+        self.now += max(0.0, delay)
+        await asyncio.sleep(0)
+
+
+def gap_policy(player, now):
+    """Wait longer after longer sounds, between 2 and about 6 seconds."""
+    gap = ((player.last_duration - player.min_duration) / player.max_duration * 4) + 2
+    return now + gap
+
+
+def voice_policy(player, now):
+    """
+    Keep the gap after a switch, but once every voice is busy also wait until the
+    earliest playing sound ends instead of cutting it off.
+    """
+    next_switch = gap_policy(player, now)
+    if player.voices.busy(now) >= player.player_count:
+        next_switch = max(next_switch, player.voices.earliest()[0])
+    return next_switch
+
+
+class Scheduler:
+    """
+    Start sounds as soon as a clip is downloaded and the next switch time is due.
+
+    The scheduler sleeps until the switch time computed by `policy`, then awaits the
+    download queue directly instead of polling it. A policy is any callable taking
+    the `AudioPlayer` and the current clock time and returning the next switch time.
+    """
+
+    def __init__(self, player, policy=voice_policy, clock=None):
+        self.player = player
+        self.policy = policy
+        self.clock = clock or player.clock
+        self.next_switch = self.clock.time()
+
+    async def next_clip(self):
+        while True:
+            try:
+                return await asyncio.wait_for(self.player.q_ready.get(), IDLE_INTERVAL)
+            except asyncio.TimeoutError:
+                print(".", end="", flush=True)
+
+    async def step(self):
+        await self.clock.sleep(self.next_switch - self.clock.time())
+        item = await self.next_clip()
+
+        if await self.player.pyo_look(item):
+            now = self.clock.time()
+            self.next_switch = self.policy(self.player, now)
+            logging.info(f"Switch duration: {self.next_switch - now}")
+
+    async def run(self):
+        while True:
+            await self.step()
@@ -0,0 +1,99 @@
+import numpy as np
+
+# Azimuths of the speakers in degrees clockwise from the front, in channel order
+SPEAKER_LAYOUTS = {
+    "stereo": [-30, 30],
+    "quad": [-45, 45, 135, -135],
+    "octagon": [0, 45, 90, 135, 180, -135, -90, -45],
+    "ring16": [22.5 * i for i in range(16)],
+}
+
+
+class SpeakerLayout:
+    """
+    Speakers placed by azimuth, either along a line or around a ring.
+
+    Voice positions are pan values in [0, 1]. On a line they go from the
+    leftmost speaker to the rightmost, like the pan of a stereo `Pan`; around a
+    ring they go once around the room from the front.
+    """
+
+    def __init__(self, name, azimuths, ring=None):
+        self.name = name
+        self.azimuths = np.asarray(azimuths, dtype=np.float64) % 360
+        self.channels = len(self.azimuths)
+        # Speakers spread over more than a half circle surround the listener
+        self.ring = self.channels > 2 if ring is None else ring
+
+        # Speaker positions on the same [0, 1] scale as voice positions
+        if self.ring:
+            self.positions = self.azimuths / 360
+        else:
+            signed = (self.azimuths + 180) % 360 - 180
+            low, high = signed.min(), signed.max()
+            self.positions = (signed - low) / max(high - low, 1e-9)
+
+    @classmethod
+    def parse(cls, spec):
+        """A layout by name, or from comma-separated azimuths in degrees."""
+        if spec in SPEAKER_LAYOUTS:
+            return cls(spec, SPEAKER_LAYOUTS[spec])
+        try:
+            azimuths = [float(azimuth) for azimuth in spec.split(",")]
+        except ValueError:
+            raise ValueError(
+                f"{spec} is neither a speaker layout ({', '.join(SPEAKER_LAYOUTS)})"
+                " nor a list of azimuths"
+            ) from None
+        if len(azimuths) < 2:
+            raise ValueError("A speaker layout needs at least two speakers")
+        return cls(spec, azimuths)
+
+    def voice_positions(self, count):
+        """
+        Evenly spaced positions for `count` voices.
+
+        On a line they stay within 0.8 of it like the stereo player's; around a
+        ring they are spread over the whole circle.
+        """
+        positions = (np.arange(count) + 0.5) / count
+        return positions if self.ring else positions * 0.8
+
+    def pan_gains(self, positions, spread=0.15):
+        """
+        Gains of every speaker for each position, as a (positions, channels) matrix.
+
+        Each position is panned with equal power between the two speakers around
+        it. `spread` blends in an even share of every speaker while keeping the
+        power of each row at 1.
+        """
+        positions = np.asarray(positions, dtype=np.float64)
+        order = np.argsort(self.positions)
+        sorted_positions = self.positions[order]
+        count = self.channels
+
+        if self.ring:
+            positions = positions % 1.0
+            # Speaker after each position, wrapping past the last one
+            right = np.searchsorted(sorted_positions, positions, side="right")
+            left = (right - 1) % count
+            right = right % count
+            width = (sorted_positions[right] - sorted_positions[left]) % 1.0
+            offset = (positions - sorted_positions[left]) % 1.0
+        else:
+            positions = np.clip(positions, sorted_positions[0], sorted_positions[-1])
+            right = np.searchsorted(sorted_positions, positions, side="right")
+            right = np.clip(right, 1, count - 1)
+            left = right - 1
+            width = sorted_positions[right] - sorted_positions[left]
+            offset = positions - sorted_positions[left]
+
+        fraction = np.divide(offset, width, out=np.zeros_like(offset), where=width > 0)
+        angle = fraction * (np.pi / 2)
+
+        power = np.zeros((len(positions), count))
+        rows = np.arange(len(positions))
+        power[rows, order[left]] += np.cos(angle) ** 2
+        power[rows, order[right]] += np.sin(angle) ** 2
+        power = (1 - spread) * power + spread / count
+        return np.sqrt(power)
@@ -0,0 +1,43 @@
+import os
+import sys
+import wave
+
+import numpy as np
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+SOUNDS_DIR = os.path.join(REPO_DIR, "sounds") + os.sep
+
+
+def write_wav(path, pcm, sr=44100):
+    """Write float PCM of shape (frames, channels) as a 16-bit WAV file."""
+    pcm = np.asarray(pcm, dtype=np.float64)
+    if pcm.ndim == 1:
+        pcm = pcm[:, None]
+    with wave.open(str(path), "wb") as f:
+        f.setnchannels(pcm.shape[1])
+        f.setsampwidth(2)
+        f.setframerate(sr)
+        f.writeframes((np.clip(pcm, -1, 1) * 32767).astype("<i2").tobytes())
+    return str(path)
+
+
+def read_wav(path):
+    """PCM of a 16-bit WAV file as floats of shape (frames, channels), and its rate."""
+    with wave.open(str(path), "rb") as f:
+        frames = f.readframes(f.getnframes())
+        pcm = np.frombuffer(frames, dtype="<i2").reshape(-1, f.getnchannels())
+        return pcm / 32768, f.getframerate()
+
+
+def tone(seconds, freq=440.0, sr=44100, channels=2, amp=0.5):
+    t = np.arange(int(seconds * sr)) / sr
+    return np.repeat((amp * np.sin(2 * np.pi * freq * t))[:, None], channels, axis=1)
+
+
+@pytest.fixture
+def tone_wav(tmp_path):
+    """Path of a six second stereo 440 Hz tone."""
+    return write_wav(tmp_path / "tone.wav", tone(6))
@@ -0,0 +1,199 @@
+import asyncio
+import os
+
+from aiohttp import web
+
+import downloader
+from cache import ClipCache, DiskLRU
+from conftest import SOUNDS_DIR
+from downloader import choose_media
+from play import AudioPlayer
+
+WATCH = "https://www.youtube.com/watch?v="
+FILESIZE = 4 << 20
+DURATION = 600
+CLIP_BYTES = 1000
+
+
+def test_pinned_files_outlive_the_cap(tmp_path):
+    lru = DiskLRU(str(tmp_path), max_bytes=2500)
+    lru.write("a", b"a" * 1000)
+    lru.pin(lru.path("a"))
+    lru.pin(lru.path("a"))
+    lru.write("b", b"b" * 1000)
+    lru.write("c", b"c" * 1000)
+    assert list(lru.entries) == ["a", "c"]  # b went instead of the older a
+
+    lru.write("d", b"d" * 1000)
+    lru.write("e", b"e" * 1000)
+    assert list(lru.entries) == ["a", "e"]
+
+    lru.pin(lru.path("e"))
+    lru.write("f", b"f" * 1000)
+    assert list(lru.entries) == ["a", "e", "f"]
+    assert lru.size == 3000  # Over the cap while pinned
+
+    lru.unpin(lru.path("a"))
+    assert "a" in lru.entries  # Still pinned once
+    lru.unpin(lru.path("a"))
+    assert list(lru.entries) == ["e", "f"]
+    assert not os.path.exists(lru.path("a"))
+
+
+def test_pinned_clips_keep_their_analysis(tmp_path):
+    cache = ClipCache(str(tmp_path), max_bytes=2500)
+
+    def put(video_id):
+        source = tmp_path / f"{video_id}.opus"
+        source.write_bytes(b"\0" * 1000)
+        return cache.put(video_id, 0, 10, "opus", str(source))
+
+    first = put("aaaaaaaaaaa")
+    cache.put_loudness(first, {"integrated": -20.0})
+    cache.pin(first)
+    put("bbbbbbbbbbb")
+    put("ccccccccccc")
+    # The analysis is older than the second clip, but stays with its pinned clip
+    assert cache.find("bbbbbbbbbbb", 0, 20, "opus") == (None, None)
+    assert cache.get_loudness(first) == {"integrated": -20.0}
+
+    cache.unpin(first)
+    put("ddddddddddd")
+    assert cache.find("aaaaaaaaaaa", 0, 20, "opus") == (None, None)
+    assert cache.analysis_name(os.path.basename(first)) not in cache.entries
+    assert cache.size <= cache.max_bytes
+
+
+def summaries(base, ids):
+    return {
+        video_id: {
+            "duration": DURATION,
+            "is_live": False,
+            "is_playlist": False,
+            "thumbnail": None,
+            "stream": {
+                "url": f"{base}/audio.webm",
+                "filesize": FILESIZE,
+                "acodec": "opus",
+                "ext": "webm",
+            },
+        }
+        for video_id in ids
+    }
+
+
+class FakeBackend:
+    """Writes a clip of CLIP_BYTES for every trim of a fetched range."""
+
+    name = "fake"
+
+    async def trim(
+        self, source, start, duration, output, copy=False, strict=False, pcm=None
+    ):
+        assert os.path.getsize(source) == FILESIZE
+        with open(output, "wb") as f:
+            f.write(b"\0" * CLIP_BYTES)
+        return None
+
+
+def fake_analyze(path, backend_name):
+    return {"integrated": -20.0, "peak": -3.0, "envelope": []}
+
+
+def play_from_cache(tmp_path, ids, clip_cache, requests):
+    """
+    Run choose_media against a local media server, without consuming the queue.
+
+    Returns the queued clip paths, and whether each still existed on disk once
+    the pipeline had drained.
+    """
+
+    @web.middleware
+    async def count(request, handler):
+        requests.append(request.path)
+        return await handler(request)
+
+    media = tmp_path / "media"
+    media.mkdir(exist_ok=True)
+    (media / "audio.webm").write_bytes(os.urandom(FILESIZE))
+
+    async def run():
+        app = web.Application(middlewares=[count])
+        app.router.add_static("/", str(media))
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, "127.0.0.1", 0).start()
+        known = summaries(f"http://127.0.0.1:{runner.addresses[0][1]}", ids)
+
+        async def resolve(link):
+            return known[link[len(WATCH) :]]
+
+        q_dl, q_pyo = asyncio.Queue(), asyncio.Queue()
+        try:
+            await choose_media(
+                {WATCH + video_id: (1, 0) for video_id in ids},
+                2,
+                10,
+                20,
+                q_dl,
+                q_pyo,
+                clip_cache=clip_cache,
+                resolver=resolve,
+                backend=FakeBackend(),
+            )
+        finally:
+            await runner.cleanup()
+        paths = [q_dl.get_nowait()[0] for _ in range(q_dl.qsize())]
+        return paths, [os.path.exists(path) for path in paths]
+
+    return asyncio.run(run())
+
+
+def test_queued_clips_are_not_evicted(tmp_path, monkeypatch):
+    monkeypatch.setattr(downloader, "DOWNLOAD_DELAY", 0)
+    monkeypatch.setattr(downloader, "analyze_path", fake_analyze)
+
+    ids = [f"video{i}aaaaa" for i in range(6)]
+    cache_dir = str(tmp_path / "clips")
+    # Room for two clips and their loudness analyses
+    clip_cache = ClipCache(cache_dir, max_bytes=2 * CLIP_BYTES + 200)
+    requests = []
+    paths, existed = play_from_cache(tmp_path, ids, clip_cache, requests)
+
+    assert len(paths) == 6
+    assert all(existed)
+    assert len(requests) >= 6  # At least one range request per clip
+    assert clip_cache.size > clip_cache.max_bytes
+
+    # Taking the clips off the queue lets the cache shrink back under its cap
+    for path in paths:
+        clip_cache.unpin(path)
+    assert not clip_cache.pins
+    assert clip_cache.size <= clip_cache.max_bytes
+    kept = [path for path in paths if os.path.exists(path)]
+    assert len(kept) == 2
+
+    # A second run serves the kept clips without touching the server
+    requests.clear()
+    clip_cache = ClipCache(cache_dir, max_bytes=2 * CLIP_BYTES + 200)
+    kept_ids = [os.path.basename(path)[:11] for path in kept]
+    paths, existed = play_from_cache(tmp_path, kept_ids, clip_cache, requests)
+    assert sorted(paths) == sorted(kept)
+    assert all(existed)
+    assert requests == []
+    assert clip_cache.stats()["hits"] == 2
+
+
+def test_player_unpins_clips_it_takes_off_the_queue(tmp_path):
+    cache = ClipCache(str(tmp_path / "clips"), max_bytes=0)
+    source = tmp_path / "clip.opus"
+    source.write_bytes(b"\0" * 1000)
+    path = cache.put("aaaaaaaaaaa", 0, 10, "opus", str(source))
+    cache.pin(path)
+    os.remove(path)  # Gone from under the cache, so the player skips it
+
+    player = AudioPlayer(3, 1, 7, SOUNDS_DIR, audio="offline", clip_cache=cache)
+    item = (path, 1, 0, 0, None, {"link": WATCH + "aaaaaaaaaaa"})
+    assert asyncio.run(player.pyo_look(item)) is None
+    assert not cache.pins
+    assert not cache.entries
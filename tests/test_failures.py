@@ -0,0 +1,99 @@
+import asyncio
+import math
+
+import downloader
+from downloader import choose_media
+from failures import BACKOFF_BASE, BACKOFF_MAX, FailureIndex
+
+WATCH = "https://www.youtube.com/watch?v="
+NOW = 1_700_000_000
+
+
+def retry_in(failures, video_id, now=NOW):
+    (retry_at,) = failures.db.execute(
+        "SELECT retry_at FROM failures WHERE video_id = ?", (video_id,)
+    ).fetchone()
+    return retry_at - now
+
+
+def test_backoff_doubles_up_to_the_cap(tmp_path):
+    failures = FailureIndex(str(tmp_path / "failures.sqlite"))
+    delays = []
+    for _ in range(12):
+        failures.record("aaaaaaaaaaa", "trim", 1.0, now=NOW)
+        delays.append(retry_in(failures, "aaaaaaaaaaa"))
+
+    assert delays[:4] == [BACKOFF_BASE * 2**i for i in range(4)]
+    assert delays[9] == BACKOFF_BASE * 2**9
+    # 2**10 hours is past the 30 day cap
+    assert delays[10:] == [BACKOFF_MAX, BACKOFF_MAX]
+    failures.close()
+
+
+def test_permanent_and_transient_failures(tmp_path):
+    failures = FailureIndex(str(tmp_path / "failures.sqlite"))
+    failures.record("shortaaaaaa", "too_short", 2.0, now=NOW)
+    failures.record("brokenaaaaa", "trim", 5.0, now=NOW)
+    failures.record("missingaaaa", "resolve", 3.0, now=NOW)
+
+    assert retry_in(failures, "shortaaaaaa") == math.inf
+    assert retry_in(failures, "brokenaaaaa") == BACKOFF_BASE
+    assert sorted(failures.skipped(now=NOW)) == [
+        "brokenaaaaa",
+        "missingaaaa",
+        "shortaaaaaa",
+    ]
+    assert failures.stats(now=NOW) == {
+        "too_short": {"skipped": 1, "saved": 2.0},
+        "trim": {"skipped": 1, "saved": 5.0},
+        "resolve": {"skipped": 1, "saved": 3.0},
+    }
+
+    # Transient failures come back once their backoff has passed
+    later = NOW + BACKOFF_BASE
+    assert failures.skipped(now=later) == ["shortaaaaaa"]
+    assert failures.stats(now=later) == {"too_short": {"skipped": 1, "saved": 2.0}}
+
+    # A recovered video starts over from the first backoff
+    failures.clear("brokenaaaaa")
+    failures.clear("neveraaaaaa")
+    assert (failures.recorded, failures.cleared) == (3, 1)
+    failures.record("brokenaaaaa", "trim", 5.0, now=later)
+    assert retry_in(failures, "brokenaaaaa", now=later) == BACKOFF_BASE
+    failures.close()
+
+
+def test_second_run_skips_recorded_ids(tmp_path, monkeypatch):
+    monkeypatch.setattr(downloader, "DOWNLOAD_DELAY", 0)
+    failures = FailureIndex(str(tmp_path / "failures.sqlite"))
+    links = {WATCH + video_id: (1, 0) for video_id in ("failedaaaaa", "otheraaaaaa")}
+
+    def run():
+        resolved = []
+
+        async def resolve(link):
+            resolved.append(link)
+            return None  # Every link fails to resolve
+
+        async def choose():
+            await choose_media(
+                dict(links),
+                1,
+                10,
+                20,
+                asyncio.Queue(),
+                asyncio.Queue(),
+                resolver=resolve,
+                failures=failures,
+            )
+
+        asyncio.run(choose())
+        return sorted(resolved)
+
+    assert run() == sorted(links)
+    assert sorted(failures.skipped()) == ["failedaaaaa", "otheraaaaaa"]
+    assert run() == []
+
+    failures.clear("otheraaaaaa")
+    assert run() == [WATCH + "otheraaaaaa"]
+    failures.close()
@@ -0,0 +1,106 @@
+import random
+
+import orjson
+import pytest
+
+from linkindex import LinkIndex
+from linktable import WATCH_PREFIX
+
+NAMES = [f"collection{i}" for i in range(11)]  # Membership spans two bytes
+
+
+@pytest.fixture
+def collections(tmp_path):
+    """Eleven overlapping collections written as JSON, and their dicts."""
+    rng = random.Random(3)
+    urls = [f"{WATCH_PREFIX}{i:011d}" for i in range(60)]
+    urls += [f"https://www.youtube.com/shorts/{i}" for i in range(10)]
+    collections = {}
+    for name in NAMES:
+        chosen = rng.sample(urls, rng.randint(5, 30))
+        collections[name] = {
+            url: (rng.randint(0, 20), rng.choice([0, 0, 1, 3])) for url in chosen
+        }
+        with open(tmp_path / f"{name}.json", "wb") as f:
+            f.write(orjson.dumps(collections[name]))
+    return str(tmp_path), collections
+
+
+def reference(collections):
+    """Summed counts and source names of every link, the slow way."""
+    counts, sources = {}, {}
+    for name, links in collections.items():
+        for url, (seen, visited) in links.items():
+            c0, c1 = counts.get(url, (0, 0))
+            counts[url] = (c0 + seen, c1 + visited)
+            sources.setdefault(url, []).append(name)
+    return counts, sources
+
+
+def test_merge_sums_counts_and_keeps_membership(collections):
+    directory, links = collections
+    index = LinkIndex.merge(NAMES, directory)
+    counts, sources = reference(links)
+
+    assert index.table.to_dict() == counts
+    assert index.membership.shape == (len(counts), 2)
+    for url, names in sources.items():
+        assert index.sources_of(url) == names
+    assert index.sources_of(f"{WATCH_PREFIX}zzzzzzzzzzz") == []
+    assert index.stats() == {name: len(links[name]) for name in NAMES}
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        {},
+        {"sources": ["collection9"]},
+        {"sources": ["collection0", "collection8", "collection10"]},
+        {"min_seen": 10},
+        {"min_visited": 1, "max_seen": 30},
+        {"max_visited": 0, "sources": ["collection7"]},
+        {"exclude": ["00000000001", f"{WATCH_PREFIX}00000000002"]},
+        {"exclude": ["https://www.youtube.com/shorts/3"], "min_seen": 5},
+    ],
+)
+def test_query_matches_the_reference(collections, query):
+    directory, links = collections
+    counts, sources = reference(links)
+    expected = {}
+    for url, (seen, visited) in counts.items():
+        if query.get("sources") and not set(query["sources"]) & set(sources[url]):
+            continue
+        if seen < query.get("min_seen", 0) or visited < query.get("min_visited", 0):
+            continue
+        if seen > query.get("max_seen", seen):
+            continue
+        if visited > query.get("max_visited", visited):
+            continue
+        excluded = {
+            item if item.startswith("https://") else WATCH_PREFIX + item
+            for item in query.get("exclude", ())
+        }
+        if url in excluded:
+            continue
+        expected[url] = (seen, visited)
+
+    selected = LinkIndex.merge(NAMES, directory).query(**query)
+    assert selected.to_dict() == expected
+    assert (selected.max_seen, selected.max_visit) == (
+        max((seen for seen, _ in expected.values()), default=0),
+        max((visited for _, visited in expected.values()), default=0),
+    )
+
+
+def test_unknown_source_is_an_error(collections):
+    directory, _ = collections
+    with pytest.raises(ValueError, match="not one of the merged"):
+        LinkIndex.merge(NAMES[:2], directory).query(sources=["collection5"])
+
+
+def test_merging_nothing_or_duplicates(collections):
+    directory, links = collections
+    assert len(LinkIndex.merge([], directory).query()) == 0
+    index = LinkIndex.merge(["collection1", "collection1"], directory)
+    assert index.names == ["collection1"]
+    assert index.table.to_dict() == links["collection1"]
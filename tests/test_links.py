@@ -0,0 +1,136 @@
+import os
+
+import orjson
+import pytest
+
+from links import LinkStore, _paths, read_links
+
+SNAPSHOT = {"a": (5, 1), "b": (2, 0)}
+ROTATED = [["a", 1, 0], ["c", 1, 0], ["b", 0, 1]]
+JOURNAL = [["a", 0, 1], ["d", 1, 0]]
+# SNAPSHOT with ROTATED and then JOURNAL applied, each increment exactly once
+EXPECTED = {"a": (6, 2), "b": (2, 1), "c": (1, 0), "d": (1, 0)}
+
+
+def counts(links):
+    return {url: tuple(value) for url, value in links.items()}
+
+
+def write(path, data):
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def records(increments):
+    return b"".join(orjson.dumps(record) + b"\n" for record in increments)
+
+
+def apply(snapshot, *journals):
+    links = dict(snapshot)
+    for journal in journals:
+        for url, d0, d1 in journal:
+            c0, c1 = links.get(url, (0, 0))
+            links[url] = (c0 + d0, c1 + d1)
+    return links
+
+
+@pytest.fixture
+def paths(tmp_path):
+    return _paths("links", str(tmp_path))
+
+
+def load_and_close(directory):
+    store = LinkStore("links", directory)
+    links = counts(store.load())
+    store.close()
+    return links
+
+
+def assert_recovered(tmp_path, paths, expected):
+    """read_links and a LinkStore both see `expected`, and the store tidies up."""
+    assert counts(read_links("links", str(tmp_path))) == expected
+    assert load_and_close(str(tmp_path)) == expected
+
+    # Everything is folded into the snapshot, and reading again changes nothing
+    assert not os.path.exists(paths["pending"])
+    assert not os.path.exists(paths["rotated"])
+    assert os.path.getsize(paths["journal"]) == 0
+    assert counts(read_links("links", str(tmp_path))) == expected
+    assert load_and_close(str(tmp_path)) == expected
+
+
+def test_snapshot_plus_journal_replay(tmp_path, paths):
+    write(paths["snapshot"], orjson.dumps(SNAPSHOT))
+    store = LinkStore("links", str(tmp_path))
+    store.load()
+    for url, d0, d1 in JOURNAL:
+        store.increment(url, d0, d1)
+    store.flush()
+    # A crash here leaves the increments in the journal only
+    assert orjson.loads(read(paths["snapshot"])) == {
+        url: list(value) for url, value in SNAPSHOT.items()
+    }
+    store.journal.close()
+
+    assert_recovered(tmp_path, paths, apply(SNAPSHOT, JOURNAL))
+
+
+def test_torn_journal_tail_is_truncated(tmp_path, paths):
+    write(paths["snapshot"], orjson.dumps(SNAPSHOT))
+    write(paths["journal"], records(JOURNAL) + b'["e", 1')
+
+    assert counts(read_links("links", str(tmp_path))) == apply(SNAPSHOT, JOURNAL)
+
+    store = LinkStore("links", str(tmp_path))
+    store._recover()
+    assert read(paths["journal"]) == records(JOURNAL)
+
+    # New records start on a fresh line after the truncation
+    store.load()
+    store.increment("e", 0, 1)
+    store.flush()
+    store.journal.close()
+    assert_recovered(tmp_path, paths, apply(SNAPSHOT, JOURNAL, [["e", 0, 1]]))
+
+
+def test_crash_after_rotating_the_journal(tmp_path, paths):
+    write(paths["snapshot"], orjson.dumps(SNAPSHOT))
+    write(paths["rotated"], records(ROTATED))
+    write(paths["journal"], records(JOURNAL))
+    assert_recovered(tmp_path, paths, EXPECTED)
+
+
+def test_crash_after_writing_the_pending_snapshot(tmp_path, paths):
+    write(paths["snapshot"], orjson.dumps(SNAPSHOT))
+    write(paths["rotated"], records(ROTATED))
+    write(paths["pending"], orjson.dumps(apply(SNAPSHOT, ROTATED)))
+    write(paths["journal"], records(JOURNAL))
+    # The rotated journal is still there, so the pending snapshot is not committed
+    assert_recovered(tmp_path, paths, EXPECTED)
+
+
+def test_crash_after_deleting_the_rotated_journal(tmp_path, paths):
+    write(paths["snapshot"], orjson.dumps(SNAPSHOT))
+    write(paths["pending"], orjson.dumps(apply(SNAPSHOT, ROTATED)))
+    write(paths["journal"], records(JOURNAL))
+    # Deleting the rotated journal committed the pending snapshot
+    assert_recovered(tmp_path, paths, EXPECTED)
+
+
+def test_compaction_keeps_every_increment(tmp_path, paths):
+    store = LinkStore("links", str(tmp_path))
+    store.load()
+    for url, d0, d1 in ROTATED:
+        store.increment(url, d0, d1)
+    store.flush()
+    store.compact()
+    for url, d0, d1 in JOURNAL:
+        store.increment(url, d0, d1)
+    store.close()
+
+    assert_recovered(tmp_path, paths, apply({}, ROTATED, JOURNAL))
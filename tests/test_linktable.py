@@ -0,0 +1,83 @@
+import os
+
+import numpy as np
+import orjson
+import pytest
+
+from linktable import WATCH_PREFIX, LinkTable, load_link_table, table_path
+from sampler import link_amplitude
+
+LINKS = {
+    f"{WATCH_PREFIX}aaaaaaaaaaa": (3, 0),
+    f"{WATCH_PREFIX}bbbbbbbbbbb": (7, 2),
+    "https://www.youtube.com/shorts/ccccccccccc": (1, 0),
+    f"{WATCH_PREFIX}ddddddddddd": (0, 5),
+}
+
+
+def write_links(directory, links, mtime=None):
+    path = os.path.join(directory, "links.json")
+    with open(path, "wb") as f:
+        f.write(orjson.dumps(links))
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+
+
+def test_round_trip_and_lookups(tmp_path):
+    table = LinkTable.from_dict(LINKS)
+    assert table.to_dict() == LINKS
+    assert (table.max_seen, table.max_visit) == (7, 5)
+    assert table.get(f"{WATCH_PREFIX}bbbbbbbbbbb") == (7, 2)
+    assert table.get("https://www.youtube.com/shorts/ccccccccccc") == (1, 0)
+    assert table.get(f"{WATCH_PREFIX}zzzzzzzzzzz") is None
+
+    path = str(tmp_path / "links.npz")
+    table.save(path)
+    assert LinkTable.load(path).to_dict() == LINKS
+
+
+def test_without_leaves_out_ids_and_urls():
+    table = LinkTable.from_dict(LINKS)
+    kept = table.without(["aaaaaaaaaaa", "https://www.youtube.com/shorts/ccccccccccc"])
+    assert set(kept.to_dict()) == {
+        f"{WATCH_PREFIX}bbbbbbbbbbb",
+        f"{WATCH_PREFIX}ddddddddddd",
+    }
+    assert table.without(["not a key that fits" * 10]) is table
+
+
+def test_amplitudes_match_link_amplitude():
+    table = LinkTable.from_dict(LINKS)
+    expected = [
+        link_amplitude(*table.counts(i), table.max_seen, table.max_visit)
+        for i in range(len(table))
+    ]
+    assert np.allclose(table.amplitudes(), expected)
+
+
+def test_table_is_rebuilt_when_the_json_changes(tmp_path):
+    directory = str(tmp_path)
+    write_links(directory, LINKS, mtime=1_000_000)
+    assert load_link_table("links", directory).to_dict() == LINKS
+    assert os.path.exists(table_path("links", directory))
+
+    changed = {**LINKS, f"{WATCH_PREFIX}eeeeeeeeeee": (9, 9)}
+    write_links(directory, changed)
+    table = load_link_table("links", directory)
+    assert len(table) == 5
+    assert (table.max_seen, table.max_visit) == (9, 9)
+
+
+def test_damaged_table_is_rebuilt(tmp_path):
+    directory = str(tmp_path)
+    write_links(directory, LINKS, mtime=1_000_000)
+    with open(table_path("links", directory), "wb") as f:
+        f.write(b"not a table")
+    assert load_link_table("links", directory).to_dict() == LINKS
+
+
+@pytest.mark.parametrize("links", [{}, {f"{WATCH_PREFIX}aaaaaaaaaaa": (0, 0)}])
+def test_small_collections(links):
+    table = LinkTable.from_dict(links)
+    assert len(table) == len(links)
+    assert table.to_dict() == links
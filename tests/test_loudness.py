@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+
+from cache import ClipCache
+from conftest import tone
+from loudness import (
+    ANALYSIS_RATE,
+    MAX_GAIN_DB,
+    PEAK_CEILING,
+    TARGET_LOUDNESS,
+    analyze,
+    analyze_path,
+    normalization_gain,
+)
+
+SR = 48000
+
+
+def sine(seconds, freq=1000.0, dbfs=0.0, sr=SR):
+    t = np.arange(int(seconds * sr)) / sr
+    return 10 ** (dbfs / 20) * np.sin(2 * np.pi * freq * t)
+
+
+def integrated(channel):
+    """Integrated loudness of `channel` played on both channels."""
+    return analyze(np.stack([channel, channel]), SR)["integrated"]
+
+
+def test_bs1770_sine_reference():
+    # A 0 dBFS 1 kHz sine on one channel of two reads -3.01 LUFS
+    left = sine(5)
+    stats = analyze(np.stack([left, np.zeros_like(left)]), SR)
+    assert stats["integrated"] == pytest.approx(-3.01, abs=0.05)
+    assert stats["peak"] == pytest.approx(0.0, abs=0.01)
+
+    # EBU Tech 3341 case 1: -23 dBFS on both channels reads -23 LUFS
+    assert integrated(sine(20, dbfs=-23)) == pytest.approx(-23.0, abs=0.1)
+
+
+def test_gating_ignores_silence_and_quiet_passages():
+    # Long enough that the blocks straddling an edge barely count
+    tone = sine(20, dbfs=-20)
+    loudness = integrated(tone)
+
+    padded = np.concatenate([np.zeros(10 * SR), tone, np.zeros(10 * SR)])
+    assert integrated(padded) == pytest.approx(loudness, abs=0.1)
+
+    # A long passage 30 dB down falls under the relative gate
+    quiet = np.concatenate([tone, sine(10, dbfs=-50)])
+    assert integrated(quiet) == pytest.approx(loudness, abs=0.1)
+
+
+def test_silent_and_short_clips():
+    silent = analyze(np.zeros((2, 3 * SR)), SR)
+    assert silent["integrated"] is None
+    assert normalization_gain(silent) == 1.0
+    assert analyze(np.zeros((2, SR // 4)), SR) is None
+    assert normalization_gain(None) == 1.0
+
+
+def test_gain_is_capped():
+    def gain_db(integrated, peak):
+        stats = {"integrated": integrated, "peak": peak}
+        return 20 * np.log10(normalization_gain(stats))
+
+    assert gain_db(-20.0, -10.0) == pytest.approx(TARGET_LOUDNESS + 20.0)
+    assert gain_db(-10.0, 0.0) == pytest.approx(TARGET_LOUDNESS + 10.0)
+    assert gain_db(-40.0, -30.0) == pytest.approx(MAX_GAIN_DB)
+    assert gain_db(-25.0, -4.0) == pytest.approx(PEAK_CEILING + 4.0)
+
+
+def test_analysis_round_trips_through_the_clip_cache(tone_wav, tmp_path):
+    stats = analyze_path(tone_wav, "av")
+    # Decoded and resampled to the analysis rate, it measures as the source does
+    source = analyze(tone(6).T, 44100)
+    assert stats["integrated"] == pytest.approx(source["integrated"], abs=0.1)
+    assert len(stats["envelope"]) == 6 * ANALYSIS_RATE // int(ANALYSIS_RATE * 0.1)
+
+    cache = ClipCache(str(tmp_path / "clips"))
+    path = cache.put("aaaaaaaaaaa", 0, 6, "wav", tone_wav)
+    assert cache.get_loudness(path) is None
+    cache.put_loudness(path, stats)
+    assert cache.get_loudness(path) == stats
+    assert ClipCache(str(tmp_path / "clips")).get_loudness(path) == stats
@@ -0,0 +1,102 @@
+import asyncio
+
+import downloader
+from downloader import choose_media
+from metadata import (
+    EXPIRY_MARGIN,
+    LIVE_TTL,
+    STREAM_TTL,
+    MetadataCache,
+    is_playable,
+    stream_expiry,
+)
+
+WATCH = "https://www.youtube.com/watch?v="
+NOW = 1_700_000_000
+
+
+def summary(duration=120, is_live=False, url="https://media.example/audio"):
+    return {
+        "duration": duration,
+        "is_live": is_live,
+        "is_playlist": False,
+        "thumbnail": None,
+        "stream": {"url": url, "acodec": "opus", "ext": "webm"},
+    }
+
+
+def test_stream_expiry_reads_the_expire_parameter():
+    url = "https://media.example/audio?id=1&expire={}"
+    assert stream_expiry("https://media.example/audio", NOW) == NOW + STREAM_TTL
+    assert stream_expiry(url.format(NOW + 3600), NOW) == NOW + 3600 - EXPIRY_MARGIN
+    # The fallback lifetime still caps a far-off advertised expiry
+    assert stream_expiry(url.format(NOW + 10**6), NOW) == NOW + STREAM_TTL
+    assert stream_expiry(url.format("soon"), NOW) == NOW + STREAM_TTL
+
+
+def test_stream_urls_expire_but_the_video_is_kept(tmp_path):
+    cache = MetadataCache(str(tmp_path / "metadata.sqlite"))
+    cache.put("aaaaaaaaaaa", summary(), now=NOW)
+
+    assert cache.get("aaaaaaaaaaa", now=NOW + STREAM_TTL - 1) == summary()
+    expired = cache.get("aaaaaaaaaaa", now=NOW + STREAM_TTL)
+    assert expired == {**summary(), "stream": None}
+    assert cache.get("bbbbbbbbbbb", now=NOW) is None
+    assert (cache.hits, cache.misses) == (1, 2)
+
+    # An advertised expiry ends the stream sooner
+    url = f"https://media.example/audio?expire={NOW + 3600}"
+    cache.put("aaaaaaaaaaa", summary(url=url), now=NOW)
+    assert cache.get("aaaaaaaaaaa", now=NOW + 3600 - EXPIRY_MARGIN)["stream"] is None
+    cache.close()
+
+
+def test_live_results_expire(tmp_path):
+    cache = MetadataCache(str(tmp_path / "metadata.sqlite"))
+    cache.put("liveaaaaaaa", summary(duration=None, is_live=True), now=NOW)
+    cache.put("shortaaaaaa", summary(duration=5), now=NOW)
+    cache.put("goodaaaaaaa", summary(), now=NOW)
+
+    assert not is_playable(cache.get("liveaaaaaaa", now=NOW + 60), 10)
+    assert sorted(cache.unplayable_ids(10, now=NOW + 60)) == [
+        "liveaaaaaaa",
+        "shortaaaaaa",
+    ]
+
+    # Once the live result is stale the video is resolved again, as it may be a VOD
+    later = NOW + LIVE_TTL
+    assert cache.get("liveaaaaaaa", now=later) is None
+    assert cache.unplayable_ids(10, now=later) == ["shortaaaaaa"]
+    cache.put("liveaaaaaaa", summary(), now=later)
+    assert is_playable(cache.get("liveaaaaaaa", now=later), 10)
+    cache.close()
+
+
+def test_known_unplayable_ids_skip_the_network(tmp_path, monkeypatch):
+    monkeypatch.setattr(downloader, "DOWNLOAD_DELAY", 0)
+    cache = MetadataCache(str(tmp_path / "metadata.sqlite"))
+    cache.put("shortaaaaaa", summary(duration=5))
+    cache.put("liveaaaaaaa", summary(duration=None, is_live=True))
+    resolved = []
+
+    async def resolve(link):
+        resolved.append(link)
+        return None
+
+    async def run():
+        video_ids = ("shortaaaaaa", "liveaaaaaaa", "newaaaaaaaa")
+        links = {WATCH + video_id: (1, 0) for video_id in video_ids}
+        await choose_media(
+            links,
+            1,
+            10,
+            20,
+            asyncio.Queue(),
+            asyncio.Queue(),
+            metadata_cache=cache,
+            resolver=resolve,
+        )
+
+    asyncio.run(run())
+    assert resolved == [WATCH + "newaaaaaaaa"]
+    cache.close()
@@ -0,0 +1,90 @@
+import asyncio
+
+import aiohttp
+import orjson
+
+from metrics import Histogram, MetricsRegistry
+from pipeline import Pipeline, Stage
+
+
+async def fake_pipeline(registry):
+    async def double(item):
+        await asyncio.sleep(0.02)
+        return item * 2
+
+    async def keep_even(item):
+        return item if item % 4 == 0 else None
+
+    sunk = []
+
+    async def sink(item):
+        sunk.append(item)
+
+    pipeline = Pipeline(
+        [Stage("double", double, 2), Stage("keep_even", keep_even, 1)], sink=sink
+    )
+    pipeline.register_metrics(registry)
+    pipeline.start()
+    for item in range(10):
+        await pipeline.put(item)
+    await pipeline.join()
+    await pipeline.close()
+    return sunk
+
+
+def test_scrape_fake_pipeline():
+    registry = MetricsRegistry()
+
+    async def run():
+        server = asyncio.create_task(registry.serve(port=0))
+        while registry.port is None:
+            await asyncio.sleep(0.01)
+        await fake_pipeline(registry)
+
+        url = f"http://127.0.0.1:{registry.port}/metrics"
+        async with aiohttp.ClientSession() as session:
+            async with session.get(url) as response:
+                assert response.status == 200
+                text = await response.text()
+        server.cancel()
+        await asyncio.gather(server, return_exceptions=True)
+        return text
+
+    lines = asyncio.run(run()).splitlines()
+
+    assert "# TYPE cacophony_stage_processed_total counter" in lines
+    assert 'cacophony_stage_processed_total{stage="double"} 10.0' in lines
+    assert 'cacophony_stage_processed_total{stage="keep_even"} 5.0' in lines
+    assert 'cacophony_stage_dropped_total{stage="keep_even"} 5.0' in lines
+    assert 'cacophony_stage_queue_depth{stage="double"} 0.0' in lines
+
+    assert "# TYPE cacophony_stage_latency_seconds histogram" in lines
+    # Every doubling sleeps 20 ms, above the 10 ms bucket
+    bucket = "cacophony_stage_latency_seconds_bucket"
+    assert f'{bucket}{{stage="double",le="0.01"}} 0' in lines
+    assert f'{bucket}{{stage="double",le="+Inf"}} 10' in lines
+    assert 'cacophony_stage_latency_seconds_count{stage="double"} 10' in lines
+
+
+def test_snapshots_are_json_lines(tmp_path):
+    registry = MetricsRegistry()
+    histogram = Histogram()
+    histogram.observe(0.3)
+    registry.gauge("voices", "Voices", lambda: 8)
+    registry.histogram("latency_seconds", "Latency", lambda: histogram)
+    registry.gauge("broken", "Fails to collect", lambda: 1 / 0)
+
+    path = tmp_path / "metrics.jsonl"
+
+    async def run():
+        task = asyncio.create_task(registry.write_snapshots(str(path), interval=0.01))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(run())
+    snapshots = [orjson.loads(line) for line in path.read_bytes().splitlines()]
+    assert snapshots
+    assert snapshots[0]["cacophony_voices"] == 8.0
+    assert snapshots[0]["cacophony_latency_seconds"] == {"count": 1, "sum": 0.3}
+    assert "cacophony_broken" not in snapshots[0]
@@ -0,0 +1,148 @@
+import asyncio
+
+import downloader
+from downloader import choose_media
+from failures import FailureIndex
+from metrics import MetricsRegistry
+from pipeline import Pipeline, Stage
+from transcode import TrimError
+
+WATCH = "https://www.youtube.com/watch?v="
+
+
+def summary(duration=120, url="https://media.example/audio"):
+    return {
+        "duration": duration,
+        "is_live": False,
+        "is_playlist": False,
+        "thumbnail": None,
+        "stream": {"url": url, "acodec": "opus", "ext": "webm"},
+    }
+
+
+SUMMARIES = {
+    **{f"good{i}aaaaa": summary() for i in range(4)},
+    "shortaaaaaa": summary(duration=5),
+    "brokenaaaaa": summary(url="https://media.example/fail"),
+}
+
+
+async def fake_resolve(link):
+    await asyncio.sleep(0)
+    return SUMMARIES.get(link[len(WATCH) :])  # None for "missingaaaa"
+
+
+class FakeBackend:
+    name = "fake"
+
+    def __init__(self):
+        self.trims = []
+
+    async def trim(
+        self, source, start, duration, output, copy=False, strict=False, pcm=None
+    ):
+        self.trims.append(source)
+        if source.endswith("fail"):
+            raise TrimError("corrupt stream")
+        with open(output, "wb") as f:
+            f.write(b"\0" * 1024)
+        return None
+
+
+def fake_analyze(path, backend_name):
+    return {"integrated": -20.0, "peak": -3.0, "envelope": []}
+
+
+def test_choose_media_with_fake_resolver(tmp_path, monkeypatch):
+    monkeypatch.setattr(downloader, "DOWNLOAD_DELAY", 0)
+    monkeypatch.setattr(downloader, "analyze_path", fake_analyze)
+
+    ids = [*SUMMARIES, "missingaaaa"]
+    links = {WATCH + video_id: (1, 0) for video_id in ids}
+    links["https://example.com/not-a-video"] = (1, 0)
+
+    failures = FailureIndex(str(tmp_path / "failures.sqlite"))
+    metrics = MetricsRegistry()
+    backend = FakeBackend()
+
+    async def run():
+        q_dl, q_pyo = asyncio.Queue(), asyncio.Queue()
+        await choose_media(
+            links,
+            2,
+            10,
+            20,
+            q_dl,
+            q_pyo,
+            resolver=fake_resolve,
+            backend=backend,
+            failures=failures,
+            metrics=metrics,
+        )
+        return [q_dl.get_nowait() for _ in range(q_dl.qsize())]
+
+    items = asyncio.run(run())
+    snapshot = metrics.snapshot()
+
+    assert snapshot["cacophony_stage_processed_total"] == {
+        "resolve": 5,
+        "fetch": 4,
+        "normalize": 4,
+    }
+    assert snapshot["cacophony_stage_dropped_total"] == {
+        "resolve": 3,
+        "fetch": 1,
+        "normalize": 0,
+    }
+    assert snapshot["cacophony_stage_failed_total"] == {
+        "resolve": 0,
+        "fetch": 0,
+        "normalize": 0,
+    }
+
+    # q_dl holds (path, seen, visited, player, thumb_data, info_dict) tuples
+    assert sorted(item[5]["link"] for item in items) == [
+        WATCH + f"good{i}aaaaa" for i in range(4)
+    ]
+    for path, seen, visited, player, thumb_data, info_dict in items:
+        assert (seen, visited) == (1, 0)
+        assert player in (0, 1)
+        assert thumb_data is None
+        assert info_dict["loudness"]["integrated"] == -20.0
+
+    assert len(backend.trims) == 5
+    # The invalid link has no video id to remember it by
+    skipped = {reason: s["skipped"] for reason, s in failures.stats(now=0).items()}
+    assert skipped == {"resolve": 1, "too_short": 1, "trim": 1}
+    failures.close()
+
+
+def test_stage_counts_failures_and_drops():
+    dropped = []
+
+    async def step(item):
+        if item == "bad":
+            raise ValueError(item)
+        return None if item == "skip" else item.upper()
+
+    async def run():
+        sunk = []
+
+        async def sink(item):
+            sunk.append(item)
+
+        async def on_drop(item):
+            dropped.append(item)
+
+        pipeline = Pipeline([Stage("upper", step, 2)], sink=sink, on_drop=on_drop)
+        pipeline.start()
+        for item in ["a", "bad", "skip", "b"]:
+            await pipeline.put(item)
+        await pipeline.join()
+        await pipeline.close()
+        return sunk, pipeline.stats()["upper"]
+
+    sunk, stats = asyncio.run(run())
+    assert sorted(sunk) == ["A", "B"]
+    assert sorted(dropped) == ["bad", "skip"]
+    assert (stats["processed"], stats["dropped"], stats["failed"]) == (2, 2, 1)
@@ -0,0 +1,25 @@
+import asyncio
+
+import pytest
+
+import play
+
+
+def run_main(monkeypatch, *argv):
+    monkeypatch.setattr("sys.argv", ["play.py", *argv])
+    with pytest.raises(SystemExit) as exit_info:
+        asyncio.run(play.main())
+    return exit_info.value.code
+
+
+def test_from_must_name_loaded_collections(monkeypatch, capsys):
+    code = run_main(monkeypatch, "-l", "links", "other", "--from", "other", "typo")
+    assert code == 2
+    error = capsys.readouterr().err
+    assert "--from names collections not loaded with -l: typo" in error
+    assert "Traceback" not in error
+
+
+def test_from_without_links(monkeypatch, capsys):
+    assert run_main(monkeypatch, "--from", "links") == 2
+    assert "not loaded with -l: links" in capsys.readouterr().err
@@ -0,0 +1,109 @@
+import asyncio
+import heapq
+import itertools
+
+import pytest
+
+from prefetch import PrefetchController
+
+
+class Simulation:
+    """
+    Discrete-event model of the player draining the ready queue and the pipeline
+    refilling it, on a simulated clock.
+
+    The player switches every `gap` seconds while clips are ready, and right when
+    one arrives after running dry. Downloads take `latency(now)` seconds, or are
+    served one at a time every `service` seconds when the source is the bottleneck.
+    """
+
+    def __init__(self, gap, latency=None, service=None, seed=0):
+        self.gap = gap
+        self.latency = latency
+        self.service = service
+        self.now = 0.0
+        self.ready = 0
+        self.held = []  # Start times of downloads waiting for a ready slot
+        self.server_free = 0.0
+        self.events = []
+        self.order = itertools.count()
+        self.waiting_since = None
+        self.starved = 0
+        self.switches = 0
+        self.controller = PrefetchController(
+            lambda: self.ready, clock=lambda: self.now
+        )
+
+    def schedule(self, time, kind, data=None):
+        heapq.heappush(self.events, (time, next(self.order), kind, data))
+
+    async def fill(self):
+        controller = self.controller
+        while self.held and self.ready < controller.target_ready():
+            self.ready += 1
+            await controller.record_finished(self.now - self.held.pop(0))
+        while controller.in_flight < controller.target_in_flight():
+            controller.record_started()
+            if self.service is not None:
+                self.server_free = max(self.server_free, self.now) + self.service
+                done = self.server_free
+            else:
+                done = self.now + self.latency
+            self.schedule(done, "done", self.now)
+
+    async def consume(self):
+        self.ready -= 1
+        self.switches += 1
+        await self.controller.record_consumed()
+        self.schedule(self.now + self.gap, "switch")
+
+    async def run(self, duration):
+        self.schedule(0.0, "switch")
+        await self.fill()
+        while self.events and self.events[0][0] < duration:
+            self.now, _, kind, data = heapq.heappop(self.events)
+            if kind == "done":
+                self.held.append(data)
+                await self.fill()
+                if self.waiting_since is not None and self.ready:
+                    self.waiting_since = None
+                    await self.consume()
+            elif self.ready:
+                await self.consume()
+            else:
+                self.waiting_since = self.now
+                self.starved += 1
+            await self.fill()
+        return self
+
+
+def simulate(duration, **kwargs):
+    return asyncio.run(Simulation(**kwargs).run(duration))
+
+
+@pytest.mark.parametrize(
+    "gap, latency",
+    [(0.02, 0.5), (0.2, 2.0), (1.0, 10.0), (4.0, 10.0)],  # 50, 5, 1, 0.25 per second
+)
+def test_tracks_consumption_rate(gap, latency):
+    sim = simulate(600, gap=gap, latency=latency)
+    controller = sim.controller
+
+    assert controller.clip_rate == pytest.approx(1 / gap, rel=0.3)
+    # After warming up the player keeps switching on time
+    assert sim.switches * gap > 0.9 * 600
+    assert sim.starved < 0.02 * sim.switches + 5
+    needed = latency / gap
+    assert controller.target_in_flight() <= max(2, 2 * needed)
+
+
+def test_probing_stops_at_the_supply_rate():
+    # Clips are wanted every 0.1s, but the source only yields one every 2s
+    sim = simulate(600, gap=0.1, service=2.0)
+    controller = sim.controller
+
+    supply = 1 / 2.0
+    assert sim.switches == pytest.approx(600 * supply, rel=0.05)
+    # Running dry on every switch must not compound the estimate to the caps
+    assert controller.clip_rate <= 2 * supply
+    assert controller.target_ready() < controller.max_ready
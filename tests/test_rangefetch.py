@@ -0,0 +1,114 @@
+import asyncio
+import os
+
+from aiohttp import web
+
+from rangefetch import RangeFetcher, byte_window, fragment_window
+
+FILESIZE = 4 << 20
+DURATION = 600
+
+
+async def start_server(directory):
+    """Serve `directory` over HTTP, with Range support, on a free local port."""
+    app = web.Application()
+    app.router.add_static("/", directory)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", 0).start()
+    return runner, f"http://127.0.0.1:{runner.addresses[0][1]}"
+
+
+def media(tmp_path):
+    directory = tmp_path / "media"
+    directory.mkdir()
+    data = os.urandom(FILESIZE)
+    (directory / "audio.webm").write_bytes(data)
+    for i in range(6):
+        (directory / f"frag{i}").write_bytes(bytes([i]) * 1000)
+    return directory, data
+
+
+def test_byte_window_keeps_the_head_and_the_clip():
+    ranges = byte_window(FILESIZE, DURATION, 300, 20)
+    (head_first, head_last), (first, last) = ranges
+    rate = FILESIZE / DURATION
+    assert head_first == 0
+    assert first < 300 * rate and last > 320 * rate
+    assert sum(b - a + 1 for a, b in ranges) < 0.2 * FILESIZE
+
+    # Clips near the start merge with the head, and long clips are not worth it
+    assert byte_window(FILESIZE, DURATION, 5, 20)[0][0] == 0
+    assert len(byte_window(FILESIZE, DURATION, 5, 20)) == 1
+    assert byte_window(FILESIZE, DURATION, 0, 500) is None
+
+
+def test_fragment_window_keeps_init_segments():
+    fragments = [{"path": "init"}]
+    fragments += [{"path": f"f{i}", "duration": 10} for i in range(6)]
+    assert fragment_window(fragments, 25, 20) == ([0, 3, 4, 5], 5.0)
+    assert fragment_window(fragments, 55, 20) is None  # Runs past the end
+
+
+def test_concurrent_fetches_count_their_own_bytes(tmp_path):
+    directory, data = media(tmp_path)
+
+    async def run():
+        runner, base = await start_server(directory)
+        fetcher = RangeFetcher()
+        summary = {
+            "duration": DURATION,
+            "stream": {"url": f"{base}/audio.webm", "filesize": FILESIZE},
+        }
+        try:
+            return await asyncio.gather(
+                *(
+                    fetcher.fetch(summary, start, 20, str(tmp_path / f"{start}.part"))
+                    for start in (100, 300, 500)
+                )
+            ), fetcher.bytes_fetched
+        finally:
+            await fetcher.close()
+            await runner.cleanup()
+
+    results, total = asyncio.run(run())
+    for start, (path, offset, fetched) in zip((100, 300, 500), results):
+        ranges = byte_window(FILESIZE, DURATION, start, 20)
+        assert offset == start
+        assert fetched == sum(last - first + 1 for first, last in ranges)
+        with open(path, "rb") as f:
+            local = f.read()
+        assert len(local) == FILESIZE  # Sparse, so the container index still fits
+        for first, last in ranges:
+            assert local[first : last + 1] == data[first : last + 1]
+    assert total == sum(fetched for _, _, fetched in results)
+
+
+def test_fetch_fragments(tmp_path):
+    directory, _ = media(tmp_path)
+
+    async def run():
+        runner, base = await start_server(directory)
+        fetcher = RangeFetcher()
+        fragments = [{"path": "frag0"}] + [
+            {"path": f"frag{i}", "duration": 10} for i in range(1, 6)
+        ]
+        summary = {
+            "duration": 50,
+            "stream": {
+                "url": "",
+                "fragment_base_url": f"{base}/",
+                "fragments": fragments,
+            },
+        }
+        try:
+            return await fetcher.fetch(summary, 12, 15, str(tmp_path / "clip.part"))
+        finally:
+            await fetcher.close()
+            await runner.cleanup()
+
+    path, offset, fetched = asyncio.run(run())
+    assert offset == 2.0
+    assert fetched == 3000
+    with open(path, "rb") as f:
+        assert f.read() == b"\0" * 1000 + b"\2" * 1000 + b"\3" * 1000
@@ -0,0 +1,43 @@
+import hashlib
+
+import pytest
+
+from conftest import SOUNDS_DIR, tone, write_wav
+
+
+@pytest.fixture
+def clips(tmp_path):
+    return [
+        write_wav(tmp_path / f"clip{freq}.wav", tone(seconds, freq))
+        for freq, seconds in [(220, 3), (440, 5), (660, 7)]
+    ]
+
+
+def render(tmp_path, clips, seed, name):
+    from play import AudioPlayer
+
+    player = AudioPlayer(
+        player_count=3,
+        min_duration=1,
+        max_duration=7,
+        source_dir=SOUNDS_DIR,
+        audio="offline",
+        seed=seed,
+    )
+    out_path = tmp_path / name
+    player.render(clips, str(out_path), 20)
+    return hashlib.md5(out_path.read_bytes()).hexdigest()
+
+
+def test_same_seed_renders_the_same_mix(tmp_path, clips):
+    first = render(tmp_path, clips, 7, "first.wav")
+    assert render(tmp_path, clips, 7, "second.wav") == first
+    assert render(tmp_path, clips, 8, "other.wav") != first
+
+
+def test_render_needs_readable_clips(tmp_path):
+    from play import AudioPlayer
+
+    player = AudioPlayer(3, 1, 7, SOUNDS_DIR, audio="offline", seed=1)
+    with pytest.raises(ValueError):
+        player.render([str(tmp_path / "missing.wav")], str(tmp_path / "out.wav"), 5)
@@ -0,0 +1,52 @@
+import logging
+from concurrent.futures import ProcessPoolExecutor
+
+import orjson
+
+from runtime_logger import (
+    RateLimitFilter,
+    init_worker,
+    setup_logger,
+    stop_listener,
+)
+
+
+def log_error(name):
+    logging.getLogger(name).error("written by the worker")
+
+
+def test_queue_mode_logs_from_process_pool_workers(capfd):
+    stop_listener()  # Start a writer on this test's captured stderr
+    setup_logger("worker_test", mode="queue")
+    logging.getLogger("worker_test").error("written by the parent")
+    with ProcessPoolExecutor(1, initializer=init_worker) as executor:
+        executor.submit(log_error, "worker_test").result()
+    stop_listener()
+
+    err = capfd.readouterr().err
+    assert "written by the parent" in err
+    assert "written by the worker" in err
+
+
+def test_json_format(capfd):
+    setup_logger("json_test", mode="sync", json_format=True)
+    logging.getLogger("json_test").warning("%d clips", 3)
+
+    entry = orjson.loads(capfd.readouterr().err.strip().splitlines()[-1])
+    assert entry["message"] == "3 clips"
+    assert entry["level"] == "WARNING"
+
+
+def test_rate_limit_counts_suppressed_messages():
+    log_filter = RateLimitFilter(rate=0, burst=2)
+
+    def record(i):
+        return logging.LogRecord("x", logging.INFO, "", 0, f"clip {i}", None, None)
+
+    records = [record(i) for i in range(5)]
+    assert [log_filter.filter(r) for r in records] == [True, True, False, False, False]
+
+    log_filter.rate = 1e9  # Refill straight away
+    last = record(5)
+    assert log_filter.filter(last)
+    assert "3 similar suppressed" in last.getMessage()
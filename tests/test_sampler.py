@@ -0,0 +1,44 @@
+import random
+
+import pytest
+
+from linktable import WATCH_PREFIX
+from sampler import LinkSampler, link_amplitude
+
+
+def links(count):
+    return {f"{WATCH_PREFIX}{i:011d}": (i + 1, 0) for i in range(count)}
+
+
+@pytest.mark.parametrize("weighted", [False, True])
+def test_draws_every_link_once(weighted):
+    collection = links(500)
+    sampler = LinkSampler(collection, weighted=weighted, rng=random.Random(1))
+    drawn = {}
+    while len(sampler) > 0:
+        link, counts = sampler.draw()
+        drawn[link] = counts
+    assert drawn == collection
+    with pytest.raises(IndexError):
+        sampler.draw()
+
+
+def test_weighted_draws_favour_louder_links():
+    collection = {f"{WATCH_PREFIX}{i:011d}": (1, 0) for i in range(100)}
+    collection.update({f"{WATCH_PREFIX}{i:011d}": (1000, 0) for i in range(100, 200)})
+    heavy = 0
+    for seed in range(200):
+        sampler = LinkSampler(collection, weighted=True, rng=random.Random(seed))
+        link, _ = sampler.draw()
+        heavy += int(link[len(WATCH_PREFIX) :]) >= 100
+    # Amplitudes are 0.55 and 1.0, so about 65% of first draws are heavy links
+    ratio = link_amplitude(1000, 0, 1000, 0) / link_amplitude(1, 0, 1000, 0)
+    expected = ratio / (1 + ratio)
+    assert abs(heavy / 200 - expected) < 0.1
+
+
+def test_link_amplitude_range():
+    assert link_amplitude(0, 0, 1, 0) == 0.5
+    assert link_amplitude(100, 0, 100, 0) == pytest.approx(1.0, abs=0.01)
+    # Visited links scale against the most visited one instead
+    assert link_amplitude(5, 2, 100, 3) == pytest.approx(1.0)
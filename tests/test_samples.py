@@ -0,0 +1,134 @@
+import asyncio
+
+import numpy as np
+import pytest
+from pyo import Server, TableRead
+
+from conftest import read_wav, tone, write_wav
+from samples import SamplePool
+from transcode import TrimError
+
+SR = 44100
+
+
+class FakeBackend:
+    """Decodes any path to a tone whose length is the number in its name."""
+
+    name = "fake"
+
+    def __init__(self):
+        self.decoded = []
+
+    def decode(self, path, sr, channels=2):
+        self.decoded.append(path)
+        if path.startswith("broken"):
+            raise TrimError(f"Error decoding {path}")
+        seconds = float(path.split("_")[-1])
+        return tone(seconds, sr=sr, channels=channels).T.astype(np.float32)
+
+
+@pytest.fixture
+def server():
+    server = Server(sr=SR, nchnls=2, audio="offline").boot()
+    yield server
+    server.shutdown()
+
+
+def test_prepare_decodes_into_tables(server):
+    pool = SamplePool(SR, backend=FakeBackend())
+    sample = asyncio.run(pool.prepare("clip_1.5"))
+
+    assert sample.duration == pytest.approx(1.5)
+    assert sample.nbytes == int(1.5 * SR) * 2 * 4
+    assert pool.size == sample.nbytes
+    expected = tone(1.5, sr=SR)[:, 0]
+    assert np.allclose(np.asarray(sample.table.getBuffer(0)), expected, atol=1e-6)
+
+    # Preparing again shares the sample instead of decoding it twice
+    assert asyncio.run(pool.prepare("clip_1.5")) is sample
+    assert sample.refs == 2
+    assert pool.backend.decoded == ["clip_1.5"]
+
+
+def test_handed_over_pcm_skips_decoding(server):
+    pool = SamplePool(SR, backend=FakeBackend())
+    pool.add("clip_1", tone(1, sr=SR).T.astype(np.float32))
+    assert asyncio.run(pool.prepare("clip_1")).duration == pytest.approx(1)
+    assert pool.backend.decoded == []
+    assert asyncio.run(pool.prepare("broken_1")) is None
+
+
+def test_eviction_spares_referenced_samples(server):
+    one_second = SR * 2 * 4
+    pool = SamplePool(SR, max_bytes=2 * one_second, backend=FakeBackend())
+
+    async def fill():
+        for name in ["a_1", "b_1", "c_1"]:
+            await pool.prepare(name)
+
+    asyncio.run(fill())
+    # Every sample is still queued, so the pool may exceed its budget
+    assert list(pool.samples) == ["a_1", "b_1", "c_1"]
+
+    pool.assign(0, "a_1")
+    pool.assign(0, "b_1")  # Releases a_1, least recently used
+    assert list(pool.samples) == ["c_1", "b_1"]
+    assert pool.size == 2 * one_second
+
+    pool.assign(1, "c_1")
+    pool.assign(1, "b_1")  # Releases c_1, but b_1 is still on voice 0
+    assert list(pool.samples) == ["c_1", "b_1"]
+    pool.assign(0, "c_1")  # Releases b_1 once, still held by voice 1
+    assert set(pool.samples) == {"b_1", "c_1"}
+
+
+def test_sample_plays_through_the_offline_server(server, tmp_path):
+    pool = SamplePool(SR, backend=FakeBackend())
+    sample = asyncio.run(pool.prepare("clip_0.5"))
+
+    out_path = str(tmp_path / "out.wav")
+    server.recordOptions(dur=0.5, filename=out_path, fileformat=0)
+    player = TableRead(sample.table, freq=sample.table.getRate()).out()
+    server.start()
+    del player
+
+    pcm, sr = read_wav(out_path)
+    expected = tone(0.5, sr=SR)
+    assert sr == SR
+    # Past the server's short fade-in, the table plays back sample for sample.
+    # The render rounds up to whole buffers, past the end of the table
+    skip = SR // 100
+    assert np.abs(pcm[skip : len(expected)] - expected[skip:]).max() < 1e-3
+
+
+def test_decodes_files_with_av(server, tmp_path):
+    pytest.importorskip("av")
+    from transcode import AVBackend
+
+    path = write_wav(tmp_path / "clip.wav", tone(1, sr=SR))
+    pool = SamplePool(SR, backend=AVBackend())
+    sample = asyncio.run(pool.prepare(path))
+    assert sample.duration == pytest.approx(1, abs=0.01)
+
+
+def test_handed_over_pcm_counts_against_the_budget(server):
+    one_second = SR * 2 * 4
+    pool = SamplePool(SR, max_bytes=2 * one_second, backend=FakeBackend())
+    for name in ["a_1", "b_1"]:
+        pool.add(name, tone(1, sr=SR).T.astype(np.float32))
+    assert pool.size == 2 * one_second
+
+    # Over budget, the oldest PCM goes and its clip is decoded from the file
+    pool.add("c_1", tone(1, sr=SR).T.astype(np.float32))
+    assert list(pool.decoded) == ["b_1", "c_1"]
+    assert pool.size == 2 * one_second
+    asyncio.run(pool.prepare("a_1"))
+    assert pool.backend.decoded == ["a_1"]
+
+    # PCM of a clip already in the pool is dropped rather than left behind
+    pool.add("a_1", tone(1, sr=SR).T.astype(np.float32))
+    asyncio.run(pool.prepare("a_1"))
+    assert "a_1" not in pool.decoded
+    assert pool.size == sum(s.nbytes for s in pool.samples.values()) + sum(
+        pcm.nbytes for pcm in pool.decoded.values()
+    )
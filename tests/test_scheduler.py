@@ -0,0 +1,84 @@
+import asyncio
+
+import pytest
+
+from scheduler import FakeClock, Scheduler, gap_policy, voice_policy
+from voices import VoiceAllocator
+
+
+class StubPlayer:
+    """The parts of AudioPlayer the scheduler and policies use."""
+
+    def __init__(self, clock, player_count=16, min_duration=10, max_duration=20):
+        self.clock = clock
+        self.player_count = player_count
+        self.min_duration = min_duration
+        self.max_duration = max_duration
+        self.voices = VoiceAllocator(player_count)
+        self.q_ready = asyncio.Queue()
+        self.last_duration = 0
+        self.started = []  # (clock time, clip) of every switch
+
+    async def pyo_look(self, item):
+        now = self.clock.time()
+        self.last_duration = item
+        self.voices.start(self.voices.allocate(now), now + item)
+        self.started.append((now, item))
+        return True
+
+
+def run_steps(player, policy, steps, feed=None):
+    async def run():
+        scheduler = Scheduler(player, policy=policy)
+        feeder = asyncio.create_task(feed()) if feed is not None else None
+        for _ in range(steps):
+            await scheduler.step()
+        if feeder is not None:
+            await feeder
+        return scheduler.next_switch
+
+    return asyncio.run(run())
+
+
+def test_gap_after_each_sound():
+    clock = FakeClock()
+    player = StubPlayer(clock)
+    for duration in (15, 10, 20):
+        player.q_ready.put_nowait(duration)
+
+    next_switch = run_steps(player, gap_policy, 3)
+
+    # (duration - 10) / 20 * 4 + 2 seconds after each start
+    assert player.started == [(0.0, 15), (3.0, 10), (5.0, 20)]
+    assert next_switch == pytest.approx(9.0)
+
+
+def test_waits_for_a_voice_when_all_are_busy():
+    clock = FakeClock()
+    player = StubPlayer(clock, player_count=2)
+    for duration in (30, 30, 10):
+        player.q_ready.put_nowait(duration)
+
+    run_steps(player, voice_policy, 3)
+
+    # The second sound would follow 6s later, but both voices play until 30s
+    assert player.started == [(0.0, 30), (6.0, 30), (30.0, 10)]
+
+
+def test_no_added_delay_when_a_clip_arrives_on_an_empty_queue():
+    clock = FakeClock()
+    player = StubPlayer(clock)
+    player.q_ready.put_nowait(10)
+
+    async def feed():
+        # Let the scheduler start waiting on the empty queue, long past its switch
+        for _ in range(5):
+            await asyncio.sleep(0)
+        assert len(player.started) == 1 and clock.now == 2.0
+        clock.now = 42.5
+        await player.q_ready.put(20)
+
+    next_switch = run_steps(player, gap_policy, 2, feed=feed)
+
+    assert player.started == [(0.0, 10), (42.5, 20)]
+    assert next_switch == pytest.approx(46.5)
@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+from conftest import SOUNDS_DIR, read_wav
+from speakers import SPEAKER_LAYOUTS, SpeakerLayout
+
+
+@pytest.mark.parametrize("name", sorted(SPEAKER_LAYOUTS))
+def test_pan_gains_keep_power(name):
+    layout = SpeakerLayout.parse(name)
+    gains = layout.pan_gains(layout.voice_positions(37))
+    assert gains.shape == (37, layout.channels)
+    assert np.allclose((gains**2).sum(axis=1), 1)
+
+
+def test_position_on_a_speaker_only_feeds_that_speaker():
+    layout = SpeakerLayout.parse("octagon")
+    gains = layout.pan_gains(layout.positions, spread=0)
+    assert np.allclose(gains, np.eye(layout.channels))
+
+
+def test_ring_wraps_between_last_and_first_speaker():
+    layout = SpeakerLayout.parse("0,90,180,270")
+    gains = layout.pan_gains([7 / 8], spread=0)[0]
+    assert np.allclose(gains, [np.sqrt(0.5), 0, 0, np.sqrt(0.5)])
+
+
+def test_parse_rejects_unknown_layouts():
+    with pytest.raises(ValueError):
+        SpeakerLayout.parse("dolby")
+    with pytest.raises(ValueError):
+        SpeakerLayout.parse("90")
+
+
+@pytest.mark.parametrize("topology", ["voice", "bus"])
+def test_render_to_eight_speakers(tmp_path, tone_wav, topology):
+    from play import AudioPlayer
+
+    speakers = SpeakerLayout.parse("octagon")
+    player = AudioPlayer(
+        player_count=2,
+        min_duration=1,
+        max_duration=6,
+        source_dir=SOUNDS_DIR,
+        audio="offline",
+        seed=1,
+        topology=topology,
+        buses=2,
+        speakers=speakers,
+    )
+    out_path = str(tmp_path / "out.wav")
+    player.render([tone_wav], out_path, 6)
+
+    pcm, _ = read_wav(out_path)
+    assert pcm.shape[1] == 8
+
+    # The two voices sit at 90 and 270 degrees, speakers 2 and 6 of the octagon
+    rms = np.sqrt((pcm**2).mean(axis=0))
+    assert sorted(np.argsort(rms)[-2:]) == [2, 6]
+    # The other speakers only get the even share of the spread
+    others = np.delete(rms, [2, 6])
+    assert np.allclose(others, others[0], rtol=0.01)
+    assert rms[[2, 6]].min() > 1.2 * others[0]
@@ -0,0 +1,98 @@
+import asyncio
+
+from aiohttp import web
+
+import visual
+from cache import ThumbnailCache
+
+
+async def start_server(connections, requests):
+    async def handle(request):
+        connections.add(request.transport)
+        requests.append(request.match_info["video_id"])
+        if request.match_info["video_id"] == "missing":
+            raise web.HTTPNotFound()
+        return web.Response(body=request.path.encode(), content_type="image/jpeg")
+
+    app = web.Application()
+    app.router.add_get("/vi/{video_id}/hqdefault.jpg", handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", 0).start()
+    return runner, f"http://127.0.0.1:{runner.addresses[0][1]}"
+
+
+def download_batches(batches, connections, requests):
+    """
+    Download each `(video_ids, cache)` batch in turn from one local server.
+
+    Returns the server's URL, which is closed by then, and the batches' results.
+    """
+
+    async def run():
+        runner, base = await start_server(connections, requests)
+        try:
+            results = []
+            for video_ids, cache in batches:
+                urls = [f"{base}/vi/{video_id}/hqdefault.jpg" for video_id in video_ids]
+                results.append(
+                    [await visual.download_thumbnail(url, cache=cache) for url in urls]
+                )
+            return base, results
+        finally:
+            await visual.close_session()
+            await runner.cleanup()
+
+    return asyncio.run(run())
+
+
+def test_downloads_share_one_connection(tmp_path):
+    connections, requests = set(), []
+    cache = ThumbnailCache(directory=str(tmp_path))
+    _, [thumbs] = download_batches(
+        [(["a", "b", "c", "missing"], cache)], connections, requests
+    )
+
+    expected = [f"/vi/{video_id}/hqdefault.jpg".encode() for video_id in "abc"]
+    assert thumbs[:3] == expected
+    assert thumbs[3] is None
+    assert requests == ["a", "b", "c", "missing"]
+    assert len(connections) == 1
+
+
+def test_cached_thumbnails_skip_the_network(tmp_path):
+    connections, requests = set(), []
+    cache = ThumbnailCache(directory=str(tmp_path))
+    base, (downloaded, from_memory) = download_batches(
+        [(["a", "b"], cache), (["a", "b"], cache)], connections, requests
+    )
+    assert requests == ["a", "b"]
+    assert from_memory == downloaded
+    assert (cache.hits, cache.misses) == (2, 2)
+
+    # A new cache over the same directory finds them on disk, with the server gone
+    cache = ThumbnailCache(directory=str(tmp_path))
+    url = f"{base}/vi/a/hqdefault.jpg"
+    assert asyncio.run(visual.download_thumbnail(url, cache=cache)) == downloaded[0]
+    assert cache.hits == 1
+
+
+def test_contended_downloads_across_event_loops(tmp_path):
+    video_ids = "abcdefgh"[: 2 * visual.MAX_THUMB_DOWNLOADS]
+
+    async def run(cache):
+        runner, base = await start_server(set(), [])
+        urls = [f"{base}/vi/{video_id}/hqdefault.jpg" for video_id in video_ids]
+        try:
+            return await asyncio.gather(
+                *(visual.download_thumbnail(url, cache=cache) for url in urls)
+            )
+        finally:
+            await visual.close_session()
+            await runner.cleanup()
+
+    # More downloads than the limit wait on the semaphore, in each run's own loop
+    for run_dir in ["first", "second"]:
+        cache = ThumbnailCache(directory=str(tmp_path / run_dir))
+        thumbs = asyncio.run(run(cache))
+        assert thumbs == [f"/vi/{v}/hqdefault.jpg".encode() for v in video_ids]
@@ -0,0 +1,62 @@
+import asyncio
+
+import pytest
+
+from conftest import SOUNDS_DIR
+from transcode import AVBackend, TrimError
+
+SR = 44100
+
+
+@pytest.fixture(scope="module")
+def backend():
+    return AVBackend()
+
+
+@pytest.fixture
+def tone_opus(backend, tone_wav, tmp_path):
+    """The six second tone re-encoded to Opus, for stream-copy trims."""
+    path = str(tmp_path / "tone.opus")
+    asyncio.run(backend.trim(tone_wav, 0, 6, path))
+    return path
+
+
+@pytest.mark.parametrize("copy", [False, True])
+def test_trim_returns_the_clip_pcm(backend, tone_opus, tmp_path, copy):
+    output = str(tmp_path / "clip.opus")
+    pcm = asyncio.run(backend.trim(tone_opus, 1, 3, output, copy=copy, pcm=(SR, 2)))
+    assert pcm.shape[0] == 2
+    # Stream copies cut at packet boundaries, 20 ms apart for Opus
+    assert pcm.shape[1] == pytest.approx(3 * SR, abs=0.05 * SR)
+    assert abs(pcm).max() == pytest.approx(0.5, abs=0.05)
+
+    decoded = backend.decode(output, SR)
+    assert decoded.shape[1] == pytest.approx(pcm.shape[1], abs=0.05 * SR)
+
+
+def test_trim_without_pcm_returns_none(backend, tone_wav, tmp_path):
+    output = str(tmp_path / "clip.opus")
+    assert asyncio.run(backend.trim(tone_wav, 0, 2, output)) is None
+
+
+@pytest.mark.parametrize("copy", [False, True])
+def test_trim_past_the_end_is_empty(backend, tone_opus, tmp_path, copy):
+    with pytest.raises(TrimError, match="Empty output"):
+        asyncio.run(backend.trim(tone_opus, 10, 3, str(tmp_path / "c.opus"), copy=copy))
+
+
+def test_strict_trim_needs_most_of_the_clip(backend, tone_opus, tmp_path):
+    output = str(tmp_path / "clip.opus")
+    with pytest.raises(TrimError, match="Only"):
+        asyncio.run(backend.trim(tone_opus, 4, 5, output, copy=True, strict=True))
+    # Without strict the shorter clip is kept
+    asyncio.run(backend.trim(tone_opus, 4, 5, output, copy=True))
+
+
+def test_missing_source_and_empty_files(backend, tmp_path):
+    output = str(tmp_path / "clip.opus")
+    with pytest.raises(TrimError, match="Error trimming"):
+        asyncio.run(backend.trim(str(tmp_path / "none.opus"), 0, 1, output))
+    for name in ("empty.wav", "empty.ogg", "empty.flac"):
+        with pytest.raises(TrimError, match="empty clip"):
+            backend.decode(SOUNDS_DIR + name, SR)
@@ -0,0 +1,143 @@
+import asyncio
+
+import cv2
+import numpy as np
+import pytest
+
+import visual
+from metrics import LoopLagMonitor
+from visual import Transition, blur_image
+
+
+def images(height=90, width=160):
+    rng = np.random.default_rng(0)
+    return (
+        rng.integers(0, 256, (height, width, 3), np.uint8),
+        rng.integers(0, 256, (height, width, 3), np.uint8),
+    )
+
+
+def test_frames_reuse_one_buffer_and_keep_the_caption():
+    prev_image, image = images()
+    transition = Transition(prev_image, image, "youtube.com/watch?v=x")
+
+    first = transition.frame(0.0)
+    assert np.array_equal(first[:40], prev_image[:40])
+    last = transition.frame(1.0)
+    assert last is first
+    assert np.array_equal(last[:40], image[:40])
+
+    # The caption is drawn over each frame, not accumulated on the source image
+    caption_rows = transition.caption_region[0]
+    assert last[caption_rows].max() == 255
+    assert not np.shares_memory(last, image)
+    assert np.array_equal(Transition(None, image, "").frame(1.0)[:40], image[:40])
+
+
+def test_precompute_stays_within_its_budget():
+    prev_image, image = images()
+    transition = Transition(prev_image, image, "caption")
+    frame_bytes = image.nbytes
+
+    transition.precompute(151, max_bytes=10 * frame_bytes)
+    assert len(transition.sequence) == 10
+    assert np.array_equal(transition.precomputed_frame(1.0)[:40], image[:40])
+
+    transition.precompute(151, max_bytes=1000 * frame_bytes)
+    assert len(transition.sequence) == 151
+    expected = Transition(prev_image, image, "caption").frame(0.5)
+    assert np.array_equal(transition.precomputed_frame(0.5), expected)
+
+
+def test_scaled_transition_outputs_full_size():
+    prev_image, image = images()
+    frame = Transition(prev_image, image, "caption", scale=0.5).frame(0.5)
+    assert frame.shape == image.shape
+
+
+@pytest.fixture
+def thumbnail():
+    """JPEG bytes of a 1280x720 thumbnail with smooth colours and large text."""
+    rng = np.random.default_rng(1)
+    image = cv2.resize(
+        rng.integers(0, 256, (45, 80, 3), np.uint8),
+        (1280, 720),
+        interpolation=cv2.INTER_CUBIC,
+    )
+    cv2.putText(image, "THUMB", (100, 400), cv2.FONT_HERSHEY_SIMPLEX, 8, (255,) * 3, 20)
+    return cv2.imencode(".jpg", image)[1].tobytes()
+
+
+@pytest.fixture(autouse=True)
+def empty_blur_cache(monkeypatch):
+    monkeypatch.setattr(visual, "_blur_cache", type(visual._blur_cache)())
+    monkeypatch.setattr(visual, "_blur_cache_size", 0)
+
+
+def test_fast_blur_matches_full_blur(thumbnail):
+    full = blur_image(thumbnail, fast=False)
+    fast = blur_image(thumbnail, fast=True)
+    assert fast.shape == full.shape == (900, 1440, 3)
+    assert cv2.PSNR(full, fast) > 40
+
+
+def test_blurs_are_cached_per_mode(thumbnail):
+    fast = blur_image(thumbnail, fast=True)
+    full = blur_image(thumbnail, fast=False)
+    assert blur_image(thumbnail, fast=True) is fast
+    assert blur_image(thumbnail, fast=False) is full
+    assert len(visual._blur_cache) == 2
+
+
+def test_blur_cache_is_read_only_and_bounded(thumbnail, monkeypatch):
+    blurred = blur_image(thumbnail)
+    assert blur_image(thumbnail) is blurred
+    assert not blurred.flags.writeable
+
+    monkeypatch.setattr(visual, "BLUR_CACHE_BYTES", blurred.nbytes)
+    blur_image(thumbnail + b"\0")  # Another hash, same image
+    assert len(visual._blur_cache) == 1
+    assert visual._blur_cache_size == blurred.nbytes
+
+
+def thumbnails(count):
+    rng = np.random.default_rng(2)
+    return [
+        cv2.imencode(".jpg", rng.integers(0, 256, (90, 160, 3), np.uint8))[1].tobytes()
+        for _ in range(count)
+    ]
+
+
+def test_renderer_keeps_the_loop_responsive(monkeypatch):
+    monkeypatch.setattr(visual, "TRANSITION_DURATION", 0.5)
+    renderer = visual.Renderer(backend="headless")
+    monkeypatch.setattr(visual, "_renderer", renderer)
+    first, second, third = thumbnails(3)
+    info_dict = {"link": "https://www.youtube.com/watch?v=aaaaaaaaaaa"}
+
+    async def run():
+        monitor = LoopLagMonitor(interval=0.01)
+        monitor.start()
+        # The second and third thumbnails arrive mid-transition
+        visual.display_thumbnail(first, info_dict)
+        await asyncio.sleep(0.2)
+        visual.display_thumbnail(second, info_dict)
+        await asyncio.sleep(0.2)
+        interrupted = renderer.prev_image is None
+        visual.display_thumbnail(third, info_dict)
+        await asyncio.sleep(0.8)
+        monitor.stop()
+        return monitor, interrupted
+
+    monitor, interrupted = asyncio.run(run())
+
+    assert interrupted
+    assert monitor.samples > 50
+    assert monitor.max < 0.1
+    # About 30 frames a second over the 1.2 s of fades
+    assert renderer.frames > 20
+    assert renderer.prev_image is blur_image(third)
+    assert renderer.last_frame.shape == blur_image(third).shape
+
+    visual.stop_renderer()
+    assert not renderer.thread.is_alive()
@@ -0,0 +1,76 @@
+import random
+
+import pytest
+
+from voices import STEAL_POLICIES, VoiceAllocator
+
+
+class BruteForceVoices:
+    """Reference model scanning every voice on each call."""
+
+    def __init__(self, count, pans):
+        self.ends = [None] * count
+        self.amps = [None] * count
+        self.pans = pans
+        self.last = None
+
+    def busy_voices(self, now):
+        return [v for v, end in enumerate(self.ends) if end is not None and end > now]
+
+    def steal(self, policy, now):
+        busy = self.busy_voices(now)
+        if policy == "oldest":
+            return {v for v in busy if self.ends[v] == min(self.ends[b] for b in busy)}
+        if policy == "quietest":
+            return {v for v in busy if self.amps[v] == min(self.amps[b] for b in busy)}
+        pan = self.pans[self.last]
+        farthest = max(abs(self.pans[v] - pan) for v in busy)
+        return {v for v in busy if abs(self.pans[v] - pan) == farthest}
+
+    def start(self, voice, end, amp):
+        self.ends[voice] = end
+        self.amps[voice] = amp
+        self.last = voice
+
+
+@pytest.mark.parametrize("policy", sorted(STEAL_POLICIES))
+@pytest.mark.parametrize("seed", range(20))
+def test_matches_brute_force_model(policy, seed):
+    rng = random.Random(seed)
+    count = rng.randint(1, 12)
+    pans = [rng.random() for _ in range(count)]
+    voices = VoiceAllocator(count, STEAL_POLICIES[policy], random.Random(seed), pans)
+    model = BruteForceVoices(count, pans)
+
+    now = 0.0
+    for _ in range(300):
+        now += rng.expovariate(2.0)
+        busy = model.busy_voices(now)
+        assert voices.busy(now) == len(busy)
+        if busy:
+            assert voices.earliest()[0] == min(model.ends[v] for v in busy)
+
+        voice = voices.allocate(now)
+        if len(busy) < count:
+            assert voice not in busy
+        elif policy != "farthest" or model.last is not None:
+            assert voice in model.steal(policy, now)
+
+        # Now and then replace a sound that is still playing
+        if busy and rng.random() < 0.1:
+            voice = rng.choice(busy)
+        end, amp = now + rng.uniform(0.1, 5.0), rng.random()
+        voices.start(voice, end, amp)
+        model.start(voice, end, amp)
+
+        assert len(voices.end_heap) <= 4 * count + 1
+        assert sorted(voices.free + list(voices.ends)) == list(range(count))
+
+
+def test_release_frees_a_voice_once():
+    voices = VoiceAllocator(2, rng=random.Random(0))
+    voices.start(0, 10)
+    voices.release(0)
+    voices.release(0)
+    assert sorted(voices.free) == [0, 1]
+    assert voices.earliest() is None
@@ -0,0 +1,259 @@
+import asyncio
+import functools
+import os
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+try:
+    import av
+except ImportError:
+    av = None
+
+# Encoders for the output formats, by file extension
+ENCODERS = {"opus": "libopus", "ogg": "libvorbis", "m4a": "aac", "mp3": "libmp3lame"}
+ENCODER_RATES = {"libopus": 48000}
+LAYOUTS = {1: "mono", 2: "stereo"}
+# A strict trim of a partial file must cover this fraction of the clip
+MIN_COVERAGE = 0.9
+
+
+class TrimError(Exception):
+    """A clip could not be cut or decoded, or came out empty."""
+
+
+def check_output(path):
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        size = 0
+    if size == 0:
+        raise TrimError(f"Empty output: {path}")
+
+
+def decode_pcm(path, sr, channels=2):
+    """
+    Decode an audio file to float32 PCM with ffmpeg.
+
+    Returns:
+        An array of shape (channels, frames).
+    """
+    command = [
+        "ffmpeg",
+        "-hide_banner",
+        "-loglevel",
+        "error",
+        "-i",
+        path,
+        "-f",
+        "f32le",
+        "-ac",
+        str(channels),
+        "-ar",
+        str(sr),
+        "-",
+    ]
+    result = subprocess.run(command, capture_output=True, check=True)
+    pcm = np.frombuffer(result.stdout, dtype=np.float32)
+    return pcm.reshape(-1, channels).T
+
+
+class FFmpegBackend:
+    """Cut and decode clips with one ffmpeg process per clip."""
+
+    name = "ffmpeg"
+
+    async def trim(
+        self, source, start, duration, output, copy=False, strict=False, pcm=None
+    ):
+        """
+        Cut `duration` seconds from `start` of `source` into `output`.
+
+        With `copy` the codec is stream-copied instead of re-encoded, and with
+        `strict` any error in the input fails the trim, for partially fetched
+        files. Raises TrimError on failure or empty output. Never returns PCM.
+        """
+        command = ["ffmpeg", "-hide_banner", "-loglevel", "error", "-y"]
+        if strict:
+            command.append("-xerror")
+        command += [
+            "-ss",
+            str(start),
+            "-t",
+            str(duration),
+            "-i",
+            source,
+            "-map",
+            "0:a",
+        ]
+        if copy:
+            command += ["-c:a", "copy"]
+        command.append(output)
+
+        process = await asyncio.create_subprocess_exec(
+            *command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+        )
+        _, stderr = await process.communicate()
+        if process.returncode != 0:
+            message = stderr.decode(errors="replace").strip().splitlines()
+            raise TrimError(
+                f"ffmpeg exited with {process.returncode}"
+                + (f": {message[-1]}" if message else "")
+            )
+        check_output(output)
+        return None
+
+    def decode(self, path, sr, channels=2):
+        try:
+            pcm = decode_pcm(path, sr, channels)
+        except (OSError, subprocess.CalledProcessError) as e:
+            raise TrimError(f"Error decoding {path}: {e}") from e
+        if pcm.shape[1] == 0:
+            raise TrimError(f"Decoded an empty clip: {path}")
+        return pcm
+
+
+class AVBackend:
+    """
+    Cut and decode clips in-process with PyAV, on a small thread pool.
+
+    Saves spawning a process per clip, and when asked for `pcm=(sr, channels)` a
+    trim also returns the clip's decoded PCM, so it can be handed to the sample
+    pool without decoding the written file again.
+    """
+
+    name = "av"
+
+    def __init__(self, workers=2):
+        if av is None:
+            raise RuntimeError("The av backend needs PyAV (pip install av)")
+        self.executor = ThreadPoolExecutor(workers, thread_name_prefix="av")
+
+    async def trim(
+        self, source, start, duration, output, copy=False, strict=False, pcm=None
+    ):
+        """Same as `FFmpegBackend.trim`, but returns the PCM if `pcm` is given."""
+        loop = asyncio.get_running_loop()
+        trim = functools.partial(
+            self._trim, source, start, duration, output, copy, strict, pcm
+        )
+        return await loop.run_in_executor(self.executor, trim)
+
+    def decode(self, path, sr, channels=2):
+        try:
+            with av.open(path) as container:
+                stream = container.streams.audio[0]
+                collector = PCMCollector(sr, channels)
+                for frame in container.decode(stream):
+                    collector.add(frame)
+        except (av.error.FFmpegError, OSError, IndexError) as e:
+            raise TrimError(f"Error decoding {path}: {e}") from e
+        pcm = collector.result()
+        if pcm.shape[1] == 0:
+            raise TrimError(f"Decoded an empty clip: {path}")
+        return pcm
+
+    def _trim(self, source, start, duration, output, copy, strict, pcm):
+        collector = PCMCollector(*pcm) if pcm is not None else None
+        try:
+            with av.open(source) as container, av.open(output, "w") as out:
+                stream = container.streams.audio[0]
+                # Seek relative to the start of the file, like ffmpeg's -ss
+                base = (container.start_time or 0) / av.time_base
+                if start > 0:
+                    container.seek(int((base + start) * av.time_base))
+                window = (base + start, base + start + duration)
+                if copy:
+                    covered = self._copy(container, stream, out, window, collector)
+                else:
+                    covered = self._encode(container, stream, out, window, collector)
+        except (av.error.FFmpegError, OSError, IndexError) as e:
+            raise TrimError(f"Error trimming {source}: {e}") from e
+
+        if strict and covered < MIN_COVERAGE * duration:
+            raise TrimError(f"Only {covered:.1f}s of {duration}s in {source}")
+        check_output(output)
+        return collector.result() if collector is not None else None
+
+    def _copy(self, container, stream, out, window, collector):
+        start, end = window
+        out_stream = out.add_stream_from_template(stream)
+        first = None
+        last = start
+        for packet in container.demux(stream):
+            if packet.pts is None:
+                continue
+            time = float(packet.pts * packet.time_base)
+            if time < start:
+                continue
+            if time >= end:
+                break
+            if collector is not None:
+                for frame in stream.codec_context.decode(packet):
+                    collector.add(frame)
+            if first is None:
+                first = packet.pts
+            last = time + float((packet.duration or 0) * packet.time_base)
+            packet.pts -= first
+            packet.dts = packet.pts
+            packet.stream = out_stream
+            out.mux(packet)
+        return last - start
+
+    def _encode(self, container, stream, out, window, collector):
+        start, end = window
+        encoder = ENCODERS[os.path.splitext(out.name)[1].lstrip(".")]
+        out_stream = out.add_stream(
+            encoder, rate=ENCODER_RATES.get(encoder, stream.rate), layout="stereo"
+        )
+        resampler = av.AudioResampler(
+            format=out_stream.format, layout="stereo", rate=out_stream.rate
+        )
+        last = start
+        for frame in container.decode(stream):
+            if frame.time is None:
+                continue
+            if frame.time < start:
+                continue
+            if frame.time >= end:
+                break
+            if collector is not None:
+                collector.add(frame)
+            last = frame.time + frame.samples / frame.sample_rate
+            for resampled in resampler.resample(frame):
+                resampled.pts = None
+                out.mux(out_stream.encode(resampled))
+        for resampled in resampler.resample(None):
+            out.mux(out_stream.encode(resampled))
+        out.mux(out_stream.encode(None))
+        return last - start
+
+
+class PCMCollector:
+    """Resample decoded frames to float32 PCM of shape (channels, frames)."""
+
+    def __init__(self, sr, channels=2):
+        self.resampler = av.AudioResampler(
+            format="fltp", layout=LAYOUTS[channels], rate=sr
+        )
+        self.channels = channels
+        self.chunks = []
+
+    def add(self, frame):
+        for resampled in self.resampler.resample(frame):
+            self.chunks.append(resampled.to_ndarray())
+
+    def result(self):
+        for resampled in self.resampler.resample(None):
+            self.chunks.append(resampled.to_ndarray())
+        if not self.chunks:
+            return np.zeros((self.channels, 0), dtype=np.float32)
+        return np.concatenate(self.chunks, axis=1)
+
+
+BACKENDS = {"ffmpeg": FFmpegBackend, "av": AVBackend}
+
+
+def get_backend(name="ffmpeg"):
+    return BACKENDS[name]()
@@ -0,0 +1,144 @@
+import heapq
+import random
+
+
+def steal_oldest(voices, now):
+    """Steal the voice whose sound ends first."""
+    return voices.earliest()[1]
+
+
+def steal_quietest(voices, now):
+    """Steal the voice playing at the lowest amplitude."""
+    while True:
+        amp, generation, voice = voices.quiet_heap[0]
+        if voices.generations[voice] == generation:
+            return voice
+        heapq.heappop(voices.quiet_heap)
+
+
+def steal_farthest(voices, now):
+    """
+    Steal the voice panned farthest from the voice started last, so successive
+    sounds move across the stereo field.
+
+    Stealing only happens with every voice busy, so the farthest voice is one of
+    the two at the ends of the pan range.
+    """
+    if voices.last is None:
+        return steal_oldest(voices, now)
+    pan = voices.pans[voices.last]
+    left, right = voices.pan_order[0], voices.pan_order[-1]
+    if abs(voices.pans[left] - pan) >= abs(voices.pans[right] - pan):
+        return left
+    return right
+
+
+STEAL_POLICIES = {
+    "oldest": steal_oldest,
+    "quietest": steal_quietest,
+    "farthest": steal_farthest,
+}
+
+
+class VoiceAllocator:
+    """
+    Track which voices are playing, with a heap of end times and a free list.
+
+    Voices are reclaimed once the sound they play has ended, which is checked
+    lazily against the top of the heap whenever voices are allocated or queried.
+    A free voice is picked at random. With every voice busy, one is stolen by
+    `policy`, a callable taking the allocator and the current time.
+
+    Heap entries are invalidated by bumping the voice's generation rather than
+    removed, so allocating, starting and reclaiming a voice are all O(log P).
+    """
+
+    def __init__(self, count, policy=steal_oldest, rng=random, pans=None):
+        self.count = count
+        self.policy = policy
+        self.rng = rng
+
+        self.free = list(range(count))
+        self.free_index = {voice: voice for voice in self.free}
+        self.ends = {}  # Busy voice -> end time of its sound
+        self.generations = [0] * count
+        self.end_heap = []  # (end, generation, voice)
+        self.quiet_heap = []  # (amplitude, generation, voice)
+        self.last = None
+
+        self.set_pans(pans or [0.5] * count)
+
+    def set_pans(self, pans):
+        self.pans = list(pans)
+        self.pan_order = sorted(range(self.count), key=self.pans.__getitem__)
+
+    def __len__(self):
+        return len(self.ends)
+
+    def _take(self, voice):
+        """Remove a voice from the free list in O(1)."""
+        index = self.free_index.pop(voice)
+        last = self.free.pop()
+        if last != voice:
+            self.free[index] = last
+            self.free_index[last] = index
+
+    def release(self, voice):
+        if voice not in self.ends:
+            return
+        del self.ends[voice]
+        self.generations[voice] += 1
+        self.free_index[voice] = len(self.free)
+        self.free.append(voice)
+
+    def reclaim(self, now):
+        """Free the voices whose sounds have ended by `now`."""
+        heap = self.end_heap
+        while heap and heap[0][0] <= now:
+            _, generation, voice = heapq.heappop(heap)
+            if self.generations[voice] == generation:
+                self.release(voice)
+
+    def earliest(self):
+        """`(end, voice)` of the busy voice that ends first, or None if all are free."""
+        heap = self.end_heap
+        while heap:
+            end, generation, voice = heap[0]
+            if self.generations[voice] == generation:
+                return end, voice
+            heapq.heappop(heap)
+        return None
+
+    def busy(self, now):
+        """Number of voices still playing at `now`."""
+        self.reclaim(now)
+        return len(self.ends)
+
+    def allocate(self, now):
+        """Pick the voice to play the next sound on."""
+        self.reclaim(now)
+        if self.free:
+            return self.free[self.rng.randrange(len(self.free))]
+        return self.policy(self, now)
+
+    def start(self, voice, end, amp=1.0):
+        """Mark a voice as playing a sound until `end`, replacing any earlier one."""
+        if voice in self.ends:
+            self.generations[voice] += 1
+        else:
+            self._take(voice)
+        generation = self.generations[voice]
+        self.ends[voice] = end
+        heapq.heappush(self.end_heap, (end, generation, voice))
+        heapq.heappush(self.quiet_heap, (amp, generation, voice))
+        self.last = voice
+
+        # Stale entries are skipped lazily; rebuild before they dominate the heaps
+        if max(len(self.end_heap), len(self.quiet_heap)) > 4 * self.count:
+            self.end_heap = self._live(self.end_heap)
+            self.quiet_heap = self._live(self.quiet_heap)
+
+    def _live(self, heap):
+        live = [entry for entry in heap if self.generations[entry[2]] == entry[1]]
+        heapq.heapify(live)
+        return live